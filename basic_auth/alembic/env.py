@@ -38,7 +38,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True)
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        render_as_batch=url.startswith('sqlite'))
 
     with context.begin_transaction():
         context.run_migrations()
@@ -57,9 +58,12 @@ def run_migrations_online():
         poolclass=pool.NullPool)
 
     with connectable.connect() as connection:
+        # SQLite only supports some changes to tables through batch
+        # operations, which copy the table.
         context.configure(
             connection=connection,
-            target_metadata=target_metadata
+            target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == 'sqlite'
         )
 
         with context.begin_transaction():
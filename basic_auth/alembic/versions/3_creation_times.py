@@ -30,7 +30,10 @@ def add_creation_time(table_name):
     op.execute(
         "UPDATE %s SET creation_time='%s' WHERE creation_time IS NULL"
         % (table_name, EPOCH))
-    op.alter_column(table_name, 'creation_time', nullable=False)
+    # Changing columns in SQLite requires copying the table. With other
+    # databases, the column is altered in place.
+    with op.batch_alter_table(table_name) as batch_op:
+        batch_op.alter_column('creation_time', nullable=False)
 
 
 def upgrade():
@@ -39,5 +42,6 @@ def upgrade():
 
 
 def downgrade():
-    op.drop_column('api_credentials', 'creation_time')
-    op.drop_column('credentials', 'creation_time')
+    for table_name in ('api_credentials', 'credentials'):
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column('creation_time')
@@ -0,0 +1,41 @@
+"""Add index on credentials creation_time
+
+Revision ID: 6
+Revises: 5
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6'
+down_revision = '5'
+branch_labels = None
+depends_on = None
+
+
+INDEX_NAME = 'ix_credentials_creation_time'
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index(INDEX_NAME, 'credentials', ['creation_time'])
+        return
+    # The index is built concurrently so that writes to the table aren't
+    # blocked. This can't happen in a transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            INDEX_NAME, 'credentials', ['creation_time'],
+            postgresql_concurrently=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index(INDEX_NAME, table_name='credentials')
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            INDEX_NAME, table_name='credentials',
+            postgresql_concurrently=True)
@@ -0,0 +1,35 @@
+"""Add credentials usage tracking
+
+Revision ID: 7
+Revises: 6
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+)
+
+
+# revision identifiers, used by Alembic.
+revision = '7'
+down_revision = '6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'credentials', Column('last_used', DateTime, nullable=True))
+    op.add_column(
+        'credentials',
+        Column('use_count', Integer, nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('credentials') as batch_op:
+        batch_op.drop_column('use_count')
+        batch_op.drop_column('last_used')
@@ -51,6 +51,19 @@ class ResourceEndpoint:
                 key, value, fmt)
             raise APIError('BadRequest', message=msg)
 
+    def _limit_from_query(self, request):
+        value = request.query.get('limit')
+        if not value:
+            return None
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            msg = 'Param limit of %s is not a positive integer' % value
+            raise APIError('BadRequest', message=msg)
+        return limit
+
     async def handle_collection(self, request):
         """Handle a request for a collection."""
         allowed_methods = self.collection_methods.intersection(
@@ -63,7 +76,17 @@ class ResourceEndpoint:
         if request.method == 'GET':
             start_date = self._date_from_query(request, 'start_date')
             end_date = self._date_from_query(request, 'end_date')
-            func = partial(func, start_date=start_date, end_date=end_date)
+            kwargs = {'start_date': start_date, 'end_date': end_date}
+            idle_since = self._date_from_query(request, 'idle_since')
+            if idle_since is not None:
+                kwargs['idle_since'] = idle_since
+            after = request.query.get('after')
+            if after:
+                kwargs['after'] = after
+            limit = self._limit_from_query(request)
+            if limit is not None:
+                kwargs['limit'] = limit
+            func = partial(func, **kwargs)
 
         try:
             result = await func(payload)
@@ -132,6 +155,16 @@ class APIApplication(web.Application):
             self._wrap_handle_instance(endpoint.handle_instance),
             name='instance')
 
+    def register_handler(self, method, path, handler):
+        """Register a handler for a path, checking the request MIME type."""
+
+        @wraps(handler)
+        async def wrapper(request):
+            self._check_valid_mimetype(request)
+            return await handler(request)
+
+        self.router.add_route(method, path, wrapper)
+
     def _wrap_handle_collection(self, handle_collection):
         """Wrap the handle_collection handler.
 
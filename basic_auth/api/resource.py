@@ -65,15 +65,17 @@ class APIResource:
         cleaned_data = self._clean_data(self.create_schema, data)
         return await self.collection.create(cleaned_data)
 
-    async def get_all(self, data=None, start_date=None, end_date=None):
+    async def get_all(self, data=None, start_date=None, end_date=None,
+                      **filters):
         """List all resources.
 
         @param data Ignored
         @param start_date An optional start date to limit listing
         @param end_date An optional end date to limit listing
+        @param filters Optional additional filters for the collection
         """
         return tuple(await self.collection.get_all(
-            start_date=start_date, end_date=end_date))
+            start_date=start_date, end_date=end_date, **filters))
 
     async def delete(self, resource_id, data=None):
         """Delete a resource by ID."""
@@ -116,6 +116,61 @@ class ResourceEndpointTest(APITestCase):
         request = self.get_request(path=query_path, method='GET')
         await self.endpoint.handle_collection(request)
 
+    async def test_handle_collection_get_idle_since(self):
+        """The idle_since filter is passed if specified."""
+        self.endpoint.collection_methods = frozenset(['GET'])
+        self.endpoint._collection_methods_map = {'GET': 'get_collection'}
+        calls = []
+
+        async def get_collection(data=None, **kwargs):
+            calls.append(kwargs)
+            return {}
+
+        self.resource.get_collection = get_collection
+        request = self.get_request(
+            path='?idle_since=2018-01-01-00-00', method='GET')
+        await self.endpoint.handle_collection(request)
+        self.assertEqual(
+            [{'start_date': None, 'end_date': None,
+              'idle_since': datetime(2018, 1, 1)}],
+            calls)
+
+    async def test_handle_collection_get_pagination(self):
+        """Pagination parameters are passed if specified."""
+        self.endpoint.collection_methods = frozenset(['GET'])
+        self.endpoint._collection_methods_map = {'GET': 'get_collection'}
+        calls = []
+
+        async def get_collection(data=None, **kwargs):
+            calls.append(kwargs)
+            return {}
+
+        self.resource.get_collection = get_collection
+        request = self.get_request(path='?after=foo&limit=10', method='GET')
+        await self.endpoint.handle_collection(request)
+        self.assertEqual(
+            [{'start_date': None, 'end_date': None, 'after': 'foo',
+              'limit': 10}],
+            calls)
+
+    async def test_handle_collection_get_invalid_limit(self):
+        """If the limit is not a positive integer, an error is returned."""
+        self.endpoint.collection_methods = frozenset(['GET'])
+        self.endpoint._collection_methods_map = {'GET': 'get_collection'}
+
+        async def get_collection(data=None, **kwargs):
+            return {}
+
+        self.resource.get_collection = get_collection
+        for limit in ('foo', '0', '-1'):
+            request = self.get_request(
+                path='?limit=' + limit, method='GET')
+            with self.assertRaises(web.HTTPBadRequest) as cm:
+                await self.endpoint.handle_collection(request)
+            self.assertEqual(
+                'Param limit of {} is not a positive integer'.format(limit),
+                json.loads(cm.exception.text)['message'])
+
     async def test_handle_collection_get_with_invalid_dates(self):
         content = {'id': 'foo', 'value': 'bar'}
         await self.collection.create(content)
@@ -210,8 +265,12 @@ class APIApplicationTest(APIApplicationTestCase):
     async def get_application(self):
         app = APIApplication()
         app.register_endpoint(self.endpoint)
+        app.register_handler('POST', '/echo', self.echo)
         return app
 
+    async def echo(self, request):
+        return web.json_response(await request.json())
+
     @unittest_run_loop
     async def test_request_collection(self):
         """A request to the collection URL calls the appropriate handler."""
@@ -270,3 +329,19 @@ class APIApplicationTest(APIApplicationTestCase):
             content_type='application/json; profile=myapp; version=1.0',
             json=content)
         self.assertEqual(201, response.status)
+
+    @unittest_run_loop
+    async def test_register_handler(self):
+        """Handlers can be registered for paths."""
+        response = await self.client_request(
+            method='POST', path='/echo', json=['foo'])
+        self.assertEqual(200, response.status)
+        self.assertEqual(['foo'], await response.json())
+
+    @unittest_run_loop
+    async def test_register_handler_mime_type(self):
+        """Registered handlers check the request MIME type."""
+        self.app.profile = 'myapp'
+        response = await self.client_request(
+            method='POST', path='/echo', json=['foo'])
+        self.assertEqual(400, response.status)
@@ -1,7 +1,10 @@
 """AioHTTP applications."""
 
+import json
+
 from aiohttp import web
 
+from . import handler
 from .schema import (
     CredentialsCreateSchema,
     CredentialsUpdateSchema,
@@ -11,6 +14,10 @@ from .api import (
     ResourceEndpoint,
     APIResource,
 )
+from .api.response import (
+    APIError,
+    APIResponse,
+)
 from .middleware import BasicAuthMiddlewareFactory
 
 
@@ -36,10 +43,57 @@ class BasicAuthCheckApplication(web.Application):
         return web.HTTPOk()
 
 
-def setup_api_application(collection):
-    """Setup an APIApplication."""
+class BatchAuthCheck:
+    """Handler for checking multiple Basic-Auth credentials at once.
+
+    The request payload is a JSON list of "username:password" tokens, and the
+    response is a list of booleans telling whether each token is valid.
+
+    """
+
+    # Maximum number of tokens in a request.
+    max_tokens = 1000
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def __call__(self, request):
+        try:
+            tokens = await request.json()
+        except json.JSONDecodeError:
+            raise APIError('BadRequest', message='Invalid JSON payload')
+        if (not isinstance(tokens, list) or not tokens or
+                not all(isinstance(token, str) for token in tokens)):
+            raise APIError(
+                'BadRequest', message='Payload must be a list of tokens')
+        if len(tokens) > self.max_tokens:
+            raise APIError(
+                'BadRequest', message='At most {} tokens allowed'.format(
+                    self.max_tokens))
+
+        credentials = []
+        valid = []
+        for token in tokens:
+            username, _, password = token.partition(':')
+            if username and password:
+                credentials.append((username, password))
+                valid.append(True)
+            else:
+                valid.append(False)
+        matches = iter(
+            await self.collection.credentials_match_many(credentials))
+        return APIResponse(
+            content=[is_valid and next(matches) for is_valid in valid])
+
+
+def setup_api_application(collection, **middleware_kwargs):
+    """Setup an APIApplication.
+
+    Keyword arguments are passed to the authentication middleware.
+
+    """
     auth_middleware_factory = BasicAuthMiddlewareFactory(
-        'api', collection.api_credentials_match)
+        'api', collection.api_credentials_match, **middleware_kwargs)
     app = APIApplication(
         profile='basic-auth.api', version='1.0',
         middlewares=[auth_middleware_factory])
@@ -47,11 +101,39 @@ def setup_api_application(collection):
         collection, CredentialsCreateSchema, CredentialsUpdateSchema)
     endpoint = ResourceEndpoint('credentials', resource)
     app.register_endpoint(endpoint)
+    app.register_handler('POST', '/auth-check', BatchAuthCheck(collection))
     return app
 
 
-def setup_auth_check_application(collection):
-    """Setup a BasicAuthCheckApplication."""
+def setup_auth_check_application(collection, **middleware_kwargs):
+    """Setup a BasicAuthCheckApplication.
+
+    Keyword arguments are passed to the authentication middleware.
+
+    """
     auth_middleware_factory = BasicAuthMiddlewareFactory(
-        'auth-check', collection.credentials_match)
+        'auth-check', collection.credentials_match, **middleware_kwargs)
     return BasicAuthCheckApplication(auth_middleware_factory)
+
+
+def setup_internal_application(collection, query_stats=None, profiler=None,
+                               loop_lag=None, **middleware_kwargs):
+    """Setup an application for internal diagnostics endpoints.
+
+    Access requires API credentials. Endpoints for the optional QueryStats
+    and LoopLagMonitor return 404 if they're not set, and the profile
+    endpoint is only added with a Profiler. Other keyword arguments are
+    passed to the authentication middleware.
+
+    """
+    auth_middleware_factory = BasicAuthMiddlewareFactory(
+        'internal', collection.api_credentials_match, **middleware_kwargs)
+    app = web.Application(middlewares=[auth_middleware_factory])
+    app['query-stats'] = query_stats
+    app['profiler'] = profiler
+    app['loop-lag'] = loop_lag
+    app.router.add_get('/query-stats', handler.query_stats)
+    app.router.add_get('/loop-lag', handler.loop_lag)
+    if profiler is not None:
+        app.router.add_post('/profile', handler.profile)
+    return app
@@ -0,0 +1,60 @@
+"""Bloom filter for fast set membership checks."""
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """A Bloom filter for strings.
+
+    Membership checks can return false positives (with probability close to
+    error_rate, as long as no more than capacity items are added), but never
+    false negatives. Items can't be removed.
+
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        if capacity < 1:
+            raise ValueError('Capacity must be a positive number')
+        if not 0 < error_rate < 1:
+            raise ValueError('Error rate must be between 0 and 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(
+            1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def __contains__(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        """Return the number of items added to the filter."""
+        return self.count
+
+    @property
+    def size(self):
+        """The size in bytes of the filter bit array."""
+        return len(self._bits)
+
+    def add(self, item):
+        """Add an item to the filter."""
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def _positions(self, item):
+        """Return bit positions for an item, using double hashing."""
+        digest = hashlib.sha256(item.encode('utf-8')).digest()
+        hash1 = int.from_bytes(digest[:8], 'little')
+        hash2 = int.from_bytes(digest[8:16], 'little') | 1
+        return (
+            (hash1 + index * hash2) % self.num_bits
+            for index in range(self.num_hashes))
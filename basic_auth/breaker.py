@@ -0,0 +1,170 @@
+"""Circuit breaker and known-good decisions for degraded mode."""
+
+from collections import OrderedDict
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import time
+
+from .api.error import ResourceError
+
+
+class CircuitOpen(ResourceError):
+    """Calls are refused since the circuit breaker is open."""
+
+    http_error = 'ServiceUnavailable'
+
+    def __init__(self, retry_after):
+        super().__init__('Service temporarily unavailable')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stop calling a failing service, probing it for recovery.
+
+    The breaker is closed at first, and calls go through. After
+    failure_threshold consecutive failures (errors of the specified types, or
+    calls taking longer than call_timeout, if set), it opens: calls are
+    refused with CircuitOpen for reset_timeout seconds. After that, it's
+    half-open: a single call is let through as a probe, closing the breaker
+    if it succeeds, or opening it again if it fails. Other calls are refused
+    while the probe runs.
+
+    Calls raising other errors count as successes, since the service
+    responded.
+
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30,
+                 call_timeout=None, errors=(OSError, asyncio.TimeoutError),
+                 loop=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout
+        self.errors = tuple(errors) + (asyncio.TimeoutError,)
+        self.loop = loop
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        """The current state of the breaker."""
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._probing or self._clock() - self._opened_at >= (
+                self.reset_timeout):
+            return self.HALF_OPEN
+        return self.OPEN
+
+    async def call(self, func, *args, **kwargs):
+        """Call a coroutine function, if the breaker allows it."""
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+            raise CircuitOpen(self._retry_after())
+
+        probe = state == self.HALF_OPEN
+        if probe:
+            self._probing = True
+        try:
+            coro = func(*args, **kwargs)
+            if self.call_timeout is not None:
+                coro = asyncio.wait_for(
+                    coro, self.call_timeout, loop=self.loop)
+            result = await coro
+        except self.errors as error:
+            self._failed(error)
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._succeeded()
+            raise
+        finally:
+            if probe:
+                self._probing = False
+        self._succeeded()
+        return result
+
+    def _succeeded(self):
+        if self._opened_at is not None:
+            logging.getLogger().info('circuit breaker closed')
+        self._failures = 0
+        self._opened_at = None
+
+    def _failed(self, error):
+        self._failures += 1
+        if self._opened_at is not None or (
+                self._failures >= self.failure_threshold):
+            if self._opened_at is None:
+                logging.getLogger().warning(
+                    'circuit breaker open after {} failures: {!r}'.format(
+                        self._failures, error))
+            self._opened_at = self._clock()
+
+    def _retry_after(self):
+        if self._opened_at is None:
+            return 0
+        return max(
+            0, self.reset_timeout - (self._clock() - self._opened_at))
+
+
+class DecisionStore:
+    """A bounded store of recent successful credentials checks.
+
+    Keyed by username, it holds a keyed digest of the password that last
+    matched, so that checks can be answered while the database is
+    unavailable. Entries older than max_staleness seconds are ignored, and
+    least recently recorded ones are evicted once max_entries is reached.
+
+    """
+
+    def __init__(self, max_entries=100000, max_staleness=3600,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_staleness = max_staleness
+        self._clock = clock
+        # Passwords digests are keyed with a random per-process secret, so
+        # they're useless outside the process.
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, username, password):
+        """Record a successful check for credentials."""
+        self._entries.pop(username, None)
+        self._entries[username] = (self._digest(password), self._clock())
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def match(self, username, password):
+        """Return whether credentials matched recently enough.
+
+        Unknown and stale usernames don't match.
+
+        """
+        entry = self._entries.get(username)
+        if entry is None:
+            return False
+        digest, recorded = entry
+        if self._clock() - recorded > self.max_staleness:
+            del self._entries[username]
+            return False
+        return hmac.compare_digest(digest, self._digest(password))
+
+    def evict(self, username):
+        """Forget the check recorded for a username, if any."""
+        self._entries.pop(username, None)
+
+    def _digest(self, password):
+        return hmac.new(
+            self._key, password.encode('utf-8'), hashlib.sha256).digest()
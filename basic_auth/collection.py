@@ -1,16 +1,24 @@
 """Collection for Basic-Auth credentials."""
 
 import asyncio
+from itertools import islice
 import logging
 
-from .credential import (
-    BasicAuthCredentials,
-    hash_token256,
-)
+from .bloom import BloomFilter
+from .breaker import CircuitOpen
+from .credential import BasicAuthCredentials
 from .lock import locking
-from .db import transact
+from .singleflight import SingleFlight
+from .store import (
+    CredentialsStore,
+    password_digest,
+)
+from .db import (
+    UNAVAILABLE_ERRORS,
+    read_transact,
+    transact,
+)
 from .api import ResourceCollection
-from .api.sample import SampleResourceCollection
 from .api.error import (
     ResourceAlreadyExists,
     ResourceNotFound,
@@ -21,69 +29,153 @@ from .api.error import (
 log = logging.getLogger()
 
 
-class MemoryCredentialsCollection(SampleResourceCollection):
-    """An in-memory Collection for Basic-Auth credentials."""
+class MemoryCredentialsCollection(ResourceCollection):
+    """An in-memory Collection for Basic-Auth credentials.
+
+    Credentials are kept in a CredentialsStore, with password hashes only.
+
+    """
 
     # Valid credentials for API access.
     VALID_API_CREDENTIALS = ('user', 'pass')
 
     def __init__(self, loop=None):
-        super().__init__(id_field='user')
+        self.store = CredentialsStore()
         self.lock = asyncio.Lock(loop=loop)
 
     @locking
     async def create(self, details):
-        token = _prep_token(details.get('token'))
+        """Create credentials for a user."""
+        try:
+            user = details['user']
+        except KeyError:
+            raise InvalidResourceDetails('Missing "user" for the resource')
+        if user in self.store:
+            raise ResourceAlreadyExists(user)
+        token = details.get('token')
         auth = _get_auth(token)
-        self._check_duplicated_username(details['user'], auth.username)
-        details['token'] = str(auth)
-        return await super().create(details)
+        self._check_duplicated_username(user, auth.username)
+        record = self.store.set(
+            user, auth.username, password_digest(auth.password))
+        return user, {
+            'user': user, 'token': _response_token(token, auth, record)}
 
-    async def get_all(self):
-        """Return all credentials."""
-        return await super().get_all()
+    async def get_all(self, start_date=None, end_date=None, idle_since=None,
+                      after=None, limit=None):
+        """Return credentials ordered by username.
+
+        Creation and usage times aren't tracked in memory, so filters on
+        them are ignored.
+
+        """
+        return [
+            {'user': record.user, 'username': record.username}
+            for record in islice(self.store.by_username(after=after), limit)]
 
     @locking
     async def update(self, user, details):
-        token = _prep_token(details.get('token'))
+        """Update credentials for a user."""
+        if user not in self.store:
+            raise ResourceNotFound(user)
+        token = details.get('token')
         auth = _get_auth(token)
         self._check_duplicated_username(user, auth.username)
-        details['token'] = str(auth)
-        return await super().update(user, details)
+        record = self.store.set(
+            user, auth.username, password_digest(auth.password))
+        return {'user': user, 'token': _response_token(token, auth, record)}
 
     @locking
-    async def delete(self, res_id):
-        # wrap with locking
-        return await super().delete(res_id)
+    async def delete(self, user):
+        """Delete credentials for a user."""
+        if not self.store.remove(user):
+            raise ResourceNotFound(user)
 
-    @locking
-    async def get(self, res_id):
-        # wrap with locking
-        return await super().get(res_id)
+    async def get(self, user):
+        """Return credentials for a user."""
+        record = self.store.get(user)
+        if record is None:
+            raise ResourceNotFound(user)
+        return {'user': user, 'token': record.token}
 
-    @locking
     async def credentials_match(self, username, password):
         """Return whether the provided user/password match."""
-        credentials = [details['token'] for details in self.items.values()]
-        return '{}:{}'.format(username, hash_token256(password)) in credentials
+        return self.store.match(username, password)
+
+    async def credentials_match_many(self, credentials):
+        """Return whether each of the (username, password) pairs match."""
+        return [
+            self.store.match(username, password)
+            for username, password in credentials]
 
     async def api_credentials_match(self, username, password):
         """Return whether API credentials match."""
         return (username, password) == self.VALID_API_CREDENTIALS
 
+    def load_snapshot(self, fd):
+        """Load credentials from a snapshot file.
+
+        The snapshot has one line per user, with tab-separated user, username,
+        hashed password and creation time, as written by the
+        seed-credentials script. ValueError is raised for malformed lines.
+
+        """
+        for number, line in enumerate(fd, 1):
+            fields = line.rstrip('\n').split('\t')
+            try:
+                if len(fields) < 3:
+                    raise ValueError('Missing fields')
+                user, username, password = fields[:3]
+                self.store.set_hexdigest(user, username, password)
+            except ValueError as error:
+                raise ValueError(
+                    'Invalid snapshot line {}: {}'.format(number, error))
+
     def _check_duplicated_username(self, user, username):
         """Raise InvalidResourceDetails if the username is already used."""
-        for other_user, details in self.items.items():
-            auth = BasicAuthCredentials.from_token(details['token'])
-            if auth.username == username and user != other_user:
-                raise InvalidResourceDetails('Token username already in use')
+        record = self.store.get_by_username(username)
+        if record is not None and record.user != user:
+            raise InvalidResourceDetails('Token username already in use')
 
 
 class DataBaseCredentialsCollection(ResourceCollection):
-    """A database-backed resource Collection for Basic-Auth credentials."""
+    """A database-backed resource Collection for Basic-Auth credentials.
+
+    If a filter of known usernames is loaded (see load_username_filter),
+    credentials checks for usernames not in the filter are rejected without
+    querying the database.
+
+    Concurrent credentials checks for the same username share a single
+    database lookup. Batch checks look up all usernames in a single query,
+    shared with concurrent checks for the same usernames.
 
-    def __init__(self, engine):
+    If a ReplicaSet is passed, read-only operations (credentials checks, get
+    and get_all) are performed on engines it selects, while changes are
+    performed on the primary engine.
+
+    If a CircuitBreaker is passed, transactions run through it. With a
+    DecisionStore, credentials checks run in degraded mode while the database
+    is unavailable: they match only if the same credentials matched recently,
+    so unknown usernames are rejected.
+
+    If a UsageRecorder is passed, successful credentials checks are recorded
+    with it. If a QueryStats is passed, database queries are recorded in it.
+
+    """
+
+    # Number of usernames fetched per query when loading the username filter.
+    username_filter_batch_size = 10000
+
+    def __init__(self, engine, loop=None, replicas=None, breaker=None,
+                 decisions=None, usage=None, query_stats=None):
         self.engine = engine
+        self.replicas = replicas
+        self.breaker = breaker
+        self.decisions = decisions
+        self.usage = usage
+        self.query_stats = query_stats
+        self.username_filter = None
+        self._loading_username_filter = None
+        self._credentials_lookups = SingleFlight(loop=loop)
 
     @transact
     async def create(self, model, details):
@@ -95,28 +187,33 @@ class DataBaseCredentialsCollection(ResourceCollection):
         auth = _get_auth(details.get('token'))
         await self._check_duplicated_username(model, user, auth.username)
         await model.add_credentials(user, auth.username, auth.password)
+        self._mark_write()
+        self._add_known_username(auth.username)
         log.info('credentials added: {}'.format(user))
         return user, {'user': user, 'token': str(auth)}
 
-    @transact
-    async def get_all(self, model, start_date=None, end_date=None):
-        """Return all credentials."""
+    @read_transact
+    async def get_all(self, model, start_date=None, end_date=None,
+                      idle_since=None, after=None, limit=None):
+        """Return credentials ordered by username."""
         log.info('credentials listed')
         return (
             {'user': credentials.user, 'username': credentials.auth.username}
             for credentials in await model.get_all_credentials(
-                start_date=start_date, end_date=end_date))
+                start_date=start_date, end_date=end_date,
+                idle_since=idle_since, after=after, limit=limit))
 
     @transact
     async def delete(self, model, user):
         """Delete credentials for a user."""
-        removed = await model.remove_credentials(user)
-        if removed:
-            log.info('credentials deleted: {}'.format(user))
-        else:
+        credentials = await model.get_credentials(user=user)
+        if credentials is None or not await model.remove_credentials(user):
             raise ResourceNotFound(user)
+        self._mark_write()
+        self._forget_decisions(credentials.auth.username)
+        log.info('credentials deleted: {}'.format(user))
 
-    @transact
+    @read_transact
     async def get(self, model, user):
         """Return credentials for a user."""
         credentials = await model.get_credentials(user=user)
@@ -128,24 +225,120 @@ class DataBaseCredentialsCollection(ResourceCollection):
     @transact
     async def update(self, model, user, details):
         """Update credentials for a user."""
-        if not await model.is_known_user(user):
+        credentials = await model.get_credentials(user=user)
+        if credentials is None:
             raise ResourceNotFound(user)
         auth = _get_auth(details.get('token'))
         await self._check_duplicated_username(model, user, auth.username)
         await model.update_credentials(user, auth.username, auth.password)
+        self._mark_write()
+        self._forget_decisions(credentials.auth.username, auth.username)
+        self._add_known_username(auth.username)
         log.info('credentials updated: {}'.format(user))
         return {'user': user, 'token': str(auth)}
 
-    @transact
-    async def credentials_match(self, model, username, password):
+    async def credentials_match(self, username, password):
         """Check if username and password match known credentials."""
-        credentials = await model.get_credentials(username=username)
+        if not self._maybe_known_username(username):
+            return False
+        if self.decisions is None:
+            match = await self._credentials_match(username, password)
+        else:
+            try:
+                match = await self._credentials_match(username, password)
+            except (CircuitOpen,) + UNAVAILABLE_ERRORS:
+                match = self._degraded_match(username, password)
+            else:
+                if match:
+                    self.decisions.add(username, password)
+        if match:
+            self._record_usage(username)
+        return match
+
+    async def credentials_match_many(self, credentials):
+        """Check a list of (username, password) pairs.
+
+        Return a list of booleans telling whether each pair matches known
+        credentials.
+
+        """
+        usernames = [
+            username for username, _ in credentials
+            if self._maybe_known_username(username)]
+        known = {}
+        if usernames:
+            try:
+                known = await self._credentials_lookups.call_many(
+                    usernames, self._get_credentials_by_usernames)
+            except (CircuitOpen,) + UNAVAILABLE_ERRORS:
+                if self.decisions is None:
+                    raise
+                results = [
+                    self._maybe_known_username(username) and
+                    self._degraded_match(username, password)
+                    for username, password in credentials]
+                for (username, _), match in zip(credentials, results):
+                    if match:
+                        self._record_usage(username)
+                return results
+        results = []
+        for username, password in credentials:
+            match = False
+            user_credentials = known.get(username)
+            if user_credentials is not None:
+                log.info('credentials login attempt: {}'.format(
+                    user_credentials.user))
+                match = user_credentials.password_match(password)
+                if match:
+                    if self.decisions is not None:
+                        self.decisions.add(username, password)
+                    self._record_usage(username)
+            results.append(match)
+        return results
+
+    async def load_username_filter(self, capacity, error_rate=0.001):
+        """Build the filter of known usernames from the database.
+
+        Usernames are read in batches, and the filter replaces the current
+        one (if any) once fully loaded. Since usernames can't be removed from
+        the filter, this can be called periodically to account for deleted
+        credentials and for changes made by other processes.
+
+        """
+        username_filter = BloomFilter(capacity, error_rate=error_rate)
+        # Usernames added while loading are recorded in the new filter too.
+        self._loading_username_filter = username_filter
+        try:
+            after = None
+            while True:
+                usernames = await self._get_usernames(
+                    after, self.username_filter_batch_size)
+                for username in usernames:
+                    username_filter.add(username)
+                if len(usernames) < self.username_filter_batch_size:
+                    break
+                after = usernames[-1]
+        finally:
+            self._loading_username_filter = None
+        self.username_filter = username_filter
+        log.info(
+            'username filter loaded: {} usernames, {} bytes'.format(
+                len(username_filter), username_filter.size))
+        if len(username_filter) > capacity:
+            log.warning(
+                'username filter capacity exceeded ({} > {})'.format(
+                    len(username_filter), capacity))
+
+    async def _credentials_match(self, username, password):
+        """Check credentials against the database."""
+        credentials = await self._credentials_lookups.call(
+            username, self._get_credentials_by_username, username)
         if credentials is None:
             return False
         log.info('credentials login attempt: {}'.format(credentials.user))
         return credentials.password_match(password)
 
-    @transact
+    @read_transact
     async def api_credentials_match(self, model, username, password):
         """Check if username and password match known API credentials."""
         credentials = await model.get_api_credentials(username)
@@ -153,6 +346,62 @@ class DataBaseCredentialsCollection(ResourceCollection):
             return False
         return credentials.password_match(password)
 
+    @read_transact
+    async def _get_credentials_by_username(self, model, username):
+        """Return credentials for a username."""
+        return await model.get_credentials(username=username)
+
+    @read_transact
+    async def _get_credentials_by_usernames(self, model, usernames):
+        """Return a dict with credentials for usernames."""
+        return await model.get_credentials_by_usernames(usernames)
+
+    @read_transact
+    async def _get_usernames(self, model, after, limit):
+        """Return a batch of known usernames."""
+        return await model.get_usernames(after=after, limit=limit)
+
+    def read_engine(self):
+        """Return the engine for read-only transactions."""
+        if self.replicas is None:
+            return self.engine
+        return self.replicas.engine()
+
+    def _mark_write(self):
+        """Record a change, for read-your-writes consistency."""
+        if self.replicas is not None:
+            self.replicas.mark_write()
+
+    def _record_usage(self, username):
+        """Record a successful credentials check, if tracking usage."""
+        if self.usage is not None:
+            self.usage.record(username)
+
+    def _degraded_match(self, username, password):
+        """Check credentials against recent successful checks."""
+        match = self.decisions.match(username, password)
+        log.info('credentials login attempt (degraded): {} {}'.format(
+            username, 'matched' if match else 'rejected'))
+        return match
+
+    def _forget_decisions(self, *usernames):
+        """Evict recent successful checks for changed usernames, if kept."""
+        if self.decisions is not None:
+            for username in usernames:
+                self.decisions.evict(username)
+
+    def _maybe_known_username(self, username):
+        """Return False if the username is surely not known."""
+        return (
+            self.username_filter is None or username in self.username_filter)
+
+    def _add_known_username(self, username):
+        """Add a username to the username filters, if present."""
+        for username_filter in (
+                self.username_filter, self._loading_username_filter):
+            if username_filter is not None:
+                username_filter.add(username)
+
     async def _check_duplicated_username(self, model, user, username):
         """Raise InvalidResourceDetails if the username is already used."""
         credentials = await model.get_credentials(username=username)
@@ -164,17 +413,16 @@ class DataBaseCredentialsCollection(ResourceCollection):
             raise InvalidResourceDetails('Token username already in use')
 
 
-def _prep_token(token):
-    """Prepare a token by ensuring that it uses the hashword rather than
-    the password.
+def _response_token(token, auth, record):
+    """Return the token in responses for in-memory credentials.
+
+    Provided passwords are returned hashed, as stored. Generated ones are
+    returned in clear, since they're not known otherwise.
+
     """
-    if token is None:
-        return
-    split = token.split(':')
-    if len(split) == 2 and '' not in split:
-        split[1] = hash_token256(split[1])
-        token = ':'.join(split)
-    return token
+    if token:
+        return record.token
+    return str(auth)
 
 
 def _get_auth(token):
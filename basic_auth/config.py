@@ -6,6 +6,10 @@ import copy
 import yaml
 
 
+class ConfigError(Exception):
+    """The configuration is invalid."""
+
+
 class Config:
     """Application configuration."""
 
@@ -1,9 +1,9 @@
 """Basic-auth credentials."""
 
 from collections import namedtuple
-import random
-import string
 import hashlib
+import os
+import string
 
 
 _BasicAuthCredentials = namedtuple(
@@ -16,7 +16,17 @@ class BasicAuthCredentials(_BasicAuthCredentials):
     @classmethod
     def generate(cls):
         """Generate random BasicAuthCredentials."""
-        return cls(generate_random_token(), generate_random_token())
+        return cls(*generate_random_tokens(2))
+
+    @classmethod
+    def generate_many(cls, count, randbytes=os.urandom):
+        """Generate a list of count random BasicAuthCredentials.
+
+        See generate_random_tokens for the randbytes argument.
+
+        """
+        tokens = generate_random_tokens(2 * count, randbytes=randbytes)
+        return [cls(*pair) for pair in zip(tokens[::2], tokens[1::2])]
 
     @classmethod
     def from_token(cls, token):
@@ -31,10 +41,45 @@ class BasicAuthCredentials(_BasicAuthCredentials):
         return '{}:{}'.format(self.username, self.password)
 
 
-def generate_random_token(length=20):
-    """Generate a random string to use as token."""
-    choices = string.ascii_letters + string.digits
-    return "".join(random.choice(choices) for _ in range(length))
+TOKEN_CHARS = string.ascii_letters + string.digits
+
+# Random bytes are mapped to token characters through a translation table.
+# Byte values past the largest multiple of the number of characters are
+# discarded, so that all characters are equally likely.
+_TOKEN_BYTES_LIMIT = 256 - 256 % len(TOKEN_CHARS)
+_TOKEN_TRANSLATION = bytes(
+    ord(TOKEN_CHARS[value % len(TOKEN_CHARS)]) if value < _TOKEN_BYTES_LIMIT
+    else 0 for value in range(256))
+_TOKEN_DISCARDED_BYTES = bytes(range(_TOKEN_BYTES_LIMIT, 256))
+
+
+def generate_random_tokens(count, length=20, randbytes=os.urandom):
+    """Generate a list of count random strings to use as tokens.
+
+    Tokens are generated from a cryptographically secure source by default.
+    A different randbytes function, returning the specified number of random
+    bytes, can be passed to generate deterministic tokens.
+
+    """
+    needed = count * length
+    chars = b''
+    while len(chars) < needed:
+        missing = needed - len(chars)
+        # Request extra bytes to account for discarded ones.
+        data = randbytes(missing * 256 // _TOKEN_BYTES_LIMIT + 16)
+        chars += data.translate(_TOKEN_TRANSLATION, _TOKEN_DISCARDED_BYTES)
+    chars = chars[:needed].decode('ascii')
+    return [chars[index:index + length] for index in range(0, needed, length)]
+
+
+def generate_random_token(length=20, randbytes=os.urandom):
+    """Generate a random string to use as token.
+
+    See generate_random_tokens for the randbytes argument.
+
+    """
+    [token] = generate_random_tokens(1, length=length, randbytes=randbytes)
+    return token
 
 
 def hash_token1(token):
@@ -1,6 +1,8 @@
 from .schema import METADATA
 from .model import Model
 from .transaction import (
+    UNAVAILABLE_ERRORS,
+    read_transact,
     transact,
     run_in_transaction,
 )
@@ -9,6 +11,8 @@ from .transaction import (
 __all__ = [
     'METADATA',
     'Model',
+    'UNAVAILABLE_ERRORS',
+    'read_transact',
     'transact',
     'run_in_transaction',
 ]
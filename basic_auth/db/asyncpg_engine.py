@@ -0,0 +1,219 @@
+"""Database engine for the asyncpg driver.
+
+asyncpg talks to PostgreSQL with the binary protocol, and runs parametrized
+queries as prepared statements, cached for each connection. Rows are returned
+as asyncpg Records, which support access to columns by name and position.
+
+SQLAlchemy queries are compiled to SQL with positional parameters. Since
+compilation is expensive compared to running simple queries, the compiled SQL
+is cached for each query object, so that queries built once with bind
+parameters (see Model) are only compiled once.
+
+Constraint violations raise sqlalchemy.exc.IntegrityError, as with other
+drivers.
+
+The asyncpg package requires Python 3.6 or later.
+
+"""
+
+import asyncio
+import re
+import weakref
+
+import asyncpg
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+from .engine import (
+    DatabaseConnectionError,
+    ResultProxy,
+)
+
+
+# Errors meaning that the connection to the database failed or was lost.
+CONNECTION_ERRORS = (
+    asyncpg.PostgresConnectionError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.ConnectionDoesNotExistError,
+    asyncpg.exceptions.TooManyConnectionsError)
+
+# Dialect compiling queries with "%s" placeholders for parameters, in order.
+# Generated primary keys are returned by INSERT queries, as with dialects
+# initialized from a connection to a recent PostgreSQL server.
+_DIALECT = postgresql.dialect(paramstyle='format')
+_DIALECT.implicit_returning = True
+
+_PLACEHOLDER_RE = re.compile('%(%|s)')
+
+# Leading keywords of statements returning rows.
+_ROWS_KEYWORDS = frozenset(['SELECT', 'WITH', 'VALUES', 'SHOW', 'TABLE'])
+
+# Compiled queries, by query object.
+_COMPILED = weakref.WeakKeyDictionary()
+
+
+async def create_engine(dsn, minsize=1, maxsize=10, loop=None):
+    """Create an AsyncpgEngine with a connection pool."""
+    try:
+        pool = await asyncpg.create_pool(
+            dsn, min_size=minsize, max_size=maxsize, loop=loop)
+    except CONNECTION_ERRORS as error:
+        raise DatabaseConnectionError(str(error)) from error
+    return AsyncpgEngine(pool, minsize, maxsize, loop=loop)
+
+
+class AsyncpgEngine:
+    """An engine for an asyncpg connection pool."""
+
+    def __init__(self, pool, minsize, maxsize, loop=None):
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.loop = loop
+        self._pool = pool
+        self._closing = None
+
+    @property
+    def size(self):
+        """The number of connections in the pool."""
+        return self._pool.get_size()
+
+    @property
+    def freesize(self):
+        """The number of idle connections in the pool."""
+        return self._pool.get_idle_size()
+
+    def acquire(self):
+        """Acquire a connection, as coroutine or async context manager."""
+        return _AcquireContext(self)
+
+    def release(self, conn):
+        """Release a connection back to the pool."""
+        return asyncio.ensure_future(
+            self._pool.release(conn.connection), loop=self.loop)
+
+    def close(self):
+        """Close the pool, once connections are released."""
+        self._closing = asyncio.ensure_future(
+            self._pool.close(), loop=self.loop)
+
+    def terminate(self):
+        """Close the pool, and all connections immediately."""
+        self._pool.terminate()
+
+    async def wait_closed(self):
+        """Wait for the pool to be closed."""
+        if self._closing is not None:
+            await self._closing
+
+    async def _acquire(self):
+        try:
+            connection = await self._pool.acquire()
+        except CONNECTION_ERRORS as error:
+            raise DatabaseConnectionError(str(error)) from error
+        return AsyncpgConnection(connection)
+
+
+class _AcquireContext:
+    """Acquire a connection, as coroutine or async context manager."""
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._conn = None
+
+    def __await__(self):
+        return self._engine._acquire().__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._engine._acquire()
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        conn, self._conn = self._conn, None
+        await self._engine._pool.release(conn.connection)
+
+
+class AsyncpgConnection:
+    """A connection executing SQLAlchemy queries through asyncpg."""
+
+    dialect_name = 'postgresql'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def begin(self):
+        """Return an async context manager for a transaction."""
+        return self.connection.transaction()
+
+    async def execute(self, query, params=None):
+        """Execute a query, return a ResultProxy."""
+        sql, args, returns_rows = compile_query(query, params)
+        try:
+            if returns_rows:
+                rows = await self.connection.fetch(sql, *args)
+                return ResultProxy(rows, len(rows))
+            status = await self.connection.execute(sql, *args)
+        except CONNECTION_ERRORS as error:
+            raise DatabaseConnectionError(str(error)) from error
+        except asyncpg.IntegrityConstraintViolationError as error:
+            raise IntegrityError(sql, args, error) from error
+        return ResultProxy([], _status_rowcount(status))
+
+
+def compile_query(query, params=None):
+    """Return SQL, parameter values and whether the query returns rows.
+
+    Parameters in the SQL are numbered, as expected by asyncpg.
+
+    """
+    if isinstance(query, str):
+        return query, (), _returns_rows(query)
+    compiled = _COMPILED.get(query)
+    if compiled is None:
+        compiled = _COMPILED[query] = _compile(query)
+    sql, names, returns_rows, sa_compiled = compiled
+    values = sa_compiled.construct_params(params)
+    _set_defaults(sa_compiled, values)
+    return sql, [values[name] for name in names], returns_rows
+
+
+def _set_defaults(sa_compiled, values):
+    """Set values for Python-side column defaults.
+
+    With other drivers these are set when SQLAlchemy executes the query.
+
+    """
+    defaults = (
+        [(column, column.default) for column in sa_compiled.insert_prefetch] +
+        [(column, column.onupdate) for column in sa_compiled.update_prefetch])
+    for column, default in defaults:
+        if default is None or values.get(column.key) is not None:
+            continue
+        if default.is_scalar:
+            values[column.key] = default.arg
+        elif default.is_callable:
+            values[column.key] = default.arg(None)
+
+
+def _compile(query):
+    sa_compiled = query.compile(dialect=_DIALECT)
+    positions = iter(range(1, len(sa_compiled.positiontup) + 1))
+    sql = _PLACEHOLDER_RE.sub(
+        lambda match: (
+            '%' if match.group(1) == '%'
+            else '${}'.format(next(positions))),
+        str(sa_compiled))
+    returns_rows = (
+        bool(getattr(sa_compiled, 'returning', None)) or
+        _returns_rows(sql))
+    return sql, list(sa_compiled.positiontup), returns_rows, sa_compiled
+
+
+def _returns_rows(sql):
+    words = sql.split(None, 1)
+    return bool(words) and words[0].upper() in _ROWS_KEYWORDS
+
+
+def _status_rowcount(status):
+    """Return the number of rows from a command status, such as "UPDATE 3"."""
+    count = status.rsplit(' ', 1)[-1]
+    return int(count) if count.isdigit() else 0
@@ -0,0 +1,71 @@
+"""Database engines for supported drivers.
+
+Engines for all drivers provide the subset of the aiopg.sa Engine interface
+used by the service, so that Model and transaction helpers work with any of
+them:
+
+- engine.acquire(), both awaitable and as an async context manager, returning
+  a connection, and engine.release(conn);
+- engine.close(), engine.terminate() and engine.wait_closed();
+- the minsize, maxsize, size and freesize attributes for the pool;
+- conn.begin(), an async context manager for a transaction;
+- conn.execute(query, params=None), executing a SQLAlchemy query or a SQL
+  string, returning a result with the rowcount attribute and the fetchone()
+  and fetchall() coroutines. Rows support access to columns by name;
+- conn.dialect_name, the name of the SQLAlchemy dialect for the database.
+  Since aiopg connections don't have it, "postgresql" is assumed if missing.
+
+"""
+
+from aiopg.sa import create_engine as create_aiopg_engine
+
+
+# Names of supported database drivers.
+DRIVERS = ('aiopg', 'asyncpg', 'sqlite')
+
+
+class DatabaseConnectionError(ConnectionError):
+    """The connection to the database failed or was lost."""
+
+
+async def create_engine(dsn, driver='aiopg', minsize=1, maxsize=10,
+                        loop=None):
+    """Create an engine for a database driver, with a connection pool."""
+    if driver == 'aiopg':
+        return await create_aiopg_engine(
+            dsn=dsn, minsize=minsize, maxsize=maxsize, loop=loop)
+    if driver == 'asyncpg':
+        # Only imported if used, since asyncpg is an optional dependency.
+        from .asyncpg_engine import create_engine as create_asyncpg_engine
+        return await create_asyncpg_engine(
+            dsn, minsize=minsize, maxsize=maxsize, loop=loop)
+    if driver == 'sqlite':
+        from .sqlite_engine import create_engine as create_sqlite_engine
+        return await create_sqlite_engine(
+            dsn, minsize=minsize, maxsize=maxsize, loop=loop)
+    raise ValueError(
+        'Unknown database driver "{}", must be one of: {}'.format(
+            driver, ', '.join(DRIVERS)))
+
+
+class ResultProxy:
+    """Rows returned by a query."""
+
+    def __init__(self, rows, rowcount):
+        self.rowcount = rowcount
+        self._rows = rows
+        self._index = 0
+
+    async def fetchone(self):
+        """Return the next row, None if there are no more rows."""
+        if self._index >= len(self._rows):
+            return None
+        row = self._rows[self._index]
+        self._index += 1
+        return row
+
+    async def fetchall(self):
+        """Return remaining rows."""
+        rows = self._rows[self._index:]
+        self._index = len(self._rows)
+        return rows
@@ -0,0 +1,273 @@
+"""Resumable, batched data migrations.
+
+Data migrations rewrite existing rows of a table (for instance to change the
+format of stored values). Unlike plain Alembic migrations loading the whole
+table at once, rows are processed in batches following the primary key, each
+batch in a short transaction, and progress is recorded in the
+data_migrations table in the same transaction. An interrupted migration
+resumes from the last completed batch.
+
+Migrations can run either synchronously (from an Alembic revision, see
+run_in_alembic) or as a background task in the server (see
+MigrationRunner.run and the db.data-migrations config option).
+
+"""
+
+import asyncio
+from datetime import datetime
+import logging
+import time
+
+from sqlalchemy import (
+    select,
+    text,
+)
+from sqlalchemy.dialects import postgresql
+
+from .schema import DATA_MIGRATIONS
+
+
+# Registered data migration jobs, by name. No job is currently needed, since
+# existing rows are already in their final format: jobs are registered here
+# along with schema changes requiring them.
+JOBS = {}
+
+
+def register_job(job_class):
+    """Class decorator to register a DataMigrationJob for the server."""
+    JOBS[job_class.name] = job_class
+    return job_class
+
+
+class DataMigrationJob:
+    """A data migration rewriting rows of a table.
+
+    Subclasses must set the name, table and columns attributes and implement
+    rewrite(). The table must have an integer "id" primary key.
+
+    """
+
+    # Unique name of the migration, used to track progress.
+    name = None
+    # The sqlalchemy.Table to rewrite.
+    table = None
+    # Names of the columns passed to rewrite() and updated.
+    columns = ()
+
+    def rewrite(self, row):
+        """Return a dict with new column values for a row.
+
+        Returning None leaves the row unchanged.
+
+        """
+        raise NotImplementedError('Subclasses must implement rewrite()')
+
+
+class MigrationRunner:
+    """Run a DataMigrationJob in batches.
+
+    At most batch_size rows are processed in each transaction. If
+    max_rows_per_second is set, the runner sleeps between batches so that the
+    average rate doesn't exceed it.
+
+    """
+
+    def __init__(self, job, batch_size=1000, max_rows_per_second=None,
+                 clock=time.monotonic):
+        self.job = job
+        self.batch_size = batch_size
+        self.max_rows_per_second = max_rows_per_second
+        self._clock = clock
+        self._logger = logging.getLogger()
+
+    def run_sync(self, conn, sleep=time.sleep):
+        """Run the migration with a synchronous SQLAlchemy connection.
+
+        The connection must not be in a transaction.
+
+        """
+        with conn.begin():
+            last_id = self._get_progress(conn.execute)
+        if last_id is None:
+            return
+
+        start = self._clock()
+        processed = 0
+        while True:
+            with conn.begin():
+                rows = conn.execute(self._select_batch(last_id)).fetchall()
+                last_id = self._process_batch(conn.execute, rows)
+            processed += len(rows)
+            if last_id is None:
+                break
+            sleep(self._throttle_delay(start, processed))
+        self._log_done(processed)
+
+    async def run(self, engine, loop=None):
+        """Run the migration with an aiopg engine."""
+        async with engine.acquire() as conn:
+            async with conn.begin():
+                last_id = await self._get_progress_async(conn)
+            if last_id is None:
+                return
+
+            start = self._clock()
+            processed = 0
+            while True:
+                async with conn.begin():
+                    result = await conn.execute(self._select_batch(last_id))
+                    rows = await result.fetchall()
+                    last_id = await self._process_batch_async(conn, rows)
+                processed += len(rows)
+                if last_id is None:
+                    break
+                await asyncio.sleep(
+                    self._throttle_delay(start, processed), loop=loop)
+        self._log_done(processed)
+
+    def _get_progress(self, execute):
+        """Return the ID of the last processed row, None if completed."""
+        progress = execute(self._select_progress()).fetchone()
+        if progress is None:
+            execute(self._insert_progress())
+            return 0
+        if progress['completed']:
+            return None
+        return progress['last_id']
+
+    async def _get_progress_async(self, conn):
+        result = await conn.execute(self._select_progress())
+        progress = await result.fetchone()
+        if progress is None:
+            await conn.execute(self._insert_progress())
+            return 0
+        if progress['completed']:
+            return None
+        return progress['last_id']
+
+    def _process_batch(self, execute, rows):
+        """Rewrite a batch of rows, return the ID to continue from."""
+        updates, last_id = self._rewrite_rows(rows)
+        if updates:
+            execute(self._update_rows(updates))
+        execute(self._update_progress(last_id))
+        return last_id
+
+    async def _process_batch_async(self, conn, rows):
+        updates, last_id = self._rewrite_rows(rows)
+        if updates:
+            await conn.execute(self._update_rows(updates))
+        await conn.execute(self._update_progress(last_id))
+        return last_id
+
+    def _rewrite_rows(self, rows):
+        """Return updates for rows and the ID to continue from.
+
+        The returned ID is None if there are no more rows.
+
+        """
+        updates = []
+        for row in rows:
+            values = self.job.rewrite(row)
+            if values is not None:
+                values = dict(values)
+                values['id'] = row['id']
+                updates.append(values)
+        if len(rows) < self.batch_size:
+            return updates, None
+        return updates, rows[-1]['id']
+
+    def _throttle_delay(self, start, processed):
+        """Return how long to wait before the next batch."""
+        if not self.max_rows_per_second:
+            return 0
+        expected = processed / self.max_rows_per_second
+        return max(0, expected - (self._clock() - start))
+
+    def _select_batch(self, last_id):
+        table = self.job.table
+        columns = [table.c.id] + [
+            table.c[column] for column in self.job.columns]
+        # Rows are locked so that they can't be changed concurrently while
+        # being rewritten.
+        return select(columns).where(table.c.id > last_id).order_by(
+            table.c.id).limit(self.batch_size).with_for_update()
+
+    def _update_rows(self, updates):
+        return bulk_update_query(self.job.table, self.job.columns, updates)
+
+    def _select_progress(self):
+        return DATA_MIGRATIONS.select().where(
+            DATA_MIGRATIONS.c.name == self.job.name)
+
+    def _insert_progress(self):
+        return DATA_MIGRATIONS.insert().values(
+            name=self.job.name, last_id=0, completed=False,
+            update_time=datetime.utcnow())
+
+    def _update_progress(self, last_id):
+        values = {'update_time': datetime.utcnow()}
+        if last_id is None:
+            values['completed'] = True
+        else:
+            values['last_id'] = last_id
+        return DATA_MIGRATIONS.update().where(
+            DATA_MIGRATIONS.c.name == self.job.name).values(**values)
+
+    def _log_done(self, processed):
+        self._logger.info(
+            'data migration {} completed ({} rows processed)'.format(
+                self.job.name, processed))
+
+
+def bulk_update_query(table, columns, rows, key='id', assignments=None):
+    """Return a query updating multiple rows by key in a single statement.
+
+    Each row must be a dict with the key and the specified columns. Columns
+    are set to the new values, unless assignments maps a column to a SQL
+    expression to set instead, where new values are available as
+    "_v.<column>".
+
+    """
+    dialect = postgresql.dialect()
+    quote = dialect.identifier_preparer.quote
+    names = (key,) + tuple(columns)
+    expressions = {
+        column: '_v.{}'.format(quote(column)) for column in columns}
+    expressions.update(assignments or {})
+    params = {}
+    values = []
+    for index, row in enumerate(rows):
+        placeholders = []
+        for column in names:
+            param = 'p{}_{}'.format(index, len(placeholders))
+            params[param] = row[column]
+            placeholders.append('CAST(:{} AS {})'.format(
+                param, table.c[column].type.compile(dialect=dialect)))
+        values.append('({})'.format(', '.join(placeholders)))
+    query = (
+        'UPDATE {table} SET {assignments} '
+        'FROM (VALUES {values}) AS _v ({names}) '
+        'WHERE {table}.{key} = _v.{key}').format(
+            table=quote(table.name),
+            key=quote(key),
+            assignments=', '.join(
+                '{} = {}'.format(quote(column), expressions[column])
+                for column in columns),
+            values=', '.join(values),
+            names=', '.join(quote(column) for column in names))
+    return text(query).bindparams(**params)
+
+
+def run_in_alembic(op, job, **kwargs):
+    """Run a DataMigrationJob from an Alembic revision.
+
+    The op argument is the alembic.op module. Changes from previous revisions
+    are committed first, then batches are run in separate transactions on a
+    new connection, and committed as they complete. Keyword arguments are
+    passed to MigrationRunner.
+
+    """
+    with op.get_context().autocommit_block():
+        with op.get_bind().engine.connect() as conn:
+            MigrationRunner(job, **kwargs).run_sync(conn)
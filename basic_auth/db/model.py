@@ -1,9 +1,21 @@
 """Database models."""
 
 from collections import namedtuple
+from functools import wraps
 
-from sqlalchemy import and_
+from sqlalchemy import (
+    and_,
+    any_,
+    bindparam,
+    DateTime,
+    func,
+    or_,
+    select,
+    String,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
 
+from .. import timing
 from ..credential import (
     BasicAuthCredentials,
     hash_token1,
@@ -11,6 +23,7 @@ from ..credential import (
     match_token1,
     match_token256,
 )
+from .migration import bulk_update_query
 from .schema import (
     CREDENTIALS,
     API_CREDENTIALS,
@@ -24,13 +37,40 @@ API_CREDENTIALS_FIELDS = ('username', 'password', 'description')
 Credentials = namedtuple('Credentials', ('user', 'auth'))
 APICredentials = namedtuple('APICredentials', API_CREDENTIALS_FIELDS)
 
+# Queries run by credentials checks, built once with bind parameters, so that
+# drivers can cache their compiled form.
+_GET_CREDENTIALS_BY_USER = CREDENTIALS.select().where(
+    CREDENTIALS.c.user == bindparam('user'))
+_GET_CREDENTIALS_BY_USERNAME = CREDENTIALS.select().where(
+    CREDENTIALS.c.username == bindparam('username'))
+_GET_CREDENTIALS_BY_USERNAMES = CREDENTIALS.select().where(
+    CREDENTIALS.c.username == any_(
+        bindparam('usernames', type_=ARRAY(String))))
+_IS_KNOWN_USER = select([CREDENTIALS.c.id]).where(
+    CREDENTIALS.c.user == bindparam('user'))
+_GET_API_CREDENTIALS = API_CREDENTIALS.select().where(
+    API_CREDENTIALS.c.username == bindparam('username'))
+
+# SQLite versions of queries using PostgreSQL-specific features. Lookups by
+# usernames are split in chunks, to stay within the limit for parameters.
+_SQLITE_USERNAMES_CHUNK = 500
+_GET_CREDENTIALS_BY_USERNAMES_SQLITE = CREDENTIALS.select().where(
+    CREDENTIALS.c.username.in_(bindparam('usernames', expanding=True)))
+_LAST_USED = bindparam('b_last_used', type_=DateTime)
+_RECORD_USAGE_SQLITE = CREDENTIALS.update().where(
+    CREDENTIALS.c.username == bindparam('b_username')).values(
+        last_used=func.max(
+            func.coalesce(CREDENTIALS.c.last_used, _LAST_USED), _LAST_USED),
+        use_count=CREDENTIALS.c.use_count + bindparam('b_use_count'))
+
 
 class HashedAPICredentials(APICredentials):
     """API credentials where the password is hashed."""
 
     def password_match(self, password):
         """Return whether the password matches the hashed one."""
-        return match_token1(password, self.password)
+        with timing.timed('hash'):
+            return match_token1(password, self.password)
 
 
 class HashedCredentials(Credentials):
@@ -38,58 +78,125 @@ class HashedCredentials(Credentials):
 
     def password_match(self, password):
         """Return whether the password matches the hashed one."""
-        return match_token256(password, self.auth.password)
+        with timing.timed('hash'):
+            return match_token256(password, self.auth.password)
+
+
+def _query(meth):
+    """Decorator for Model methods running queries.
+
+    Time spent in the method is recorded for the request, and queries it
+    executes are tracked under the method name in query statistics.
+
+    """
+    name = 'db-' + meth.__name__.replace('_', '-')
+
+    @wraps(meth)
+    async def wrapper(self, *args, **kwargs):
+        self._shape = meth.__name__
+        try:
+            with timing.timed(name):
+                return await meth(self, *args, **kwargs)
+        finally:
+            self._shape = None
+
+    return wrapper
 
 
 class Model:
-    """The database model."""
+    """The database model.
+
+    If a QueryStats instance is passed, executed queries are recorded in it.
 
-    def __init__(self, conn):
+    """
+
+    def __init__(self, conn, stats=None):
         self._conn = conn
+        self._stats = stats
+        self._shape = None
+        self._sqlite = getattr(conn, 'dialect_name', None) == 'sqlite'
 
+    @_query
     async def add_credentials(self, user, username, password):
         """Add user credentials."""
-        await self._conn.execute(
+        await self._execute(
             CREDENTIALS.insert().values(
                 user=user, username=username,
                 password=hash_token256(password)))
         return Credentials(user, BasicAuthCredentials(username, password))
 
-    async def get_all_credentials(self, start_date=None, end_date=None):
+    @_query
+    async def get_all_credentials(self, start_date=None, end_date=None,
+                                  idle_since=None, after=None, limit=None):
         """Return all credentials ordered by username.
 
         @param start_date An optional start_date; limits credential listing
             to those created on or after this date.
         @param end_date An optional end_date; limits credential listing
             to those created on or before this date.
+        @param idle_since An optional date; limits credential listing to
+            those not used since this date.
+        @param after An optional username; limits credential listing to
+            those with usernames following it.
+        @param limit An optional maximum number of credentials to return.
         """
         conditions = []
         if start_date is not None:
             conditions.append(CREDENTIALS.c.creation_time >= start_date)
         if end_date is not None:
             conditions.append(CREDENTIALS.c.creation_time <= end_date)
+        if idle_since is not None:
+            conditions.append(or_(
+                CREDENTIALS.c.last_used.is_(None),
+                CREDENTIALS.c.last_used < idle_since))
+        if after is not None:
+            conditions.append(CREDENTIALS.c.username > after)
         conditions = and_(*conditions)
         query = CREDENTIALS.select().where(conditions).order_by(
             CREDENTIALS.c.username)
-        result = await self._conn.execute(query)
+        if limit is not None:
+            query = query.limit(limit)
+        result = await self._execute(query)
         return (
             Credentials(
                 row['user'],
                 BasicAuthCredentials(row['username'], row['password'])
             ) for row in await result.fetchall())
 
+    @_query
+    async def get_usernames(self, after=None, limit=None):
+        """Return credentials usernames ordered alphabetically.
+
+        @param after An optional username; limits listing to usernames
+            following it.
+        @param limit An optional maximum number of usernames to return.
+        """
+        query = select([CREDENTIALS.c.username]).order_by(
+            CREDENTIALS.c.username)
+        if after is not None:
+            query = query.where(CREDENTIALS.c.username > after)
+        if limit is not None:
+            query = query.limit(limit)
+        result = await self._execute(query)
+        return [row['username'] for row in await result.fetchall()]
+
+    @_query
     async def get_credentials(self, user=None, username=None):
         """Return credentials by user or username."""
         if (user, username) == (None, None):
             raise RuntimeError('Need to pass user or username')
 
-        query = CREDENTIALS.select()
-        if user:
-            query = query.where(CREDENTIALS.c.user == user)
-        if username:
-            query = query.where(CREDENTIALS.c.username == username)
-
-        result = await self._conn.execute(query)
+        if not username:
+            result = await self._execute(
+                _GET_CREDENTIALS_BY_USER, {'user': user})
+        elif not user:
+            result = await self._execute(
+                _GET_CREDENTIALS_BY_USERNAME, {'username': username})
+        else:
+            result = await self._execute(
+                _GET_CREDENTIALS_BY_USERNAME.where(
+                    CREDENTIALS.c.user == bindparam('user')),
+                {'user': user, 'username': username})
         row = await result.fetchone()
         if row is None:
             return
@@ -98,58 +205,128 @@ class Model:
             row['user'],
             BasicAuthCredentials(row['username'], row['password']))
 
+    @_query
+    async def get_credentials_by_usernames(self, usernames):
+        """Return a dict with credentials for usernames, by username.
+
+        Usernames are looked up in a single query (in chunks with SQLite).
+        Unknown usernames are not included.
+
+        """
+        usernames = list(usernames)
+        if self._sqlite:
+            rows = []
+            for index in range(0, len(usernames), _SQLITE_USERNAMES_CHUNK):
+                result = await self._execute(
+                    _GET_CREDENTIALS_BY_USERNAMES_SQLITE,
+                    {'usernames': usernames[
+                        index:index + _SQLITE_USERNAMES_CHUNK]})
+                rows.extend(await result.fetchall())
+        else:
+            result = await self._execute(
+                _GET_CREDENTIALS_BY_USERNAMES, {'usernames': usernames})
+            rows = await result.fetchall()
+        return {
+            row['username']: HashedCredentials(
+                row['user'],
+                BasicAuthCredentials(row['username'], row['password']))
+            for row in rows}
+
+    @_query
+    async def record_credentials_usage(self, usage):
+        """Record usage of credentials by username.
+
+        The usage parameter is a list of dicts with "username", "last_used"
+        and "use_count" keys. Usage counts are added to the current ones.
+
+        """
+        if self._sqlite:
+            await self._execute(
+                _RECORD_USAGE_SQLITE,
+                [{'b_username': entry['username'],
+                  'b_last_used': entry['last_used'],
+                  'b_use_count': entry['use_count']} for entry in usage])
+            return
+        query = bulk_update_query(
+            CREDENTIALS, ('last_used', 'use_count'), usage, key='username',
+            assignments={
+                'last_used': 'GREATEST(credentials.last_used, _v.last_used)',
+                'use_count': 'credentials.use_count + _v.use_count'})
+        await self._execute(query)
+
+    @_query
     async def update_credentials(self, user, username, password):
         """Update user credentials."""
-        result = await self._conn.execute(
+        result = await self._execute(
             CREDENTIALS.update().where(CREDENTIALS.c.user == user).values(
                 username=username, password=hash_token256(password)))
         return bool(result.rowcount)
 
+    @_query
     async def is_known_user(self, user):
         """Return whether credentials exist for the specified user."""
-        query = CREDENTIALS.select().where(
-            CREDENTIALS.c.user == user)
-        result = await self._conn.execute(query)
+        result = await self._execute(_IS_KNOWN_USER, {'user': user})
         return bool(result.rowcount)
 
+    @_query
     async def remove_credentials(self, user):
         """Remove credentials for the specified user."""
         query = CREDENTIALS.delete().where(CREDENTIALS.c.user == user)
-        result = await self._conn.execute(query)
+        result = await self._execute(query)
         return bool(result.rowcount)
 
+    @_query
     async def add_api_credentials(self, username, password, description=None):
         """Add credentials for an API user."""
         if description is None:
             description = ''
-        await self._conn.execute(
+        await self._execute(
             API_CREDENTIALS.insert().values(
                 username=username, password=hash_token1(password),
                 description=description))
         return APICredentials(username, password, description)
 
+    @_query
     async def get_api_credentials(self, username):
         """Return credentials for an API user."""
-        result = await self._conn.execute(
-            API_CREDENTIALS.select().where(
-                API_CREDENTIALS.c.username == username))
+        result = await self._execute(
+            _GET_API_CREDENTIALS, {'username': username})
         row = await result.fetchone()
         if row is not None:
             return HashedAPICredentials(
                 row['username'], row['password'], row['description'])
 
+    @_query
     async def remove_api_credentials(self, username):
         """Remove credentials for an API user."""
         query = API_CREDENTIALS.delete().where(
             API_CREDENTIALS.c.username == username)
-        result = await self._conn.execute(query)
+        result = await self._execute(query)
         return bool(result.rowcount)
 
+    @_query
     async def get_all_api_credentials(self):
         """Return all API credentials."""
-        result = await self._conn.execute(
+        result = await self._execute(
             API_CREDENTIALS.select().order_by(API_CREDENTIALS.c.username))
         return [
             HashedAPICredentials(
                 row['username'], row['password'], row['description'])
             for row in await result.fetchall()]
+
+    async def _execute(self, query, params=None):
+        """Execute a query, recording it in statistics if enabled.
+
+        Values for bind parameters in the query can be passed as a dict, or
+        as a list of dicts to execute the query for each (only with SQLite).
+
+        """
+        args = (query,) if params is None else (query, params)
+        if self._stats is None:
+            return await self._conn.execute(*args)
+        start = self._stats.clock()
+        result = await self._conn.execute(*args)
+        self._stats.record(
+            self._shape, query, self._stats.clock() - start,
+            result.rowcount)
+        return result
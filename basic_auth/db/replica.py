@@ -0,0 +1,85 @@
+"""Read replicas support."""
+
+import asyncio
+import logging
+import time
+
+
+class ReplicaSet:
+    """Select database engines for read-only transactions.
+
+    Reads are distributed round-robin across replicas that passed the last
+    health check, falling back to the primary if none did. If a
+    read-your-writes window is set, reads go to the primary for that many
+    seconds after a write, so that changes are visible even if replicas lag
+    behind.
+
+    """
+
+    def __init__(self, primary, replicas, read_your_writes=0, timeout=2,
+                 loop=None, clock=time.monotonic):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.read_your_writes = read_your_writes
+        self.timeout = timeout
+        self.loop = loop
+        self._clock = clock
+        # Replicas are assumed to be healthy until checked.
+        self._healthy = list(self.replicas)
+        self._index = 0
+        self._last_write = None
+
+    @property
+    def healthy(self):
+        """Replicas that passed the last health check."""
+        return list(self._healthy)
+
+    def engine(self):
+        """Return the engine to use for a read-only transaction."""
+        if (self._last_write is not None and
+                self._clock() - self._last_write < self.read_your_writes):
+            return self.primary
+        if not self._healthy:
+            return self.primary
+        self._index = (self._index + 1) % len(self._healthy)
+        return self._healthy[self._index]
+
+    def mark_write(self):
+        """Record that a write has been performed on the primary."""
+        self._last_write = self._clock()
+
+    async def check(self):
+        """Check replicas, using only healthy ones for reads."""
+        results = await asyncio.gather(
+            *(self._ping(engine) for engine in self.replicas),
+            loop=self.loop)
+        healthy = [
+            engine for engine, ok in zip(self.replicas, results) if ok]
+        if len(healthy) != len(self._healthy):
+            logging.getLogger().warning(
+                'healthy database replicas: {}/{}'.format(
+                    len(healthy), len(self.replicas)))
+        self._healthy = healthy
+
+    async def close(self):
+        """Close replica engines."""
+        for engine in self.replicas:
+            engine.close()
+        await asyncio.gather(
+            *(engine.wait_closed() for engine in self.replicas),
+            loop=self.loop)
+
+    async def _ping(self, engine):
+        try:
+            await asyncio.wait_for(
+                _ping(engine), self.timeout, loop=self.loop)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return False
+        return True
+
+
+async def _ping(engine):
+    async with engine.acquire() as conn:
+        await conn.execute('SELECT 1')
@@ -1,6 +1,7 @@
 """Database schema definitions."""
 
 from sqlalchemy import (
+    Boolean,
     Column,
     DateTime,
     func,
@@ -21,7 +22,11 @@ CREDENTIALS = Table(
     Column('user', String, nullable=False, unique=True),
     Column('username', String, nullable=False, unique=True),
     Column('password', String, nullable=False),
-    Column("creation_time", DateTime, default=func.now(), nullable=False),
+    Column("creation_time", DateTime, default=func.now(), nullable=False,
+           index=True),
+    Column('last_used', DateTime, nullable=True),
+    Column('use_count', Integer, nullable=False, server_default='0',
+           default=0),
 )
 
 
@@ -35,3 +40,13 @@ API_CREDENTIALS = Table(
            default=''),
     Column("creation_time", DateTime, default=func.now(), nullable=False),
 )
+
+
+DATA_MIGRATIONS = Table(
+    'data_migrations',
+    METADATA,
+    Column('name', String, primary_key=True),
+    Column('last_id', Integer, nullable=False, default=0),
+    Column('completed', Boolean, nullable=False, default=False),
+    Column('update_time', DateTime, default=func.now(), nullable=False),
+)
@@ -0,0 +1,382 @@
+"""Database engine for SQLite.
+
+The database is used in WAL mode, where readers see a consistent snapshot of
+the database for the duration of their transaction, without blocking the
+writer or being blocked by it. Since SQLite allows a single writer at a time,
+the engine has one writer connection, used by a transaction at a time, and a
+pool of reader connections. Each connection runs blocking calls in its own
+thread.
+
+Connections returned by the engine are bound to the writer or to a reader
+when they start running queries. Transactions set as READ ONLY before any
+query (as done by read_transact) run on a reader, others on the writer.
+Other SET TRANSACTION statements are ignored, since SQLite transactions are
+always serializable.
+
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import re
+
+import sqlalchemy
+from sqlalchemy import (
+    event,
+    exc,
+    pool,
+)
+from sqlalchemy.engine.url import make_url
+
+from .engine import (
+    DatabaseConnectionError,
+    ResultProxy,
+)
+
+
+# Seconds to wait for locks held by other processes, such as migrations.
+BUSY_TIMEOUT = 5
+
+_SET_TRANSACTION_RE = re.compile(r'\s*SET\s+TRANSACTION\b', re.IGNORECASE)
+_READ_ONLY_RE = re.compile(r'\bREAD\s+ONLY\b', re.IGNORECASE)
+
+# Start of messages for errors meaning that the database can't be used.
+_UNAVAILABLE_MESSAGES = (
+    'database is locked', 'unable to open database', 'disk I/O error')
+
+
+async def create_engine(dsn, minsize=1, maxsize=10, loop=None):
+    """Create a SqliteEngine with a writer and a pool of readers.
+
+    The DSN is a SQLAlchemy URL for a database file, such as
+    "sqlite:////var/lib/basic-auth/credentials.db".
+
+    """
+    url = make_url(dsn)
+    if url.get_backend_name() != 'sqlite' or url.database in (
+            None, '', ':memory:'):
+        raise ValueError(
+            'Invalid DSN for SQLite, must be a database file URL: {}'.format(
+                dsn))
+    engine = SqliteEngine(url, minsize, maxsize, loop=loop)
+    await engine.start()
+    return engine
+
+
+class SqliteEngine:
+    """An engine for a SQLite database.
+
+    The minsize and maxsize attributes, as well as size and freesize, refer
+    to the pool of reader connections.
+
+    """
+
+    def __init__(self, url, minsize, maxsize, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.loop = loop
+        self._writer_engine = _create_sa_engine(
+            url, begin='BEGIN IMMEDIATE',
+            pragmas=('PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL'))
+        self._reader_engine = _create_sa_engine(
+            url, begin='BEGIN', pragmas=('PRAGMA query_only=ON',))
+        self._writer = None
+        self._writer_lock = asyncio.Lock(loop=loop)
+        self._readers = []
+        self._idle_readers = []
+        self._reader_slots = asyncio.Semaphore(maxsize, loop=loop)
+        self._closing = None
+
+    @property
+    def size(self):
+        """The number of reader connections in the pool."""
+        return len(self._readers)
+
+    @property
+    def freesize(self):
+        """The number of idle reader connections in the pool."""
+        return len(self._idle_readers)
+
+    async def start(self):
+        """Open the writer and the minimum number of reader connections."""
+        self._writer = await self._open(self._writer_engine)
+        readers = await asyncio.gather(
+            *(self._open(self._reader_engine) for _ in range(self.minsize)),
+            loop=self.loop)
+        self._readers.extend(readers)
+        self._idle_readers.extend(readers)
+
+    def acquire(self):
+        """Acquire a connection, as coroutine or async context manager."""
+        return _AcquireContext(self)
+
+    def release(self, conn):
+        """Release a connection, rolling back its transaction if any."""
+        return asyncio.ensure_future(conn.close(), loop=self.loop)
+
+    def close(self):
+        """Close all connections, once running queries complete."""
+        if self._closing is None:
+            self._closing = asyncio.ensure_future(
+                self._close(), loop=self.loop)
+
+    def terminate(self):
+        """Close all connections.
+
+        Since queries running in SQLite can't be interrupted, this is the
+        same as close().
+
+        """
+        self.close()
+
+    async def wait_closed(self):
+        """Wait for connections to be closed."""
+        if self._closing is not None:
+            await self._closing
+
+    async def _open(self, sa_engine):
+        conn = _ThreadConnection(sa_engine, loop=self.loop)
+        await conn.run(conn.open)
+        return conn
+
+    async def _close(self):
+        conns = list(self._readers)
+        if self._writer is not None:
+            conns.append(self._writer)
+        self._readers, self._idle_readers, self._writer = [], [], None
+        await asyncio.gather(*(conn.close() for conn in conns), loop=self.loop)
+        self._writer_engine.dispose()
+        self._reader_engine.dispose()
+
+    async def _acquire_writer(self):
+        await self._writer_lock.acquire()
+        return self._writer
+
+    async def _acquire_reader(self):
+        await self._reader_slots.acquire()
+        if self._idle_readers:
+            return self._idle_readers.pop()
+        try:
+            reader = await self._open(self._reader_engine)
+        except BaseException:
+            self._reader_slots.release()
+            raise
+        self._readers.append(reader)
+        return reader
+
+    def _release(self, conn):
+        if conn is self._writer:
+            self._writer_lock.release()
+        else:
+            self._idle_readers.append(conn)
+            self._reader_slots.release()
+
+
+class _AcquireContext:
+    """Acquire a connection, as coroutine or async context manager."""
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._conn = SqliteConnection(engine)
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def __aenter__(self):
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._conn.close()
+
+    async def _acquire(self):
+        return self._conn
+
+
+class SqliteConnection:
+    """A connection bound to the writer or to a reader while in use.
+
+    Outside transactions, each query is bound to a connection separately.
+
+    """
+
+    dialect_name = 'sqlite'
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._bound = None
+        self._read_only = False
+        self._in_transaction = False
+
+    def begin(self):
+        """Return an async context manager for a transaction."""
+        return _Transaction(self)
+
+    async def execute(self, query, params=None):
+        """Execute a query, return a ResultProxy.
+
+        Params can also be a list of dicts, to execute the query for each.
+
+        """
+        if isinstance(query, str) and _SET_TRANSACTION_RE.match(query):
+            if (self._in_transaction and self._bound is None and
+                    _READ_ONLY_RE.search(query)):
+                self._read_only = True
+            return ResultProxy([], 0)
+        bound = await self._bind()
+        try:
+            return await bound.run(bound.execute, query, params)
+        finally:
+            if not self._in_transaction:
+                self._unbind()
+
+    async def close(self):
+        """Roll back the transaction, if any."""
+        if self._in_transaction:
+            await self._end(commit=False)
+
+    async def _bind(self):
+        if self._bound is not None:
+            return self._bound
+        if self._read_only:
+            self._bound = await self._engine._acquire_reader()
+        else:
+            self._bound = await self._engine._acquire_writer()
+        if self._in_transaction:
+            try:
+                await self._bound.run(self._bound.begin)
+            except BaseException:
+                self._unbind()
+                raise
+        return self._bound
+
+    def _unbind(self):
+        bound, self._bound = self._bound, None
+        if bound is not None:
+            self._engine._release(bound)
+
+    def _begin(self):
+        if self._in_transaction:
+            raise RuntimeError('Nested transactions are not supported')
+        self._in_transaction = True
+
+    async def _end(self, commit=True):
+        bound = self._bound
+        self._in_transaction = False
+        self._read_only = False
+        if bound is None:
+            # No query was run in the transaction.
+            return
+        try:
+            await bound.run(bound.commit if commit else bound.rollback)
+        finally:
+            self._unbind()
+
+
+class _Transaction:
+    """Async context manager for a transaction on a SqliteConnection."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def __aenter__(self):
+        self._conn._begin()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._conn._end(commit=exc_type is None)
+
+
+class _ThreadConnection:
+    """A SQLAlchemy connection, used from its own thread.
+
+    Methods other than run() and close() are blocking, and must be called
+    through run().
+
+    """
+
+    def __init__(self, sa_engine, loop=None):
+        self._sa_engine = sa_engine
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._conn = None
+        self._transaction = None
+
+    def run(self, func, *args):
+        """Run a function in the connection thread, return a future."""
+        return self._loop.run_in_executor(
+            self._executor, partial(_translate_errors, func, *args))
+
+    async def close(self):
+        """Close the connection, and stop its thread."""
+        try:
+            await self.run(self._close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def open(self):
+        self._conn = self._sa_engine.connect()
+
+    def begin(self):
+        self._transaction = self._conn.begin()
+
+    def commit(self):
+        transaction, self._transaction = self._transaction, None
+        transaction.commit()
+
+    def rollback(self):
+        transaction, self._transaction = self._transaction, None
+        transaction.rollback()
+
+    def execute(self, query, params=None):
+        if params is None:
+            result = self._conn.execute(query)
+        else:
+            result = self._conn.execute(query, params)
+        if not result.returns_rows:
+            return ResultProxy([], result.rowcount)
+        rows = result.fetchall()
+        return ResultProxy(rows, len(rows))
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _create_sa_engine(url, begin, pragmas=()):
+    """Return a SQLAlchemy engine for SQLite connections.
+
+    Transactions are started with the begin statement, and pragmas are run
+    on each new connection.
+
+    """
+    sa_engine = sqlalchemy.create_engine(
+        url, poolclass=pool.NullPool,
+        connect_args={'timeout': BUSY_TIMEOUT})
+
+    @event.listens_for(sa_engine, 'connect')
+    def connect(dbapi_conn, connection_record):
+        # Disable transactions handling by the sqlite3 module, which doesn't
+        # start them for SELECTs, so that they're started by begin() below.
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(sa_engine, 'begin')
+    def begin_transaction(conn):
+        conn.execute(begin)
+
+    return sa_engine
+
+
+def _translate_errors(func, *args):
+    """Call a function, translating errors for an unusable database."""
+    try:
+        return func(*args)
+    except exc.OperationalError as error:
+        if str(error.orig).startswith(_UNAVAILABLE_MESSAGES):
+            raise DatabaseConnectionError(str(error.orig)) from error
+        raise
@@ -0,0 +1,93 @@
+"""Statistics of executed database queries."""
+
+from collections import deque
+import logging
+import math
+import time
+
+from sqlalchemy.dialects import postgresql
+
+
+class _ShapeStats:
+    """Statistics for a query shape."""
+
+    __slots__ = ('count', 'total', 'rows', 'slow', 'durations')
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0
+        self.rows = 0
+        self.slow = 0
+        self.durations = deque(maxlen=window)
+
+
+class QueryStats:
+    """Track executed queries by shape (the Model method running them).
+
+    For each shape, the number of queries, total time, rows returned or
+    affected, and slow queries are counted. The 99th percentile time is
+    computed over the last `window` queries.
+
+    Queries taking at least slow_threshold seconds are logged, with the
+    values of their parameters redacted.
+
+    """
+
+    def __init__(self, slow_threshold=None, window=1000,
+                 clock=time.perf_counter):
+        self.slow_threshold = slow_threshold
+        self.window = window
+        self.clock = clock
+        self._shapes = {}
+
+    def record(self, shape, query, duration, rows):
+        """Record an executed query."""
+        if shape is None:
+            shape = 'other'
+        stats = self._shapes.get(shape)
+        if stats is None:
+            stats = self._shapes[shape] = _ShapeStats(self.window)
+        stats.count += 1
+        stats.total += duration
+        stats.durations.append(duration)
+        if rows is not None and rows > 0:
+            stats.rows += rows
+        if (self.slow_threshold is not None and
+                duration >= self.slow_threshold):
+            stats.slow += 1
+            logging.getLogger().warning(
+                'slow query {} ({:.3f}s): {}'.format(
+                    shape, duration, redacted_query(query)))
+
+    def summary(self):
+        """Return a dict with statistics by shape, times in milliseconds."""
+        return {
+            shape: {
+                'count': stats.count,
+                'total': _ms(stats.total),
+                'mean': _ms(stats.total / stats.count),
+                'p99': _ms(_percentile(stats.durations, 0.99)),
+                'rows': stats.rows,
+                'slow': stats.slow}
+            for shape, stats in self._shapes.items()}
+
+
+def redacted_query(query):
+    """Return the SQL for a query, with parameter values redacted."""
+    if isinstance(query, str):
+        return query
+    compiled = query.compile(dialect=postgresql.dialect())
+    sql = ' '.join(str(compiled).split())
+    if not compiled.params:
+        return sql
+    return '{} [{}]'.format(sql, ', '.join(
+        '{}=<redacted>'.format(name) for name in sorted(compiled.params)))
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * fraction) - 1)]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
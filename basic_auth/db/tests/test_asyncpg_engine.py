@@ -0,0 +1,169 @@
+import unittest
+
+import asynctest
+
+from sqlalchemy import (
+    bindparam,
+    select,
+    text,
+)
+from sqlalchemy.exc import IntegrityError
+
+from ..model import Model
+from ..schema import CREDENTIALS
+from ..testing import ensure_database
+from ...credential import hash_token256
+from ...testing import TEST_DB_DSN
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+else:
+    from ..asyncpg_engine import (
+        compile_query,
+        create_engine,
+    )
+
+
+requires_asyncpg = unittest.skipIf(asyncpg is None, 'asyncpg not installed')
+
+
+@requires_asyncpg
+class CompileQueryTest(unittest.TestCase):
+
+    def test_string(self):
+        """SQL strings are returned as they are."""
+        self.assertEqual(
+            ('SELECT 1', (), True), compile_query('SELECT 1'))
+        self.assertEqual(
+            ('SET TRANSACTION READ ONLY', (), False),
+            compile_query('SET TRANSACTION READ ONLY'))
+
+    def test_numbered_parameters(self):
+        """Parameters are numbered in order, with values from params."""
+        query = CREDENTIALS.select().where(
+            CREDENTIALS.c.user == bindparam('user')).where(
+                CREDENTIALS.c.username == bindparam('username'))
+        sql, args, returns_rows = compile_query(
+            query, {'user': 'foo', 'username': 'bar'})
+        self.assertIn('credentials.username = $2', sql)
+        self.assertIn('credentials."user" = $1', sql)
+        self.assertEqual(['foo', 'bar'], args)
+        self.assertTrue(returns_rows)
+
+    def test_literal_values(self):
+        """Values set in the query are passed as parameters."""
+        query = CREDENTIALS.select().where(CREDENTIALS.c.user == 'foo')
+        sql, args, _ = compile_query(query)
+        self.assertIn('credentials."user" = $1', sql)
+        self.assertEqual(['foo'], args)
+
+    def test_percent(self):
+        """Escaped percent signs are unescaped."""
+        query = select([text("'100%'")]).where(
+            CREDENTIALS.c.username.like('foo%'))
+        sql, args, _ = compile_query(query)
+        self.assertIn("'100%'", sql)
+        self.assertIn('credentials.username LIKE $1', sql)
+        self.assertEqual(['foo%'], args)
+
+    def test_cached(self):
+        """Compiled SQL is cached for each query."""
+        query = CREDENTIALS.select().where(
+            CREDENTIALS.c.user == bindparam('user'))
+        sql1, args1, _ = compile_query(query, {'user': 'foo'})
+        sql2, args2, _ = compile_query(query, {'user': 'bar'})
+        self.assertIs(sql1, sql2)
+        self.assertEqual(['foo'], args1)
+        self.assertEqual(['bar'], args2)
+
+    def test_insert_defaults(self):
+        """Column defaults are set on insert, and the id is returned."""
+        query = CREDENTIALS.insert().values(
+            user='foo', username='bar', password='secret')
+        sql, args, returns_rows = compile_query(query)
+        self.assertTrue(sql.endswith('RETURNING credentials.id'))
+        self.assertIn('foo', args)
+        self.assertIn(0, args)
+        self.assertTrue(returns_rows)
+
+    def test_update_no_rows(self):
+        """Updates without RETURNING don't return rows."""
+        query = CREDENTIALS.update().where(
+            CREDENTIALS.c.user == 'foo').values(password='secret')
+        _, _, returns_rows = compile_query(query)
+        self.assertFalse(returns_rows)
+
+
+@requires_asyncpg
+class AsyncpgEngineTest(asynctest.TestCase):
+
+    forbid_get_event_loop = True
+
+    async def setUp(self):
+        super().setUp()
+        ensure_database()
+        self.engine = await create_engine(
+            TEST_DB_DSN, minsize=2, maxsize=4, loop=self.loop)
+        self.addCleanup(self.engine.wait_closed)
+        self.addCleanup(self.engine.close)
+
+    async def test_pool_size(self):
+        """The pool opens the minimum number of connections."""
+        self.assertEqual(2, self.engine.minsize)
+        self.assertEqual(4, self.engine.maxsize)
+        self.assertEqual(2, self.engine.size)
+        self.assertEqual(2, self.engine.freesize)
+
+    async def test_acquire_release(self):
+        """Connections can be acquired and released."""
+        conn = await self.engine.acquire()
+        self.assertEqual(1, self.engine.freesize)
+        await self.engine.release(conn)
+        self.assertEqual(2, self.engine.freesize)
+
+    async def test_model(self):
+        """Model queries run on asyncpg connections."""
+        async with self.engine.acquire() as conn:
+            async with conn.begin():
+                model = Model(conn)
+                await model.add_credentials('user', 'username', 'pass')
+                self.assertTrue(await model.is_known_user('user'))
+                credentials = await model.get_credentials(username='username')
+                self.assertEqual('user', credentials.user)
+                self.assertEqual(
+                    hash_token256('pass'), credentials.auth.password)
+                by_usernames = await model.get_credentials_by_usernames(
+                    ['username', 'other'])
+                self.assertEqual(['username'], list(by_usernames))
+                self.assertTrue(
+                    await model.update_credentials('user', 'username', 'new'))
+                self.assertTrue(await model.remove_credentials('user'))
+                self.assertFalse(await model.is_known_user('user'))
+
+    async def test_transaction_rollback(self):
+        """Changes are rolled back if the transaction fails."""
+        with self.assertRaises(RuntimeError):
+            async with self.engine.acquire() as conn:
+                async with conn.begin():
+                    await Model(conn).add_credentials(
+                        'user', 'username', 'pass')
+                    raise RuntimeError('fail')
+        async with self.engine.acquire() as conn:
+            self.assertFalse(await Model(conn).is_known_user('user'))
+
+    async def test_integrity_error(self):
+        """Constraint violations raise IntegrityError, as with aiopg."""
+        async with self.engine.acquire() as conn:
+            async with conn.begin():
+                model = Model(conn)
+                await model.add_credentials('user1', 'username', 'pass')
+                with self.assertRaises(IntegrityError):
+                    await model.add_credentials('user2', 'username', 'pass')
+
+    async def test_connection_error(self):
+        """Connection failures raise OSError, as with aiopg."""
+        with self.assertRaises(OSError):
+            await create_engine(
+                'postgresql://localhost:1/basic-auth-test', loop=self.loop)
@@ -0,0 +1,58 @@
+import asynctest
+
+from ..engine import (
+    DRIVERS,
+    ResultProxy,
+    create_engine,
+)
+from ...testing import TEST_DB_DSN
+
+
+class CreateEngineTest(asynctest.TestCase):
+
+    forbid_get_event_loop = True
+
+    async def test_create_engine(self):
+        """By default, an engine for the aiopg driver is created."""
+        engine = await create_engine(
+            TEST_DB_DSN, minsize=2, maxsize=4, loop=self.loop)
+        self.addCleanup(engine.wait_closed)
+        self.addCleanup(engine.terminate)
+        self.assertEqual(2, engine.minsize)
+        self.assertEqual(4, engine.maxsize)
+        async with engine.acquire() as conn:
+            result = await conn.execute('SELECT 1 AS value')
+            row = await result.fetchone()
+        self.assertEqual(1, row['value'])
+
+    async def test_create_engine_unknown_driver(self):
+        """An error is raised if the driver is unknown."""
+        with self.assertRaises(ValueError) as context:
+            await create_engine(TEST_DB_DSN, driver='other', loop=self.loop)
+        self.assertEqual(
+            'Unknown database driver "other", must be one of: '
+            'aiopg, asyncpg, sqlite',
+            str(context.exception))
+
+    def test_drivers(self):
+        """aiopg, asyncpg and sqlite drivers are supported."""
+        self.assertEqual(('aiopg', 'asyncpg', 'sqlite'), DRIVERS)
+
+
+class ResultProxyTest(asynctest.TestCase):
+
+    forbid_get_event_loop = True
+
+    async def test_fetchone(self):
+        """fetchone returns rows one by one, then None."""
+        result = ResultProxy(['row1', 'row2'], 2)
+        self.assertEqual('row1', await result.fetchone())
+        self.assertEqual('row2', await result.fetchone())
+        self.assertIsNone(await result.fetchone())
+
+    async def test_fetchall(self):
+        """fetchall returns remaining rows."""
+        result = ResultProxy(['row1', 'row2', 'row3'], 3)
+        await result.fetchone()
+        self.assertEqual(['row2', 'row3'], await result.fetchall())
+        self.assertEqual([], await result.fetchall())
@@ -0,0 +1,161 @@
+import unittest
+
+from ..testing import DataBaseTest
+from ..migration import (
+    DataMigrationJob,
+    MigrationRunner,
+    bulk_update_query,
+)
+from ..schema import (
+    CREDENTIALS,
+    DATA_MIGRATIONS,
+)
+
+
+class UpperCasePasswordJob(DataMigrationJob):
+
+    name = 'upper-case-password'
+    table = CREDENTIALS
+    columns = ('password',)
+
+    def __init__(self):
+        self.rewritten = []
+
+    def rewrite(self, row):
+        self.rewritten.append(row['id'])
+        if row['password'].isupper():
+            return None
+        return {'password': row['password'].upper()}
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class BulkUpdateQueryTest(unittest.TestCase):
+
+    def test_query(self):
+        """bulk_update_query returns a single UPDATE for all rows."""
+        query = bulk_update_query(
+            CREDENTIALS, ('username', 'password'),
+            [{'id': 1, 'username': 'foo', 'password': 'x'},
+             {'id': 2, 'username': 'bar', 'password': 'y'}])
+        self.assertEqual(
+            str(query),
+            'UPDATE credentials SET username = _v.username, '
+            'password = _v.password FROM (VALUES '
+            '(CAST(:p0_0 AS INTEGER), CAST(:p0_1 AS VARCHAR), '
+            'CAST(:p0_2 AS VARCHAR)), '
+            '(CAST(:p1_0 AS INTEGER), CAST(:p1_1 AS VARCHAR), '
+            'CAST(:p1_2 AS VARCHAR))) '
+            'AS _v (id, username, password) WHERE credentials.id = _v.id')
+        self.assertEqual(
+            query.compile().params,
+            {'p0_0': 1, 'p0_1': 'foo', 'p0_2': 'x',
+             'p1_0': 2, 'p1_1': 'bar', 'p1_2': 'y'})
+
+    def test_query_key_assignments(self):
+        """Rows can be matched by another key, with custom assignments."""
+        query = bulk_update_query(
+            CREDENTIALS, ('use_count',),
+            [{'username': 'foo', 'use_count': 2}], key='username',
+            assignments={'use_count': 'credentials.use_count + _v.use_count'})
+        self.assertEqual(
+            str(query),
+            'UPDATE credentials SET '
+            'use_count = credentials.use_count + _v.use_count '
+            'FROM (VALUES (CAST(:p0_0 AS VARCHAR), CAST(:p0_1 AS INTEGER))) '
+            'AS _v (username, use_count) '
+            'WHERE credentials.username = _v.username')
+
+
+class MigrationRunnerTest(DataBaseTest):
+
+    async def setUp(self):
+        await super().setUp()
+        self.job = UpperCasePasswordJob()
+        async with self.engine.acquire() as conn:
+            for index in range(5):
+                await conn.execute(CREDENTIALS.insert().values(
+                    user='user{}'.format(index),
+                    username='username{}'.format(index),
+                    password='pass{}'.format(index)))
+
+    async def get_passwords(self):
+        async with self.engine.acquire() as conn:
+            result = await conn.execute(
+                CREDENTIALS.select().order_by(CREDENTIALS.c.id))
+            return [row['password'] for row in await result.fetchall()]
+
+    async def get_progress(self):
+        async with self.engine.acquire() as conn:
+            result = await conn.execute(DATA_MIGRATIONS.select())
+            return await result.fetchone()
+
+    async def test_run(self):
+        """The runner rewrites all rows, in batches."""
+        runner = MigrationRunner(self.job, batch_size=2)
+        await runner.run(self.engine, loop=self.loop)
+        self.assertEqual(
+            await self.get_passwords(),
+            ['PASS0', 'PASS1', 'PASS2', 'PASS3', 'PASS4'])
+        self.assertEqual(len(self.job.rewritten), 5)
+
+    async def test_run_records_progress(self):
+        """Completion of the migration is recorded."""
+        runner = MigrationRunner(self.job, batch_size=2)
+        await runner.run(self.engine, loop=self.loop)
+        progress = await self.get_progress()
+        self.assertEqual(progress['name'], 'upper-case-password')
+        self.assertTrue(progress['completed'])
+
+    async def test_run_completed(self):
+        """A completed migration is not run again."""
+        runner = MigrationRunner(self.job, batch_size=2)
+        await runner.run(self.engine, loop=self.loop)
+        self.job.rewritten = []
+        await runner.run(self.engine, loop=self.loop)
+        self.assertEqual(self.job.rewritten, [])
+
+    async def test_run_resume(self):
+        """An interrupted migration resumes from the last batch."""
+        async with self.engine.acquire() as conn:
+            result = await conn.execute(
+                CREDENTIALS.select().order_by(CREDENTIALS.c.id))
+            ids = [row['id'] for row in await result.fetchall()]
+            await conn.execute(DATA_MIGRATIONS.insert().values(
+                name='upper-case-password', last_id=ids[2], completed=False))
+        runner = MigrationRunner(self.job, batch_size=2)
+        await runner.run(self.engine, loop=self.loop)
+        self.assertEqual(self.job.rewritten, ids[3:])
+        self.assertEqual(
+            await self.get_passwords(),
+            ['pass0', 'pass1', 'pass2', 'PASS3', 'PASS4'])
+
+    def test_rewrite_rows_unchanged(self):
+        """Rows for which rewrite() returns None are not updated."""
+        runner = MigrationRunner(self.job, batch_size=2)
+        updates, last_id = runner._rewrite_rows(
+            [{'id': 1, 'password': 'PASS'}, {'id': 2, 'password': 'pass'}])
+        self.assertEqual(updates, [{'id': 2, 'password': 'PASS'}])
+        self.assertEqual(last_id, 2)
+
+    def test_throttle_delay(self):
+        """The runner waits so that the configured rate isn't exceeded."""
+        clock = FakeClock()
+        runner = MigrationRunner(
+            self.job, max_rows_per_second=100, clock=clock)
+        clock.now = 0.5
+        self.assertEqual(runner._throttle_delay(0, 100), 0.5)
+        clock.now = 2
+        self.assertEqual(runner._throttle_delay(0, 100), 0)
+
+    def test_throttle_delay_no_limit(self):
+        """Without a rate limit, batches run without waiting."""
+        runner = MigrationRunner(self.job)
+        self.assertEqual(runner._throttle_delay(0, 1000), 0)
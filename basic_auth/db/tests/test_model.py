@@ -5,6 +5,8 @@ from datetime import (
 import unittest
 
 from ..testing import DataBaseTest
+from ..schema import CREDENTIALS
+from ..stats import QueryStats
 
 from ..model import (
     Model,
@@ -110,6 +112,107 @@ class ModelTest(DataBaseTest):
             (c.user, c.auth.username, c.auth.password) for c in credentials]
         self.assertEqual(raw_credentials, [])
 
+    async def test_get_all_credentials_idle_since(self):
+        """Credentials not used since a date can be retrieved."""
+        now = datetime.utcnow()
+        await self.model.add_credentials('user1', 'username1', 'pass1')
+        await self.model.add_credentials('user2', 'username2', 'pass2')
+        await self.model.add_credentials('user3', 'username3', 'pass3')
+        await self.model.record_credentials_usage([
+            {'username': 'username1', 'last_used': now - timedelta(10),
+             'use_count': 1},
+            {'username': 'username2', 'last_used': now, 'use_count': 1}])
+        credentials = await self.model.get_all_credentials(
+            idle_since=now - timedelta(1))
+        self.assertEqual(['user1', 'user3'], [c.user for c in credentials])
+
+    async def test_get_all_credentials_paginated(self):
+        """Credentials can be retrieved in pages, by username."""
+        await self.model.add_credentials('user1', 'username1', 'pass1')
+        await self.model.add_credentials('user2', 'username2', 'pass2')
+        await self.model.add_credentials('user3', 'username3', 'pass3')
+        credentials = await self.model.get_all_credentials(limit=2)
+        self.assertEqual(['user1', 'user2'], [c.user for c in credentials])
+        credentials = await self.model.get_all_credentials(
+            after='username2', limit=2)
+        self.assertEqual(['user3'], [c.user for c in credentials])
+
+    async def get_usage(self, user):
+        result = await self.conn.execute(
+            CREDENTIALS.select().where(CREDENTIALS.c.user == user))
+        row = await result.fetchone()
+        return row['last_used'], row['use_count']
+
+    async def test_record_credentials_usage(self):
+        """Usage is recorded by username."""
+        now = datetime.utcnow()
+        await self.model.add_credentials('user1', 'username1', 'pass1')
+        await self.model.add_credentials('user2', 'username2', 'pass2')
+        self.assertEqual((None, 0), await self.get_usage('user1'))
+        await self.model.record_credentials_usage([
+            {'username': 'username1', 'last_used': now, 'use_count': 3},
+            {'username': 'unknown', 'last_used': now, 'use_count': 1}])
+        self.assertEqual((now, 3), await self.get_usage('user1'))
+        self.assertEqual((None, 0), await self.get_usage('user2'))
+
+    async def test_record_credentials_usage_aggregated(self):
+        """Usage counts are added, the most recent use is kept."""
+        now = datetime.utcnow()
+        await self.model.add_credentials('user', 'username', 'pass')
+        await self.model.record_credentials_usage([
+            {'username': 'username', 'last_used': now, 'use_count': 3}])
+        await self.model.record_credentials_usage([
+            {'username': 'username', 'last_used': now - timedelta(1),
+             'use_count': 2}])
+        self.assertEqual((now, 5), await self.get_usage('user'))
+
+    async def test_query_stats(self):
+        """Executed queries are recorded by Model method."""
+        stats = QueryStats()
+        model = Model(self.conn, stats=stats)
+        await model.add_credentials('user', 'username', 'pass')
+        await model.get_credentials(user='user')
+        await model.get_credentials(user='other')
+        summary = stats.summary()
+        self.assertEqual(1, summary['add_credentials']['count'])
+        self.assertEqual(2, summary['get_credentials']['count'])
+        self.assertEqual(1, summary['get_credentials']['rows'])
+
+    async def test_get_usernames(self):
+        """Usernames are returned in alphabetical order."""
+        await self.model.add_credentials('user1', 'usernameC', 'pass1')
+        await self.model.add_credentials('user2', 'usernameB', 'pass2')
+        await self.model.add_credentials('user3', 'usernameA', 'pass3')
+        self.assertEqual(
+            ['usernameA', 'usernameB', 'usernameC'],
+            await self.model.get_usernames())
+
+    async def test_get_usernames_after_limit(self):
+        """Usernames can be listed in batches."""
+        await self.model.add_credentials('user1', 'usernameC', 'pass1')
+        await self.model.add_credentials('user2', 'usernameB', 'pass2')
+        await self.model.add_credentials('user3', 'usernameA', 'pass3')
+        self.assertEqual(
+            ['usernameB'],
+            await self.model.get_usernames(after='usernameA', limit=1))
+
+    async def test_get_credentials_by_usernames(self):
+        """Credentials for multiple usernames are returned by username."""
+        await self.model.add_credentials('user1', 'username1', 'pass1')
+        await self.model.add_credentials('user2', 'username2', 'pass2')
+        await self.model.add_credentials('user3', 'username3', 'pass3')
+        credentials = await self.model.get_credentials_by_usernames(
+            ['username1', 'username3', 'unknown'])
+        self.assertEqual(['username1', 'username3'], sorted(credentials))
+        self.assertEqual('user1', credentials['username1'].user)
+        self.assertTrue(credentials['username3'].password_match('pass3'))
+
+    async def test_get_credentials_by_usernames_empty(self):
+        """If no username is passed, an empty dict is returned."""
+        await self.model.add_credentials('user', 'username', 'pass')
+        self.assertEqual(
+            {}, await self.model.get_credentials_by_usernames([]))
+
     async def test_get_credentials_by_user(self):
         """Credentials for a user can be retrieved by user."""
         await self.model.add_credentials('user', 'username', 'pass')
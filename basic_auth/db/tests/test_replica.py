@@ -0,0 +1,124 @@
+import asynctest
+
+import fixtures
+
+from ..replica import ReplicaSet
+
+
+class FakeConnection:
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def __aenter__(self):
+        if self.engine.error:
+            raise self.engine.error
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def execute(self, query):
+        self.engine.queries.append(query)
+
+
+class FakeEngine:
+
+    def __init__(self, name):
+        self.name = name
+        self.error = None
+        self.queries = []
+        self.closed = False
+
+    def acquire(self):
+        return FakeConnection(self)
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class ReplicaSetTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.primary = FakeEngine('primary')
+        self.replica1 = FakeEngine('replica1')
+        self.replica2 = FakeEngine('replica2')
+        self.clock = FakeClock()
+        self.replicas = ReplicaSet(
+            self.primary, [self.replica1, self.replica2], loop=self.loop,
+            clock=self.clock)
+
+    def test_engine_round_robin(self):
+        """Replicas are returned in turn."""
+        engines = [self.replicas.engine() for _ in range(4)]
+        self.assertEqual(
+            [self.replica2, self.replica1, self.replica2, self.replica1],
+            engines)
+
+    def test_engine_no_replicas(self):
+        """If there are no replicas, the primary is returned."""
+        replicas = ReplicaSet(self.primary, [], loop=self.loop)
+        self.assertIs(self.primary, replicas.engine())
+
+    async def test_check(self):
+        """Replicas are pinged, only healthy ones are returned."""
+        self.replica1.error = OSError('down')
+        await self.replicas.check()
+        self.assertEqual(['SELECT 1'], self.replica2.queries)
+        self.assertEqual([self.replica2], self.replicas.healthy)
+        self.assertIs(self.replica2, self.replicas.engine())
+        self.assertIs(self.replica2, self.replicas.engine())
+        self.assertIn(
+            'healthy database replicas: 1/2', self.logger.output)
+
+    async def test_check_recovered(self):
+        """Replicas are used again when they recover."""
+        self.replica1.error = OSError('down')
+        await self.replicas.check()
+        self.replica1.error = None
+        await self.replicas.check()
+        self.assertEqual(
+            [self.replica1, self.replica2], self.replicas.healthy)
+
+    async def test_check_all_failed(self):
+        """If all replicas fail, the primary is returned."""
+        self.replica1.error = OSError('down')
+        self.replica2.error = OSError('down')
+        await self.replicas.check()
+        self.assertIs(self.primary, self.replicas.engine())
+
+    def test_read_your_writes(self):
+        """The primary is returned for a while after a write."""
+        self.replicas.read_your_writes = 10
+        self.replicas.mark_write()
+        self.assertIs(self.primary, self.replicas.engine())
+        self.clock.now = 10
+        self.assertIs(self.replica2, self.replicas.engine())
+
+    def test_read_your_writes_disabled(self):
+        """By default, replicas are used after a write."""
+        self.replicas.mark_write()
+        self.assertIs(self.replica2, self.replicas.engine())
+
+    async def test_close(self):
+        """Replica engines are closed."""
+        await self.replicas.close()
+        self.assertTrue(self.replica1.closed)
+        self.assertTrue(self.replica2.closed)
+        self.assertFalse(self.primary.closed)
@@ -0,0 +1,229 @@
+import asyncio
+from datetime import datetime
+
+import asynctest
+
+import fixtures
+
+from sqlalchemy.exc import OperationalError
+
+from ..model import Model
+from ..sqlite_engine import create_engine
+from ..testing import ensure_database
+from ..warmup import warm_up_engine
+from ...collection import DataBaseCredentialsCollection
+from ...credential import hash_token256
+
+
+class CreateEngineTest(asynctest.TestCase):
+
+    forbid_get_event_loop = True
+
+    async def test_not_sqlite(self):
+        """An error is raised if the DSN is not for SQLite."""
+        with self.assertRaises(ValueError) as context:
+            await create_engine('postgresql:///basic-auth', loop=self.loop)
+        self.assertEqual(
+            'Invalid DSN for SQLite, must be a database file URL: '
+            'postgresql:///basic-auth',
+            str(context.exception))
+
+    async def test_memory(self):
+        """In-memory databases are not supported."""
+        with self.assertRaises(ValueError):
+            await create_engine('sqlite://', loop=self.loop)
+
+
+class SqliteEngineTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    async def setUp(self):
+        super().setUp()
+        path = self.useFixture(fixtures.TempDir()).join('basic-auth.db')
+        self.dsn = 'sqlite:///' + path
+        ensure_database(dsn=self.dsn)
+        self.engine = await create_engine(
+            self.dsn, minsize=2, maxsize=3, loop=self.loop)
+        self.addCleanup(self.engine.wait_closed)
+        self.addCleanup(self.engine.close)
+
+    async def add_credentials(self, user, username, password):
+        async with self.engine.acquire() as conn:
+            async with conn.begin():
+                await Model(conn).add_credentials(user, username, password)
+
+    async def test_pool_size(self):
+        """The minimum number of reader connections is opened."""
+        self.assertEqual(2, self.engine.minsize)
+        self.assertEqual(3, self.engine.maxsize)
+        self.assertEqual(2, self.engine.size)
+        self.assertEqual(2, self.engine.freesize)
+
+    async def test_wal_mode(self):
+        """The database is in WAL mode."""
+        async with self.engine.acquire() as conn:
+            result = await conn.execute('PRAGMA journal_mode')
+            row = await result.fetchone()
+        self.assertEqual('wal', row[0])
+
+    async def test_model(self):
+        """Model queries run on SQLite connections."""
+        async with self.engine.acquire() as conn:
+            async with conn.begin():
+                model = Model(conn)
+                await model.add_credentials('user', 'username', 'pass')
+                self.assertTrue(await model.is_known_user('user'))
+                credentials = await model.get_credentials(username='username')
+                self.assertEqual('user', credentials.user)
+                self.assertEqual(
+                    hash_token256('pass'), credentials.auth.password)
+                self.assertTrue(
+                    await model.update_credentials('user', 'username', 'new'))
+                self.assertTrue(await model.remove_credentials('user'))
+                self.assertFalse(await model.is_known_user('user'))
+
+    async def test_get_credentials_by_usernames(self):
+        """Credentials are looked up in chunks of usernames."""
+        await self.add_credentials('user', 'username', 'pass')
+        usernames = ['other{}'.format(index) for index in range(1000)]
+        usernames.append('username')
+        async with self.engine.acquire() as conn:
+            credentials = await Model(conn).get_credentials_by_usernames(
+                usernames)
+        self.assertEqual(['username'], list(credentials))
+        self.assertEqual('user', credentials['username'].user)
+
+    async def test_record_credentials_usage(self):
+        """The latest use time is kept, and use counts are added."""
+        await self.add_credentials('user1', 'username1', 'pass')
+        await self.add_credentials('user2', 'username2', 'pass')
+        time1 = datetime(2018, 5, 1, 10, 0, 0)
+        time2 = datetime(2018, 5, 2, 10, 0, 0)
+        async with self.engine.acquire() as conn:
+            model = Model(conn)
+            await model.record_credentials_usage(
+                [{'username': 'username1', 'last_used': time2,
+                  'use_count': 2},
+                 {'username': 'username2', 'last_used': time1,
+                  'use_count': 1}])
+            await model.record_credentials_usage(
+                [{'username': 'username1', 'last_used': time1,
+                  'use_count': 3}])
+            result = await conn.execute(
+                'SELECT username, last_used, use_count FROM credentials '
+                'ORDER BY username')
+            rows = [tuple(row) for row in await result.fetchall()]
+        self.assertEqual(
+            [('username1', str(time2) + '.000000', 5),
+             ('username2', str(time1) + '.000000', 1)],
+            rows)
+
+    async def test_rollback(self):
+        """Changes are rolled back if the transaction fails."""
+        with self.assertRaises(RuntimeError):
+            async with self.engine.acquire() as conn:
+                async with conn.begin():
+                    await Model(conn).add_credentials(
+                        'user', 'username', 'pass')
+                    raise RuntimeError('fail')
+        async with self.engine.acquire() as conn:
+            self.assertFalse(await Model(conn).is_known_user('user'))
+
+    async def test_read_only_transaction(self):
+        """Read-only transactions run on a reader connection."""
+        async with self.engine.acquire() as conn:
+            async with conn.begin():
+                await conn.execute(
+                    'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ '
+                    'READ ONLY')
+                model = Model(conn)
+                self.assertFalse(await model.is_known_user('user'))
+                self.assertEqual(1, self.engine.freesize)
+                with self.assertRaises(OperationalError):
+                    await model.add_credentials('user', 'username', 'pass')
+        self.assertEqual(2, self.engine.freesize)
+
+    async def test_read_only_snapshot(self):
+        """Readers see a snapshot of the database, while writes happen."""
+        await self.add_credentials('user1', 'username1', 'pass')
+        async with self.engine.acquire() as conn:
+            async with conn.begin():
+                await conn.execute('SET TRANSACTION READ ONLY')
+                model = Model(conn)
+                self.assertEqual(
+                    ['username1'], await model.get_usernames())
+                await self.add_credentials('user2', 'username2', 'pass')
+                self.assertEqual(
+                    ['username1'], await model.get_usernames())
+        async with self.engine.acquire() as conn:
+            self.assertEqual(
+                ['username1', 'username2'],
+                await Model(conn).get_usernames())
+
+    async def test_readers_pool_max_size(self):
+        """No more than the maximum number of readers are opened."""
+        started = []
+        release = asyncio.Event(loop=self.loop)
+
+        async def read():
+            async with self.engine.acquire() as conn:
+                async with conn.begin():
+                    await conn.execute('SET TRANSACTION READ ONLY')
+                    await Model(conn).is_known_user('user')
+                    started.append(True)
+                    await release.wait()
+
+        tasks = [
+            asyncio.ensure_future(read(), loop=self.loop) for _ in range(4)]
+        while len(started) < 3:
+            await asyncio.sleep(0.01, loop=self.loop)
+        self.assertEqual(3, self.engine.size)
+        self.assertEqual(0, self.engine.freesize)
+        release.set()
+        await asyncio.gather(*tasks, loop=self.loop)
+        self.assertEqual(4, len(started))
+        self.assertEqual(3, self.engine.freesize)
+
+    async def test_warm_up_engine(self):
+        """Warm-up primes reader connections, without waiting for writes."""
+        async with self.engine.acquire() as conn:
+            async with conn.begin():
+                await Model(conn).add_credentials('user', 'username', 'pass')
+                warmed_up = await asyncio.wait_for(
+                    warm_up_engine(self.engine, loop=self.loop), 5,
+                    loop=self.loop)
+        self.assertEqual(2, warmed_up)
+        self.assertEqual(2, self.engine.size)
+        self.assertEqual(2, self.engine.freesize)
+
+    async def test_writes_serialized(self):
+        """Write transactions run one at a time on the writer."""
+        events = []
+
+        async def write(user):
+            async with self.engine.acquire() as conn:
+                async with conn.begin():
+                    await Model(conn).add_credentials(user, user, 'pass')
+                    events.append(('start', user))
+                    await asyncio.sleep(0.01, loop=self.loop)
+                    events.append(('end', user))
+
+        await asyncio.gather(write('user1'), write('user2'), loop=self.loop)
+        # Transactions don't interleave, whichever runs first.
+        first, second = events[0][1], events[2][1]
+        self.assertEqual({'user1', 'user2'}, {first, second})
+        self.assertEqual(
+            [('start', first), ('end', first),
+             ('start', second), ('end', second)],
+            events)
+
+    async def test_collection(self):
+        """The database collection works with a SQLite engine."""
+        collection = DataBaseCredentialsCollection(self.engine, loop=self.loop)
+        _, details = await collection.create({'user': 'user'})
+        username, password = details['token'].split(':')
+        self.assertTrue(
+            await collection.credentials_match(username, password))
+        self.assertFalse(
+            await collection.credentials_match(username, 'wrong'))
@@ -0,0 +1,74 @@
+import unittest
+
+import fixtures
+
+from ..schema import CREDENTIALS
+from ..stats import (
+    QueryStats,
+    redacted_query,
+)
+
+
+class QueryStatsTest(fixtures.TestWithFixtures):
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.stats = QueryStats(slow_threshold=0.5, window=100)
+
+    def test_summary(self):
+        """Statistics are returned by shape."""
+        self.stats.record('get_credentials', 'SELECT 1', 0.001, 1)
+        self.stats.record('get_credentials', 'SELECT 1', 0.003, 0)
+        self.stats.record('remove_credentials', 'DELETE', 0.002, 2)
+        self.assertEqual(
+            {'get_credentials': {
+                'count': 2, 'total': 4.0, 'mean': 2.0, 'p99': 3.0,
+                'rows': 1, 'slow': 0},
+             'remove_credentials': {
+                 'count': 1, 'total': 2.0, 'mean': 2.0, 'p99': 2.0,
+                 'rows': 2, 'slow': 0}},
+            self.stats.summary())
+
+    def test_summary_p99(self):
+        """The 99th percentile is computed over recent queries."""
+        for index in range(200):
+            self.stats.record('get_credentials', 'SELECT 1', index / 1000, 1)
+        summary = self.stats.summary()['get_credentials']
+        self.assertEqual(200, summary['count'])
+        self.assertEqual(198.0, summary['p99'])
+
+    def test_record_no_shape(self):
+        """Queries without shape are recorded as "other"."""
+        self.stats.record(None, 'SELECT 1', 0.001, None)
+        self.assertEqual(['other'], list(self.stats.summary()))
+
+    def test_slow_query(self):
+        """Slow queries are counted and logged."""
+        self.stats.record('get_credentials', 'SELECT 1', 0.6, 1)
+        self.assertEqual(1, self.stats.summary()['get_credentials']['slow'])
+        self.assertIn(
+            'slow query get_credentials (0.600s): SELECT 1',
+            self.logger.output)
+
+    def test_slow_query_disabled(self):
+        """Without threshold, slow queries are not logged."""
+        stats = QueryStats()
+        stats.record('get_credentials', 'SELECT 1', 10, 1)
+        self.assertEqual('', self.logger.output)
+
+
+class RedactedQueryTest(unittest.TestCase):
+
+    def test_redacted(self):
+        """Parameter values are not included."""
+        query = CREDENTIALS.select().where(
+            CREDENTIALS.c.username == 'secret')
+        redacted = redacted_query(query)
+        self.assertNotIn('secret', redacted)
+        self.assertTrue(redacted.startswith('SELECT credentials.id'))
+        self.assertTrue(redacted.endswith('[username_1=<redacted>]'))
+
+    def test_text(self):
+        """Plain text queries are returned as is."""
+        self.assertEqual('SELECT 1', redacted_query('SELECT 1'))
@@ -0,0 +1,32 @@
+from aiopg.sa import create_engine
+
+from ..testing import (
+    TEST_DB_DSN,
+    DataBaseTest,
+)
+from ..warmup import (
+    prime_queries,
+    warm_up_engine,
+)
+
+
+class PrimeQueriesTest(DataBaseTest):
+
+    async def test_prime_queries(self):
+        """Queries are run in a transaction, which is then committed."""
+        async with self.engine.acquire() as conn:
+            await prime_queries(conn)
+            self.assertFalse(conn.in_transaction)
+
+
+class WarmUpEngineTest(DataBaseTest):
+
+    async def test_warm_up_engine(self):
+        """The minimum number of connections are opened and primed."""
+        engine = await create_engine(
+            dsn=TEST_DB_DSN, minsize=3, maxsize=5, loop=self.loop)
+        self.addCleanup(engine.wait_closed)
+        self.addCleanup(engine.terminate)
+        self.assertEqual(3, await warm_up_engine(engine, loop=self.loop))
+        self.assertEqual(3, engine.size)
+        self.assertEqual(3, engine.freesize)
@@ -1,30 +1,82 @@
 """Database transaction helpers."""
 
+import asyncio
+
+import psycopg2
+
+from .. import timing
 from .model import Model
 
 from functools import wraps
 
 
+# Errors raised when the database can't be reached or is too slow.
+UNAVAILABLE_ERRORS = (
+    OSError, asyncio.TimeoutError, psycopg2.OperationalError,
+    psycopg2.InterfaceError)
+
+
 def transact(meth):
     """Decorator to execute a class method in method in a transaction.
 
     The class decorated method belongs to must have an "engine" attribute with
-    the database engine.
+    the database engine. If it also has a non-None "breaker" attribute, the
+    transaction is run through that CircuitBreaker, and if it has a
+    "query_stats" attribute, queries are recorded in that QueryStats.
 
     The wrapped function must accept a Model instance as first argument.
 
     """
     @wraps(meth)
     async def wrapper(oself, *args, **kwargs):
-        engine = oself.engine
+        return await _call(
+            oself, oself.engine,
+            'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ',
+            meth, args, kwargs)
+
+    return wrapper
+
+
+def read_transact(meth):
+    """Decorator to execute a read-only class method in a transaction.
+
+    This works like transact, except that the engine is returned by the
+    "read_engine" method of the class, so that reads can be served by
+    replicas.
+
+    """
+    @wraps(meth)
+    async def wrapper(oself, *args, **kwargs):
+        return await _call(
+            oself, oself.read_engine(),
+            'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY',
+            meth, args, kwargs)
 
+    return wrapper
+
+
+async def _call(oself, engine, set_transaction, meth, args, kwargs):
+    """Call a method in a transaction, through the breaker if present."""
+
+    async def run():
+        stopwatch = timing.stopwatch()
         async with engine.acquire() as conn:
+            stopwatch.lap('db-acquire')
             async with conn.begin():
-                await conn.execute(
-                    'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
-                return await meth(oself, Model(conn), *args, **kwargs)
+                await conn.execute(set_transaction)
+                stopwatch.lap('db-begin')
+                model = Model(
+                    conn, stats=getattr(oself, 'query_stats', None))
+                result = await meth(oself, model, *args, **kwargs)
+                # Model methods are timed separately.
+                stopwatch.lap()
+            stopwatch.lap('db-commit')
+        return result
 
-    return wrapper
+    breaker = getattr(oself, 'breaker', None)
+    if breaker is None:
+        return await run()
+    return await breaker.call(run)
 
 
 async def run_in_transaction(engine, model_method, *args, **kwargs):
@@ -0,0 +1,45 @@
+"""Warm-up of database connections at startup."""
+
+import asyncio
+
+from .model import Model
+
+
+# A value that never matches stored usernames, used to prime queries without
+# fetching actual rows.
+_NO_MATCH = '-'
+
+
+async def prime_queries(conn):
+    """Run queries from the request hot paths once on a connection.
+
+    Queries run in a read-only transaction, as with read_transact, so that
+    with SQLite they run on reader connections.
+
+    """
+    async with conn.begin():
+        await conn.execute(
+            'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        model = Model(conn)
+        await model.get_credentials(username=_NO_MATCH)
+        await model.get_credentials(user=_NO_MATCH)
+        await model.is_known_user(_NO_MATCH)
+        await model.get_api_credentials(_NO_MATCH)
+
+
+async def warm_up_engine(engine, loop=None):
+    """Open the minimum number of connections and prime queries on each.
+
+    All connections are acquired concurrently before queries are run, so that
+    each one is primed. Return the number of connections.
+
+    """
+    conns = await asyncio.gather(
+        *(engine.acquire() for _ in range(engine.minsize)), loop=loop)
+    try:
+        await asyncio.gather(
+            *(prime_queries(conn) for conn in conns), loop=loop)
+    finally:
+        for conn in conns:
+            engine.release(conn)
+    return len(conns)
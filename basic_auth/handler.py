@@ -3,8 +3,65 @@
 from aiohttp import web
 
 from . import __doc__ as description
+from .profiler import ProfilerBusy
+
+
+# Maximum duration in seconds for profiles requested through the API.
+MAX_PROFILE_DURATION = 300
 
 
 async def root(request):
     """Base resource."""
     return web.Response(text=description)
+
+
+async def live(request):
+    """Liveness probe, succeeding as long as the service responds."""
+    return web.json_response({'status': 'ok'})
+
+
+async def ready(request):
+    """Readiness probe, based on health state tracked in background."""
+    status = request.app['health'].status()
+    return web.json_response(
+        status, status=200 if status['ready'] else 503)
+
+
+async def query_stats(request):
+    """Return database query statistics, if enabled."""
+    stats = request.app.get('query-stats')
+    if stats is None:
+        raise web.HTTPNotFound()
+    return web.json_response(stats.summary())
+
+
+async def loop_lag(request):
+    """Return event loop lag statistics, if enabled."""
+    monitor = request.app.get('loop-lag')
+    if monitor is None:
+        raise web.HTTPNotFound()
+    return web.json_response(monitor.summary())
+
+
+async def profile(request):
+    """Profile the server, returning collapsed stacks.
+
+    The duration in seconds is passed as "duration" query parameter.
+
+    """
+    profiler = request.app.get('profiler')
+    if profiler is None:
+        raise web.HTTPNotFound()
+    try:
+        duration = float(request.query.get('duration', profiler.duration))
+    except ValueError:
+        raise web.HTTPBadRequest(text='Invalid duration')
+    if not 0 < duration <= MAX_PROFILE_DURATION:
+        raise web.HTTPBadRequest(
+            text='Duration must be at most {} seconds'.format(
+                MAX_PROFILE_DURATION))
+    try:
+        stacks = await profiler.profile(duration)
+    except ProfilerBusy as error:
+        raise web.HTTPConflict(text=str(error))
+    return web.Response(text=stacks)
@@ -0,0 +1,115 @@
+"""Service health tracking for liveness and readiness probes."""
+
+import asyncio
+import logging
+import time
+
+from .periodic import PeriodicTask
+
+
+class HealthMonitor:
+    """Track service health in background, for probes served from memory.
+
+    The database is pinged periodically, and components that need warming up
+    (such as caches) are registered with require() and reported as ready
+    through mark_warm(). The service is ready once the last database ping
+    succeeded recently enough, the connection pool holds its minimum number
+    of connections, and all required components are warm.
+
+    """
+
+    def __init__(self, engine=None, interval=5, timeout=2, loop=None,
+                 clock=time.monotonic):
+        self.engine = engine
+        self.interval = interval
+        self.timeout = timeout
+        self.loop = loop
+        self._clock = clock
+        self._components = {}
+        self._last_ping = None
+        self._ping_error = None
+        self._task = PeriodicTask(self.check_db, interval, loop=loop)
+
+    def require(self, name):
+        """Require a component to be warm for the service to be ready."""
+        self._components.setdefault(name, False)
+
+    def mark_warm(self, name):
+        """Mark a component as warm."""
+        self._components[name] = True
+
+    async def start(self):
+        """Check the database and start checking it periodically."""
+        await self.check_db()
+        self._task.start()
+
+    async def stop(self):
+        """Stop checking the database."""
+        await self._task.stop()
+
+    async def check_db(self):
+        """Ping the database, recording the result."""
+        if self.engine is None:
+            return
+        try:
+            await asyncio.wait_for(
+                self._ping(), self.timeout, loop=self.loop)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            if self._ping_error is None:
+                logging.getLogger().warning(
+                    'database health check failed: {!r}'.format(error))
+            self._ping_error = repr(error)
+        else:
+            if self._ping_error is not None:
+                logging.getLogger().info('database health check succeeded')
+            self._last_ping = self._clock()
+            self._ping_error = None
+
+    async def _ping(self):
+        async with self.engine.acquire() as conn:
+            await conn.execute('SELECT 1')
+
+    @property
+    def db_ok(self):
+        """Whether the last database ping succeeded recently enough."""
+        if self.engine is None:
+            return True
+        if self._last_ping is None or self._ping_error is not None:
+            return False
+        # Ping results are stale if periodic checks got stuck.
+        return self._clock() - self._last_ping <= 3 * self.interval
+
+    @property
+    def pool_ok(self):
+        """Whether the connection pool holds its minimum connections."""
+        if self.engine is None:
+            return True
+        return self.engine.size >= self.engine.minsize
+
+    @property
+    def ready(self):
+        """Whether the service is ready to serve requests."""
+        return (
+            self.db_ok and self.pool_ok and all(self._components.values()))
+
+    def status(self):
+        """Return a dict with details about the service health."""
+        status = {
+            'ready': self.ready,
+            'components': dict(self._components)}
+        if self.engine is not None:
+            status['db'] = {
+                'ok': self.db_ok,
+                'error': self._ping_error,
+                'last-ping-age': (
+                    None if self._last_ping is None
+                    else round(self._clock() - self._last_ping, 3))}
+            status['pool'] = {
+                'ok': self.pool_ok,
+                'size': self.engine.size,
+                'free': self.engine.freesize,
+                'min': self.engine.minsize,
+                'max': self.engine.maxsize}
+        return status
@@ -0,0 +1,149 @@
+"""Listening sockets for the HTTP server."""
+
+import os
+import socket
+import stat
+
+
+# First file descriptor for sockets passed by systemd socket activation.
+SD_LISTEN_FDS_START = 3
+
+# Environment variable with file descriptors of sockets passed by a parent
+# process on reload.
+LISTEN_FDS_ENV = 'BASIC_AUTH_LISTEN_FDS'
+
+
+class ListenError(Exception):
+    """Listening sockets can't be set up."""
+
+
+def tcp_sockets(host, port):
+    """Return sockets bound to the address and port.
+
+    A socket is returned for each address the host resolves to.
+
+    """
+    infos = socket.getaddrinfo(
+        host, port, family=socket.AF_UNSPEC, type=socket.SOCK_STREAM,
+        flags=socket.AI_PASSIVE)
+    sockets = []
+    try:
+        for family, type_, proto, _, address in infos:
+            sock = socket.socket(family, type_, proto)
+            sockets.append(sock)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if family == socket.AF_INET6:
+                # Don't conflict with IPv4 sockets for the same port.
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+            sock.bind(address)
+    except OSError:
+        for sock in sockets:
+            sock.close()
+        raise
+    return sockets
+
+
+def unix_socket(path, mode=None):
+    """Return a socket bound to the Unix socket path.
+
+    A stale socket file at path is removed. If mode is specified, permissions
+    of the socket file are changed accordingly.
+
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        if mode is not None:
+            os.chmod(path, mode)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def systemd_sockets(environ=None, start=SD_LISTEN_FDS_START):
+    """Return sockets passed by systemd socket activation.
+
+    The LISTEN_FDS and LISTEN_PID variables are removed from the environment,
+    so that they're not inherited by child processes.
+
+    """
+    if environ is None:
+        environ = os.environ
+    pid = environ.pop('LISTEN_PID', None)
+    count = environ.pop('LISTEN_FDS', None)
+    environ.pop('LISTEN_FDNAMES', None)
+    if pid != str(os.getpid()) or not count:
+        return []
+    return [socket_from_fd(fd) for fd in range(start, start + int(count))]
+
+
+def inherited_sockets(environ=None):
+    """Return sockets passed by the parent process on reload.
+
+    The variable listing descriptors is removed from the environment.
+
+    """
+    if environ is None:
+        environ = os.environ
+    fds = environ.pop(LISTEN_FDS_ENV, '')
+    return [socket_from_fd(int(fd)) for fd in fds.split(',') if fd]
+
+
+def socket_from_fd(fd):
+    """Return a socket object for a stream socket file descriptor."""
+    # The address family is not detected from the descriptor before Python
+    # 3.7, so it's inferred from the socket address format.
+    with socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM) as probe:
+        address = probe.getsockname()
+    if isinstance(address, (str, bytes)):
+        family = socket.AF_UNIX
+    elif len(address) == 4:
+        family = socket.AF_INET6
+    else:
+        family = socket.AF_INET
+    return socket.socket(family, socket.SOCK_STREAM, fileno=fd)
+
+
+def create_sockets(conf, environ=None):
+    """Return listening sockets for the service, based on config.
+
+    TCP sockets are created for app.host addresses (all interfaces by
+    default) on app.port, unless only other kinds of listeners are
+    configured. Unix sockets are created for app.unix-socket paths, and
+    sockets passed by systemd are used if app.systemd-socket is true.
+
+    """
+    hosts = _as_list(conf.get(('app', 'host')))
+    port = conf.get(('app', 'port'))
+    paths = _as_list(conf.get(('app', 'unix-socket')))
+    mode = conf.get(('app', 'unix-socket-mode'))
+    if isinstance(mode, str):
+        mode = int(mode, 8)
+    use_systemd = conf.get(('app', 'systemd-socket'), False)
+
+    sockets = []
+    if use_systemd:
+        sockets.extend(systemd_sockets(environ=environ))
+        if not sockets:
+            raise ListenError('No sockets passed by systemd')
+    for path in paths:
+        sockets.append(unix_socket(path, mode=mode))
+    if hosts or port or not (paths or use_systemd):
+        for host in hosts or ['0.0.0.0']:
+            sockets.extend(tcp_sockets(host, port or 8080))
+    return sockets
+
+
+def _as_list(value):
+    """Return a list from a config value which can be a single item."""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
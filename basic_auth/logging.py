@@ -1,8 +1,13 @@
 """Logging helpers."""
 
+import random
 import sys
 import logging
 
+from aiohttp.helpers import AccessLogger
+
+from .timing import REQUEST_TIMINGS
+
 
 def setup_logging(log_stream=sys.stdout):
     """Set up the logging loggers and handlers.
@@ -36,3 +41,60 @@ def setup_logging(log_stream=sys.stdout):
     access_handler.setFormatter(formatter)
     access.addHandler(access_handler)
     access.propagate = False
+
+
+# Application key for the fraction of requests to log in the access log.
+ACCESS_LOG_SAMPLE_RATE = 'access-log-sample-rate'
+
+
+class SampledAccessLogger(AccessLogger):
+    """Access logger sampling requests by application.
+
+    The sample rate is taken from the ACCESS_LOG_SAMPLE_RATE key of the
+    innermost application handling the request that sets it, as a number
+    between 0 (no logging) and 1 (log all requests, the default). Server
+    errors are always logged.
+
+    If the request is timed, phase durations are appended to the message and
+    passed in the "timings" extra field of the log record.
+
+    """
+
+    random = random.random
+
+    def log(self, request, response, time):
+        if response.status < 500:
+            rate = self._sample_rate(request)
+            if rate <= 0 or (rate < 1 and self.random() >= rate):
+                return
+        timings = None
+        if request is not None:
+            timings = request.get(REQUEST_TIMINGS)
+        if timings is None:
+            super().log(request, response, time)
+        else:
+            self._log_timings(request, response, time, timings)
+
+    def _log_timings(self, request, response, time, timings):
+        """Log a request along with its timings."""
+        try:
+            values = []
+            extra = {'timings': timings.as_dict()}
+            for key, value in self._format_line(request, response, time):
+                values.append(value)
+                if key.__class__ is str:
+                    extra[key] = value
+                else:
+                    extra[key[0]] = {key[1]: value}
+            message = '{} timings="{}"'.format(
+                self._log_format % tuple(values), timings.header())
+            self.logger.info(message, extra=extra)
+        except Exception:
+            self.logger.exception('Error in logging')
+
+    def _sample_rate(self, request):
+        for app in reversed(request.match_info.apps):
+            rate = app.get(ACCESS_LOG_SAMPLE_RATE)
+            if rate is not None:
+                return rate
+        return 1
@@ -0,0 +1,159 @@
+"""Monitoring of event loop lag, with detection of blocking calls."""
+
+import asyncio
+from collections import (
+    deque,
+    OrderedDict,
+)
+from datetime import datetime
+import logging
+import sys
+import threading
+import time
+import traceback
+
+
+# Upper bounds of histogram buckets, in milliseconds.
+LAG_BUCKETS = (1, 5, 10, 50, 100, 500, 1000)
+
+
+class LagHistogram:
+    """Histogram of event loop scheduling delays."""
+
+    def __init__(self, buckets=LAG_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, lag):
+        """Record a delay in seconds."""
+        lag_ms = lag * 1000
+        for index, bound in enumerate(self.buckets):
+            if lag_ms <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += lag
+        self.max = max(self.max, lag)
+
+    def summary(self):
+        """Return a dict with the histogram, times in milliseconds."""
+        buckets = OrderedDict(
+            (str(bound), count)
+            for bound, count in zip(self.buckets, self.counts))
+        buckets['+Inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'mean': _ms(self.total / self.count) if self.count else 0,
+            'max': _ms(self.max),
+            'buckets': buckets}
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop runs scheduled callbacks.
+
+    A probe task sleeps for `interval` seconds in a loop, recording in a
+    histogram how much later than expected it wakes up. Lag is caused by
+    callbacks running synchronous code for a long time, which stalls all
+    other requests.
+
+    Since the probe can only measure lag once the blocking call has
+    returned, a watchdog thread checks that the probe keeps running. If it
+    doesn't wake up within `threshold` seconds from the expected time, the
+    stack of the event loop thread (thus of the blocking call) is captured
+    and logged. The last `max_blocked` captured stacks are kept, along with
+    the lag they caused once the probe wakes up.
+
+    """
+
+    def __init__(self, interval=0.1, threshold=0.1, max_blocked=10,
+                 loop=None):
+        self.interval = interval
+        self.threshold = threshold
+        self.loop = loop
+        self.histogram = LagHistogram()
+        self.blocked = deque(maxlen=max_blocked)
+        self._expected = None
+        self._last_blocked = None
+        self._thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start monitoring, from the event loop thread."""
+        self._thread_id = threading.get_ident()
+        self._expected = time.monotonic() + self.interval
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._probe(), loop=self.loop)
+        self._watchdog = threading.Thread(
+            target=self._watch, name='loop-lag-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        """Stop monitoring."""
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._watchdog.join()
+
+    def summary(self):
+        """Return a dict with lag statistics and blocking calls."""
+        summary = self.histogram.summary()
+        summary['blocked'] = list(self.blocked)
+        return summary
+
+    async def _probe(self):
+        while True:
+            self._expected = expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval, loop=self.loop)
+            lag = max(0, time.monotonic() - expected)
+            self.histogram.record(lag)
+            if lag >= self.threshold:
+                self._report_lag(expected, lag)
+
+    def _report_lag(self, expected, lag):
+        if self._last_blocked is not None:
+            blocked_expected, entry = self._last_blocked
+            if blocked_expected == expected:
+                entry['lag'] = _ms(lag)
+        logging.getLogger().warning(
+            'event loop lagged {:.3f}s'.format(lag))
+
+    def _watch(self):
+        captured = None
+        while not self._stopped.wait(self.threshold / 2):
+            expected = self._expected
+            if (expected == captured or
+                    time.monotonic() - expected < self.threshold):
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            captured = expected
+            self._capture(expected, traceback.format_stack(frame))
+
+    def _capture(self, expected, stack):
+        entry = {
+            'time': datetime.utcnow().isoformat(),
+            'lag': None,
+            'stack': [line.rstrip() for line in stack]}
+        self.blocked.append(entry)
+        self._last_blocked = (expected, entry)
+        logging.getLogger().warning(
+            'event loop blocked for more than {}s in:\n{}'.format(
+                self.threshold, ''.join(stack).rstrip()))
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
@@ -1,16 +1,33 @@
 """AioHTTP middlewares."""
 
+import math
+
 from aiohttp import (
     web,
     BasicAuth,
 )
 
+from . import timing
+from .breaker import CircuitOpen
+from .throttle import Throttled
+
 
 class BaseBasicAuthMiddlewareFactory:
-    """A middleware for handling Basic Authorization."""
+    """A middleware for handling Basic Authorization.
+
+    If an AuthThrottle is passed, failed attempts are throttled by username
+    and client address. Throttled requests are refused with the
+    throttle_status HTTP status, without checking credentials.
+
+    If credentials can't be checked since a circuit breaker is open, requests
+    are refused with a 503 status.
+
+    """
 
-    def __init__(self, realm):
+    def __init__(self, realm, throttle=None, throttle_status=401):
         self.realm = realm
+        self.throttle = throttle
+        self.throttle_status = throttle_status
 
     async def is_valid_auth(self, user, password):
         """Return whether the basic-authorization si valid.
@@ -23,7 +40,15 @@ class BaseBasicAuthMiddlewareFactory:
         """Return the middleware handler."""
 
         async def middleware_handler(request):
-            if not await self._validate_auth(request):
+            try:
+                valid = await self._validate_auth(request)
+            except Throttled as error:
+                return self._throttled_response(error)
+            except CircuitOpen as error:
+                return web.HTTPServiceUnavailable(
+                    headers={
+                        'Retry-After': str(math.ceil(error.retry_after))})
+            if not valid:
                 headers = {
                     'WWW-Authenticate': 'Basic realm="{}"'.format(self.realm)}
                 return web.HTTPUnauthorized(headers=headers)
@@ -39,7 +64,25 @@ class BaseBasicAuthMiddlewareFactory:
             return False
 
         auth = BasicAuth.decode(basic_auth)
-        return await self.is_valid_auth(auth.login, auth.password)
+        if self.throttle is None:
+            with timing.timed('auth'):
+                return await self.is_valid_auth(auth.login, auth.password)
+
+        client = self.throttle.client(request)
+        self.throttle.check(auth.login, client)
+        with timing.timed('auth'):
+            valid = await self.is_valid_auth(auth.login, auth.password)
+        if not valid:
+            self.throttle.failed(auth.login, client)
+        return valid
+
+    def _throttled_response(self, error):
+        """Return the response for a throttled request."""
+        headers = {'Retry-After': str(math.ceil(error.retry_after))}
+        if self.throttle_status == 429:
+            return web.HTTPTooManyRequests(headers=headers)
+        headers['WWW-Authenticate'] = 'Basic realm="{}"'.format(self.realm)
+        return web.HTTPUnauthorized(headers=headers)
 
 
 class BasicAuthMiddlewareFactory(BaseBasicAuthMiddlewareFactory):
@@ -51,8 +94,8 @@ class BasicAuthMiddlewareFactory(BaseBasicAuthMiddlewareFactory):
 
     """
 
-    def __init__(self, realm, checker):
-        super().__init__(realm)
+    def __init__(self, realm, checker, **kwargs):
+        super().__init__(realm, **kwargs)
         self.checker = checker
 
     async def is_valid_auth(self, user, password):
@@ -0,0 +1,51 @@
+"""Helpers for running periodic background tasks."""
+
+import asyncio
+import logging
+
+
+class PeriodicTask:
+    """Call a coroutine function periodically in the background.
+
+    Errors raised by the function are logged, and don't stop following calls.
+
+    """
+
+    def __init__(self, func, interval, loop=None):
+        self.func = func
+        self.interval = interval
+        self.loop = loop
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start calling the function in the background."""
+        if self.running:
+            return
+        self._task = asyncio.ensure_future(self._run(), loop=self.loop)
+
+    async def stop(self):
+        """Stop calling the function, waiting for the task to finish."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval, loop=self.loop)
+            try:
+                await self.func()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.getLogger().exception(
+                    'Periodic call to {} failed'.format(
+                        getattr(self.func, '__qualname__', self.func)))
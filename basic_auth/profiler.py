@@ -0,0 +1,146 @@
+"""On-demand sampling profiler for the running server."""
+
+import asyncio
+from collections import Counter
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+class ProfilerBusy(Exception):
+    """A profile is already running."""
+
+
+class StackSampler:
+    """Sample stacks of a thread at regular intervals.
+
+    Sampling runs in a separate thread, which looks at the current frame of
+    the profiled one through sys._current_frames(), so it doesn't depend on
+    the profiled code or on the event loop implementation. Stacks are
+    aggregated as they're collected, in collapsed format (as used by flame
+    graph tools): frames from the outermost, separated by semicolons.
+
+    """
+
+    def __init__(self, thread_id, interval=0.01):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sampling in background."""
+        self._thread = threading.Thread(
+            target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, waiting for the sampling thread to finish."""
+        self._stopped.set()
+        self._thread.join()
+
+    def sample(self):
+        """Record the current stack of the profiled thread."""
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        self._stacks[collapse_stack(frame)] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        """Return collected stacks in collapsed format, one per line."""
+        return ''.join(
+            '{} {}\n'.format(stack, count)
+            for stack, count in self._stacks.most_common())
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+
+def collapse_stack(frame):
+    """Return a stack as a string of frames from the outermost."""
+    frames = []
+    while frame is not None:
+        frames.append('{}:{}'.format(
+            frame.f_globals.get('__name__', '?'), frame.f_code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(frames))
+
+
+class Profiler:
+    """Profile the event loop thread on demand.
+
+    It must be created in the thread running the event loop. Only one
+    profile can run at a time.
+
+    """
+
+    def __init__(self, interval=0.01, duration=30, output_dir=None,
+                 loop=None):
+        self.interval = interval
+        self.duration = duration
+        if output_dir is None:
+            output_dir = tempfile.gettempdir()
+        self.output_dir = output_dir
+        self.loop = loop
+        self.thread_id = threading.get_ident()
+        self._running = False
+        self._task = None
+
+    @property
+    def running(self):
+        """Whether a profile is running or about to start."""
+        return self._running or (
+            self._task is not None and not self._task.done())
+
+    async def profile(self, duration):
+        """Profile for the duration in seconds, return collapsed stacks."""
+        if self._running:
+            raise ProfilerBusy('A profile is already running')
+        self._running = True
+        sampler = StackSampler(self.thread_id, interval=self.interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(duration, loop=self.loop)
+        finally:
+            sampler.stop()
+            self._running = False
+        logging.getLogger().info(
+            'profile completed: {} samples in {}s'.format(
+                sampler.samples, duration))
+        return sampler.collapsed()
+
+    async def profile_to_file(self, duration=None):
+        """Profile and write collapsed stacks to a file, return its path."""
+        if duration is None:
+            duration = self.duration
+        stacks = await self.profile(duration)
+        path = os.path.join(
+            self.output_dir, 'basic-auth-profile-{}-{}.collapsed'.format(
+                os.getpid(), time.strftime('%Y%m%d%H%M%S')))
+        with open(path, 'w') as fd:
+            fd.write(stacks)
+        logging.getLogger().info('profile written to {}'.format(path))
+        return path
+
+    def profile_requested(self):
+        """Profile to a file in background, as a signal handler."""
+        if self.running:
+            logging.getLogger().warning('profile already running')
+            return
+        logging.getLogger().info(
+            'profiling for {}s'.format(self.duration))
+        self._task = asyncio.ensure_future(
+            self._profile_in_background(), loop=self.loop)
+
+    async def _profile_in_background(self):
+        try:
+            await self.profile_to_file()
+        except Exception:
+            logging.getLogger().exception('profile failed')
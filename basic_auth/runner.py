@@ -0,0 +1,205 @@
+"""HTTP server runner with graceful shutdown and reload."""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+from .listeners import LISTEN_FDS_ENV
+
+
+# Environment variable with the file descriptor a process started on reload
+# writes to once it's ready to serve requests.
+READY_FD_ENV = 'BASIC_AUTH_READY_FD'
+
+
+class ServerRunner:
+    """Run an aiohttp application on listening sockets.
+
+    Sockets listen with the specified backlog.
+
+    On SIGINT or SIGTERM the server stops accepting connections, waits up to
+    drain_timeout for in-flight requests and closes keep-alive connections,
+    then cleans up the application.
+
+    On SIGHUP or SIGUSR2 the server is reloaded: a new process is started
+    with the same command line, inheriting listening sockets. Once it reports
+    being ready, the current process shuts down as above. If the new process
+    isn't ready within reload_timeout, it's terminated and the current one
+    keeps running.
+
+    Extra keyword arguments are passed to the application request handler.
+
+    """
+
+    def __init__(self, app, sockets, loop=None, drain_timeout=60.0,
+                 reload_timeout=60.0, command=None, backlog=128,
+                 **handler_kwargs):
+        self.app = app
+        self.sockets = sockets
+        self.loop = loop
+        self.backlog = backlog
+        self.drain_timeout = drain_timeout
+        self.reload_timeout = reload_timeout
+        if command is None:
+            command = [sys.executable] + sys.argv
+        self.command = command
+        self.handler_kwargs = handler_kwargs
+        self._handler = None
+        self._servers = []
+        self._stopping = asyncio.Event(loop=loop)
+        self._reloading = False
+        self._logger = logging.getLogger()
+
+    def run(self):
+        """Run the server until it's stopped or reloaded."""
+        try:
+            self.loop.run_until_complete(self.start())
+            notify_ready()
+            self._add_signal_handlers()
+            self.loop.run_until_complete(self._stopping.wait())
+            self.loop.run_until_complete(self.stop())
+        finally:
+            self.loop.run_until_complete(self.app.cleanup())
+
+    async def start(self):
+        """Start the application and serve it on sockets."""
+        self.app._set_loop(self.loop)
+        await self.app.startup()
+        self._handler = self.app.make_handler(
+            loop=self.loop, **self.handler_kwargs)
+        self._servers = await asyncio.gather(
+            *(self.loop.create_server(
+                self._handler, sock=sock, backlog=self.backlog)
+              for sock in self.sockets),
+            loop=self.loop)
+        self._logger.info('listening on {}'.format(
+            ', '.join(_format_address(sock) for sock in self.sockets)))
+
+    async def stop(self):
+        """Stop accepting connections and drain existing ones."""
+        for server in self._servers:
+            server.close()
+        await asyncio.gather(
+            *(server.wait_closed() for server in self._servers),
+            loop=self.loop)
+        await self.app.shutdown()
+        await self._handler.shutdown(self.drain_timeout)
+
+    async def reload(self):
+        """Start a new process and stop this one once it's ready."""
+        if self._reloading:
+            self._logger.warning('reload already in progress')
+            return
+        self._reloading = True
+        try:
+            if await self._spawn():
+                self._stopping.set()
+        finally:
+            self._reloading = False
+
+    async def _spawn(self):
+        """Start a new process, return whether it reported being ready."""
+        fds = [sock.fileno() for sock in self.sockets]
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ)
+        env[LISTEN_FDS_ENV] = ','.join(str(fd) for fd in fds)
+        env[READY_FD_ENV] = str(write_fd)
+        try:
+            process = subprocess.Popen(
+                self.command, env=env, pass_fds=fds + [write_fd])
+        except OSError:
+            os.close(read_fd)
+            self._logger.exception('reload failed')
+            return False
+        finally:
+            os.close(write_fd)
+
+        self._logger.info('reload: started process {}'.format(process.pid))
+        ready = self.loop.create_future()
+
+        def on_readable():
+            # Reading nothing means the process exited without being ready.
+            data = os.read(read_fd, 1)
+            if not ready.done():
+                ready.set_result(bool(data))
+
+        self.loop.add_reader(read_fd, on_readable)
+        try:
+            is_ready = await asyncio.wait_for(
+                ready, self.reload_timeout, loop=self.loop)
+        except asyncio.TimeoutError:
+            is_ready = False
+        finally:
+            self.loop.remove_reader(read_fd)
+            os.close(read_fd)
+
+        if is_ready:
+            self._logger.info(
+                'reload: process {} ready, shutting down'.format(
+                    process.pid))
+        else:
+            self._logger.error(
+                'reload: process {} failed to start'.format(process.pid))
+            if process.poll() is None:
+                process.terminate()
+            await self._reap(process)
+        return is_ready
+
+    async def _reap(self, process):
+        """Wait for a failed process to exit, so it's not left a zombie.
+
+        The process is killed if it doesn't exit within reload_timeout.
+
+        """
+        deadline = self.loop.time() + self.reload_timeout
+        killed = False
+        while process.poll() is None:
+            if not killed and self.loop.time() >= deadline:
+                process.kill()
+                killed = True
+            await asyncio.sleep(0.01, loop=self.loop)
+
+    def _add_signal_handlers(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self._stopping.set)
+        for signum in (signal.SIGHUP, signal.SIGUSR2):
+            self.loop.add_signal_handler(signum, self._reload_requested)
+
+    def _reload_requested(self):
+        asyncio.ensure_future(self.reload(), loop=self.loop)
+
+
+def notify_ready(environ=None):
+    """Notify the parent process or systemd that the service is ready.
+
+    If the service was started on reload, the parent is notified through the
+    inherited file descriptor. If the NOTIFY_SOCKET variable is set, systemd
+    is notified of the main process ID, since it changes on reloads.
+
+    """
+    if environ is None:
+        environ = os.environ
+    ready_fd = environ.pop(READY_FD_ENV, None)
+    if ready_fd:
+        os.write(int(ready_fd), b'1')
+        os.close(int(ready_fd))
+
+    notify_socket = environ.get('NOTIFY_SOCKET')
+    if notify_socket:
+        if notify_socket.startswith('@'):
+            # Abstract namespace socket.
+            notify_socket = '\0' + notify_socket[1:]
+        message = 'READY=1\nMAINPID={}'.format(os.getpid()).encode()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(message, notify_socket)
+
+
+def _format_address(sock):
+    address = sock.getsockname()
+    if sock.family == socket.AF_UNIX:
+        return 'unix:{}'.format(address)
+    return '{}:{}'.format(*address[:2])
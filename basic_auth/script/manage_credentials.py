@@ -9,11 +9,12 @@ import uvloop
 
 import psycopg2
 
-from aiopg.sa import create_engine
+from sqlalchemy.exc import IntegrityError
 
 from ..config import load_config
 from ..credential import generate_random_token
 from ..db import run_in_transaction
+from ..db.engine import create_engine
 from ..db.model import APICredentials
 
 
@@ -40,10 +41,15 @@ def parse_args(args=None):
     return parser.parse_args(args=args)
 
 
-async def call_model_method(loop, dsn, method, *args, **kwargs):
+async def call_model_method(loop, dsn, method, *args, driver='aiopg',
+                            **kwargs):
     """Call the specified Model method with arguments."""
-    async with create_engine(dsn=dsn, loop=loop) as engine:
+    engine = await create_engine(dsn, driver=driver, loop=loop)
+    try:
         return await run_in_transaction(engine, method, *args, **kwargs)
+    finally:
+        engine.close()
+        await engine.wait_closed()
 
 
 def db_call(args, config, loop=None):
@@ -64,7 +70,8 @@ def db_call(args, config, loop=None):
 
     return loop.run_until_complete(
         call_model_method(
-            loop, config['db', 'dsn'], method, *method_args))
+            loop, config['db', 'dsn'], method, *method_args,
+            driver=config.get(('db', 'driver'), 'aiopg')))
 
 
 def print_result(result, file=sys.stdout):
@@ -97,6 +104,6 @@ def main(loop=None, raw_args=None, file=sys.stdout):
     config = load_config(args)
     try:
         result = db_call(args, config, loop=loop)
-    except psycopg2.IntegrityError:
+    except (psycopg2.IntegrityError, IntegrityError):
         sys.exit('The specified username already exists')
     print_result(result, file=file)
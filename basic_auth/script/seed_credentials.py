@@ -0,0 +1,166 @@
+"""Seed the credentials table with synthetic users, for benchmarking."""
+
+import argparse
+from datetime import (
+    datetime,
+    timedelta,
+)
+import io
+import multiprocessing
+import random
+import sys
+
+import psycopg2
+
+from ..config import load_config
+from ..credential import (
+    BasicAuthCredentials,
+    hash_token256,
+)
+
+
+# Number of users generated by each job. This is fixed so that generated
+# credentials only depend on the seed, not on the degree of parallelism.
+CHUNK_SIZE = 10000
+
+COPY_QUERY = (
+    'COPY credentials ("user", username, password, creation_time) '
+    'FROM STDIN')
+
+
+def parse_args(args=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--config', help='Configuration file', type=argparse.FileType(),
+        default='config.yaml')
+    parser.add_argument(
+        'count', help='Number of users to generate', type=int)
+    parser.add_argument(
+        '--seed', help='Seed for generated credentials', type=int, default=0)
+    parser.add_argument(
+        '--user-prefix', help='Prefix for generated user IDs',
+        default='user-')
+    parser.add_argument(
+        '--processes', help='Number of processes generating credentials',
+        type=int, default=multiprocessing.cpu_count())
+    parser.add_argument(
+        '--snapshot', type=argparse.FileType('w'),
+        help=('Write credentials to the specified file (usable as no-db '
+              'snapshot) instead of the database'))
+    parser.add_argument(
+        '--tokens', type=argparse.FileType('w'),
+        help=('Write plaintext "username:password" tokens to the specified '
+              'file, for use in load tests'))
+    parser.add_argument(
+        '--time-span', type=float, default=0,
+        help=('Spread creation times of generated credentials uniformly '
+              'over the specified number of days before now'))
+    return parser.parse_args(args=args)
+
+
+def generate_chunk(seed, start, stop, user_prefix, creation_time,
+                   with_tokens=False, time_step=None):
+    """Generate credentials for users in the [start, stop) range.
+
+    The creation time of each user is creation_time, increased by time_step
+    for each user index if specified.
+
+    Return a 2-tuple with rows in PostgreSQL COPY text format and, if
+    with_tokens is True, the plaintext tokens (None otherwise).
+
+    """
+    rng = random.Random('{}:{}'.format(seed, start))
+
+    def randbytes(size):
+        return rng.getrandbits(size * 8).to_bytes(size, 'little')
+
+    rows = io.StringIO()
+    tokens = io.StringIO() if with_tokens else None
+    credentials = BasicAuthCredentials.generate_many(
+        stop - start, randbytes=randbytes)
+    for index, (username, password) in enumerate(credentials, start):
+        user_creation_time = creation_time
+        if time_step:
+            user_creation_time += time_step * index
+        rows.write('{}{}\t{}\t{}\t{}\n'.format(
+            user_prefix, index, username, hash_token256(password),
+            user_creation_time.isoformat()))
+        if with_tokens:
+            tokens.write('{}:{}\n'.format(username, password))
+    return rows.getvalue(), tokens.getvalue() if with_tokens else None
+
+
+def _generate_chunk(args):
+    return generate_chunk(*args)
+
+
+def generate_credentials(count, seed=0, user_prefix='user-', processes=1,
+                         with_tokens=False, creation_time=None,
+                         time_span=None):
+    """Generate credentials for count users, in parallel across processes.
+
+    If time_span is specified, creation times are spread uniformly across
+    the span preceding creation_time, in user order.
+
+    Chunks are returned in order, as 2-tuples as for generate_chunk.
+
+    """
+    if creation_time is None:
+        creation_time = datetime.utcnow()
+    time_step = None
+    if time_span and count:
+        time_step = time_span / count
+        creation_time -= time_span
+    jobs = [
+        (seed, start, min(start + CHUNK_SIZE, count), user_prefix,
+         creation_time, with_tokens, time_step)
+        for start in range(0, count, CHUNK_SIZE)]
+    if processes <= 1:
+        yield from map(_generate_chunk, jobs)
+        return
+
+    with multiprocessing.Pool(processes=processes) as pool:
+        yield from pool.imap(_generate_chunk, jobs)
+
+
+def copy_to_db(dsn, chunks, tokens_file=None):
+    """Stream generated chunks into the database in a single transaction."""
+    with psycopg2.connect(dsn) as conn:
+        with conn.cursor() as cursor:
+            for rows, tokens in chunks:
+                cursor.copy_expert(COPY_QUERY, io.StringIO(rows))
+                if tokens_file:
+                    tokens_file.write(tokens)
+    conn.close()
+
+
+def write_snapshot(snapshot_file, chunks, tokens_file=None):
+    """Write generated chunks to a snapshot file."""
+    for rows, tokens in chunks:
+        snapshot_file.write(rows)
+        if tokens_file:
+            tokens_file.write(tokens)
+
+
+def main(raw_args=None):
+    """Script main."""
+    args = parse_args(args=raw_args)
+    config = load_config(args)
+    chunks = generate_credentials(
+        args.count, seed=args.seed, user_prefix=args.user_prefix,
+        processes=args.processes, with_tokens=bool(args.tokens),
+        time_span=timedelta(days=args.time_span))
+    try:
+        if args.snapshot:
+            with args.snapshot:
+                write_snapshot(args.snapshot, chunks, tokens_file=args.tokens)
+        else:
+            copy_to_db(config['db', 'dsn'], chunks, tokens_file=args.tokens)
+    except psycopg2.IntegrityError as error:
+        sys.exit('Failed seeding credentials: {}'.format(error))
+    finally:
+        if args.tokens:
+            args.tokens.close()
@@ -1,20 +1,57 @@
 """Application main."""
 
 import argparse
+import asyncio
+from contextlib import contextmanager
+from functools import partial
 import logging
+import signal
+import sys
+import time
 
 from aiohttp import web
 
-from aiopg.sa import create_engine
-
 import uvloop
 
 from .. import (
     handler,
     __doc__ as description,
 )
-from ..logging import setup_logging
-from ..config import load_config
+from ..breaker import (
+    CircuitBreaker,
+    DecisionStore,
+)
+from ..db import UNAVAILABLE_ERRORS
+from ..db.engine import create_engine
+from ..db.replica import ReplicaSet
+from ..db.stats import QueryStats
+from ..db.migration import (
+    JOBS,
+    MigrationRunner,
+)
+from ..db.warmup import warm_up_engine
+from ..health import HealthMonitor
+from ..listeners import (
+    ListenError,
+    create_sockets,
+    inherited_sockets,
+)
+from ..logging import (
+    ACCESS_LOG_SAMPLE_RATE,
+    SampledAccessLogger,
+    setup_logging,
+)
+from ..looplag import LoopLagMonitor
+from ..periodic import PeriodicTask
+from ..profiler import Profiler
+from ..runner import ServerRunner
+from ..throttle import auth_throttle_from_config
+from ..timing import server_timing_middleware
+from ..usage import UsageRecorder
+from ..config import (
+    ConfigError,
+    load_config,
+)
 from ..collection import (
     DataBaseCredentialsCollection,
     MemoryCredentialsCollection,
@@ -22,9 +59,14 @@ from ..collection import (
 from ..application import (
     setup_api_application,
     setup_auth_check_application,
+    setup_internal_application,
 )
 
 
+# Default seconds between rebuilds of the filter of known usernames.
+USERNAME_FILTER_REFRESH_INTERVAL = 60
+
+
 def parse_args(args=None):
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(
@@ -38,34 +80,396 @@ def parse_args(args=None):
 
 async def create_app(conf, loop=None):
     """Create the base application."""
-    app = web.Application(middlewares=[web.normalize_path_middleware()])
+    check_config(conf)
+    http_conf = conf.get(('app', 'http'), {})
+    middlewares = [web.normalize_path_middleware()]
+    if http_conf.get('server-timing'):
+        middlewares.insert(0, server_timing_middleware)
+    app = web.Application(
+        middlewares=middlewares,
+        client_max_size=http_conf.get('client-max-size', 1024**2))
+    app['periodic-tasks'] = []
+    app.on_startup.append(_start_periodic_tasks)
+    app.on_cleanup.append(_stop_periodic_tasks)
 
-    if conf.get(('app', 'no-db')):
+    health_conf = conf.get(('app', 'health'), {})
+    engine = None
+    if not conf.get(('app', 'no-db')):
+        with warm_up_phase('database connection'):
+            engine = await create_engine(
+                conf['db', 'dsn'], **_engine_kwargs(conf, loop=loop))
+    app['health'] = HealthMonitor(
+        engine=engine, interval=health_conf.get('check-interval', 5),
+        timeout=health_conf.get('check-timeout', 2), loop=loop)
+    app.on_startup.append(_start_health_monitor)
+    app.on_cleanup.append(_stop_health_monitor)
+
+    if engine is None:
         collection = MemoryCredentialsCollection(loop=loop)
+        snapshot = conf.get(('app', 'no-db-snapshot'))
+        if snapshot:
+            with open(snapshot) as fd:
+                try:
+                    collection.load_snapshot(fd)
+                except ValueError as error:
+                    raise ConfigError(
+                        'Failed loading {}: {}'.format(snapshot, error))
     else:
-        engine = await create_engine(dsn=conf['db', 'dsn'], loop=loop)
-        collection = DataBaseCredentialsCollection(engine)
         app['db'] = engine
+        usage = setup_usage_recorder(app, engine, conf, loop=loop)
+        replicas = await setup_replicas(app, engine, conf, loop=loop)
+        collection = DataBaseCredentialsCollection(
+            engine, loop=loop, replicas=replicas, usage=usage,
+            query_stats=_query_stats(conf),
+            **_degraded_mode_kwargs(conf, loop=loop))
+        app['health'].require('connection-pool')
+        with warm_up_phase('connection pool'):
+            await warm_up_engine(engine, loop=loop)
+            if replicas is not None:
+                await asyncio.gather(
+                    *(warm_up_engine(replica, loop=loop)
+                      for replica in replicas.healthy), loop=loop)
+        app['health'].mark_warm('connection-pool')
+        await setup_username_filter(app, collection, conf, loop=loop)
+        setup_data_migrations(app, conf)
+    app['collection'] = collection
     logging.getLogger().info(
         'Using collections class: {}'.format(
             collection.__class__.__name__))
 
     app.router.add_get('/', handler.root)
+    app.router.add_get('/health/live', handler.live)
+    app.router.add_get('/health/ready', handler.ready)
+    profiler = setup_profiler(app, conf, loop=loop)
+    loop_lag = setup_loop_lag_monitor(app, conf, loop=loop)
+    # Applications share the throttle, so that limits apply across them.
+    auth_kwargs = _auth_middleware_kwargs(conf)
     app['subapps'] = {
-        'api': app.add_subapp('/api', setup_api_application(collection)),
+        'api': app.add_subapp(
+            '/api', setup_api_application(collection, **auth_kwargs)),
         'auth-check': app.add_subapp(
-            '/auth-check', setup_auth_check_application(collection))}
+            '/auth-check', setup_auth_check_application(
+                collection, **auth_kwargs)),
+        'internal': app.add_subapp(
+            '/internal', setup_internal_application(
+                collection,
+                query_stats=getattr(collection, 'query_stats', None),
+                profiler=profiler, loop_lag=loop_lag, **auth_kwargs))}
+    access_log_conf = http_conf.get('access-log')
+    if isinstance(access_log_conf, dict):
+        for name, rate in access_log_conf.items():
+            subapp = app['subapps'][name].get_info()['app']
+            subapp[ACCESS_LOG_SAMPLE_RATE] = rate
+    if engine is not None:
+        # The engine is closed last, once cleanup hooks have stopped
+        # background tasks using connections and flushed pending writes.
+        app.on_cleanup.append(_close_db)
     return app
 
 
+@contextmanager
+def warm_up_phase(name):
+    """Log time spent in a startup warm-up phase."""
+    start = time.monotonic()
+    yield
+    logging.getLogger().info(
+        'warm-up: {} ready in {:.3f}s'.format(
+            name, time.monotonic() - start))
+
+
+def check_config(conf):
+    """Raise ConfigError if options are invalid."""
+    if conf.get(('db', 'driver')) == 'sqlite':
+        for option in ('replica-dsns', 'data-migrations'):
+            if conf.get(('db', option)):
+                raise ConfigError(
+                    'db.{} is not supported with the sqlite driver'.format(
+                        option))
+    migrations_conf = conf.get(('db', 'data-migrations')) or {}
+    unknown = sorted(set(migrations_conf.get('jobs', ())) - set(JOBS))
+    if unknown:
+        raise ConfigError(
+            'Unknown data migrations in db.data-migrations.jobs: {}'.format(
+                ', '.join(unknown)))
+
+
+def _engine_kwargs(conf, loop=None):
+    """Return keyword arguments for creating database engines."""
+    return {
+        'driver': conf.get(('db', 'driver'), 'aiopg'),
+        'minsize': conf.get(('db', 'pool-minsize'), 1),
+        'maxsize': conf.get(('db', 'pool-maxsize'), 10),
+        'loop': loop}
+
+
+def _query_stats(conf):
+    """Return QueryStats for database queries, if enabled in config."""
+    stats_conf = conf.get(('db', 'query-stats'))
+    if not stats_conf:
+        return None
+    return QueryStats(
+        slow_threshold=stats_conf.get('slow-threshold'),
+        window=stats_conf.get('window', 1000))
+
+
+def _degraded_mode_kwargs(conf, loop=None):
+    """Return keyword arguments for the collection degraded mode."""
+    breaker_conf = conf.get(('db', 'circuit-breaker'))
+    if not breaker_conf:
+        return {}
+    return {
+        'breaker': CircuitBreaker(
+            failure_threshold=breaker_conf.get('failure-threshold', 5),
+            reset_timeout=breaker_conf.get('reset-timeout', 30),
+            call_timeout=breaker_conf.get('call-timeout', 5),
+            errors=UNAVAILABLE_ERRORS, loop=loop),
+        'decisions': DecisionStore(
+            max_entries=breaker_conf.get('max-entries', 100000),
+            max_staleness=breaker_conf.get('max-staleness', 3600))}
+
+
+def _auth_middleware_kwargs(conf):
+    """Return keyword arguments for authentication middlewares."""
+    throttle_conf = conf.get(('app', 'auth-throttle'))
+    if not throttle_conf:
+        return {}
+    return {
+        'throttle': auth_throttle_from_config(throttle_conf),
+        'throttle_status': throttle_conf.get('status', 401)}
+
+
+def setup_usage_recorder(app, engine, conf, loop=None):
+    """Create a recorder for credentials usage, if enabled in config.
+
+    Usage is flushed periodically while the application runs, and at
+    cleanup.
+
+    """
+    usage_conf = conf.get(('db', 'usage-tracking'))
+    if not usage_conf:
+        return None
+
+    usage = UsageRecorder(
+        engine, batch_size=usage_conf.get('batch-size', 1000),
+        max_pending=usage_conf.get('max-pending', 100000))
+    app['usage'] = usage
+    app['periodic-tasks'].append(
+        PeriodicTask(
+            usage.flush, usage_conf.get('flush-interval', 60), loop=loop))
+    app.on_cleanup.append(_flush_usage)
+    return usage
+
+
+async def setup_replicas(app, engine, conf, loop=None):
+    """Create engines for read replicas, if configured.
+
+    Return a ReplicaSet, or None if no replica is configured. Replicas are
+    checked periodically while the application runs.
+
+    """
+    dsns = conf.get(('db', 'replica-dsns'))
+    if not dsns:
+        return None
+
+    replicas_conf = conf.get(('db', 'replicas'), {})
+    with warm_up_phase('replica connections'):
+        replica_engines = await asyncio.gather(
+            *(create_engine(dsn, **_engine_kwargs(conf, loop=loop))
+              for dsn in dsns), loop=loop)
+    replicas = ReplicaSet(
+        engine, replica_engines,
+        read_your_writes=replicas_conf.get('read-your-writes', 0),
+        timeout=replicas_conf.get('check-timeout', 2), loop=loop)
+    app['db-replicas'] = replicas
+    app.on_cleanup.append(_close_replicas)
+    await replicas.check()
+    app['periodic-tasks'].append(
+        PeriodicTask(
+            replicas.check, replicas_conf.get('check-interval', 5),
+            loop=loop))
+    return replicas
+
+
+def setup_profiler(app, conf, loop=None):
+    """Create a Profiler, also triggered by SIGUSR1 while the app runs.
+
+    Return None unless the profiler is enabled in config.
+
+    """
+    profiler_conf = conf.get(('app', 'profiler'), {})
+    if not profiler_conf.get('enabled'):
+        return None
+    profiler = Profiler(
+        interval=profiler_conf.get('interval', 0.01),
+        duration=profiler_conf.get('duration', 30),
+        output_dir=profiler_conf.get('output-dir'), loop=loop)
+
+    async def add_signal_handler(app):
+        app.loop.add_signal_handler(
+            signal.SIGUSR1, profiler.profile_requested)
+
+    async def remove_signal_handler(app):
+        app.loop.remove_signal_handler(signal.SIGUSR1)
+
+    app.on_startup.append(add_signal_handler)
+    app.on_cleanup.append(remove_signal_handler)
+    return profiler
+
+
+def setup_loop_lag_monitor(app, conf, loop=None):
+    """Create a LoopLagMonitor running with the app, if enabled in config."""
+    lag_conf = conf.get(('app', 'loop-lag'))
+    if not lag_conf:
+        return None
+    monitor = LoopLagMonitor(
+        interval=lag_conf.get('interval', 0.1),
+        threshold=lag_conf.get('threshold', 0.1),
+        max_blocked=lag_conf.get('max-blocked', 10), loop=loop)
+
+    async def start_monitor(app):
+        monitor.start()
+
+    async def stop_monitor(app):
+        await monitor.stop()
+
+    app.on_startup.append(start_monitor)
+    app.on_cleanup.append(stop_monitor)
+    return monitor
+
+
+async def setup_username_filter(app, collection, conf, loop=None):
+    """Load the filter of known usernames, if enabled in config.
+
+    The filter is periodically rebuilt while the application runs, unless
+    the refresh interval is set to 0, so that usernames added by other
+    instances are accepted.
+
+    """
+    filter_conf = conf.get(('app', 'username-filter'))
+    if not filter_conf:
+        return
+
+    app['health'].require('username-filter')
+    load = partial(
+        collection.load_username_filter,
+        filter_conf.get('capacity', 1000000),
+        error_rate=filter_conf.get('error-rate', 0.001))
+    with warm_up_phase('username filter'):
+        await load()
+    app['health'].mark_warm('username-filter')
+    refresh_interval = filter_conf.get(
+        'refresh-interval', USERNAME_FILTER_REFRESH_INTERVAL)
+    if refresh_interval:
+        app['periodic-tasks'].append(
+            PeriodicTask(load, refresh_interval, loop=loop))
+
+
+def setup_data_migrations(app, conf):
+    """Run configured data migrations in background while the app runs."""
+    migrations_conf = conf.get(('db', 'data-migrations'))
+    if not migrations_conf:
+        return
+
+    runners = [
+        MigrationRunner(
+            JOBS[name](), batch_size=migrations_conf.get('batch-size', 1000),
+            max_rows_per_second=migrations_conf.get('max-rows-per-second'))
+        for name in migrations_conf.get('jobs', ())]
+    app['data-migrations'] = []
+
+    async def run_migration(runner):
+        try:
+            await runner.run(app['db'], loop=app.loop)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.getLogger().exception(
+                'Failed running data migration {}'.format(runner.job.name))
+
+    async def start_migrations(app):
+        for runner in runners:
+            app['data-migrations'].append(
+                asyncio.ensure_future(run_migration(runner), loop=app.loop))
+
+    async def stop_migrations(app):
+        for task in app['data-migrations']:
+            task.cancel()
+        await asyncio.gather(
+            *app['data-migrations'], loop=app.loop, return_exceptions=True)
+
+    app.on_startup.append(start_migrations)
+    app.on_cleanup.append(stop_migrations)
+
+
+async def _close_db(app):
+    app['db'].close()
+    await app['db'].wait_closed()
+
+
+async def _flush_usage(app):
+    try:
+        await app['usage'].flush()
+    except Exception:
+        logging.getLogger().exception('Failed flushing credentials usage')
+
+
+async def _close_replicas(app):
+    await app['db-replicas'].close()
+
+
+async def _start_health_monitor(app):
+    await app['health'].start()
+
+
+async def _stop_health_monitor(app):
+    await app['health'].stop()
+
+
+async def _start_periodic_tasks(app):
+    for task in app['periodic-tasks']:
+        task.start()
+
+
+async def _stop_periodic_tasks(app):
+    for task in app['periodic-tasks']:
+        await task.stop()
+
+
 def main(loop=None, raw_args=None):
     """Application main."""
     args = parse_args(args=raw_args)
     conf = load_config(args)
     setup_logging()
 
+    # On reload, sockets are passed by the previous process.
+    sockets = inherited_sockets()
+    if not sockets:
+        try:
+            sockets = create_sockets(conf)
+        except (ListenError, OSError) as error:
+            sys.exit('Failed setting up listening sockets: {}'.format(error))
+
     if loop is None:
         loop = uvloop.new_event_loop()
-    app = loop.run_until_complete(create_app(conf, loop=loop))
-    port = conf.get(('app', 'port'), 8080)
-    web.run_app(app, port=port, loop=loop)
+    try:
+        app = loop.run_until_complete(create_app(conf, loop=loop))
+    except ConfigError as error:
+        sys.exit('Invalid configuration: {}'.format(error))
+    runner = ServerRunner(
+        app, sockets, loop=loop,
+        drain_timeout=conf.get(('app', 'drain-timeout'), 60),
+        reload_timeout=conf.get(('app', 'reload-timeout'), 60),
+        **_http_kwargs(conf))
+    runner.run()
+
+
+def _http_kwargs(conf):
+    """Return keyword arguments for the server runner from HTTP config."""
+    http_conf = conf.get(('app', 'http'), {})
+    kwargs = {
+        'backlog': http_conf.get('backlog', 128),
+        'keepalive_timeout': http_conf.get('keepalive-timeout', 75),
+        'access_log_class': SampledAccessLogger}
+    if http_conf.get('access-log', True) is False:
+        kwargs['access_log'] = None
+    return kwargs
@@ -59,6 +59,26 @@ class CallModelMethodTest(asynctest.TestCase):
         self.assertEqual('', creds.description)
 
 
+class CallModelMethodSqliteTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    def setUp(self):
+        super().setUp()
+        path = self.useFixture(fixtures.TempDir()).join('basic-auth.db')
+        self.dsn = 'sqlite:///' + path
+        ensure_database(dsn=self.dsn)
+
+    async def test_call_model_method(self):
+        """call_model_method uses the specified database driver."""
+        await call_model_method(
+            self.loop, self.dsn, 'add_api_credentials', 'user', 'pass',
+            driver='sqlite')
+        creds = await call_model_method(
+            self.loop, self.dsn, 'get_api_credentials', 'user',
+            driver='sqlite')
+        self.assertEqual('user', creds.username)
+        self.assertTrue(creds.password_match('pass'))
+
+
 class DbCallTest(asynctest.TestCase):
 
     forbid_get_event_loop = True
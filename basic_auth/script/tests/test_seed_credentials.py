@@ -0,0 +1,180 @@
+from contextlib import closing
+from datetime import (
+    datetime,
+    timedelta,
+)
+import io
+import unittest
+
+import fixtures
+
+import psycopg2
+
+from ..seed_credentials import (
+    parse_args,
+    generate_chunk,
+    generate_credentials,
+    copy_to_db,
+    write_snapshot,
+    main,
+)
+from ...credential import hash_token256
+from ...testing import create_test_config
+from ...db.testing import (
+    TEST_DB_DSN,
+    ensure_database,
+)
+
+
+CREATION_TIME = datetime(2018, 1, 1)
+
+
+class ParseArgsTest(fixtures.TestWithFixtures):
+
+    def test_parse_args(self):
+        """Command line arguments are parsed."""
+        tempdir = self.useFixture(fixtures.TempDir())
+        file_path = tempdir.join('config.yaml')
+        create_test_config(filename=file_path)
+        args = parse_args(args=['--config', file_path, '100', '--seed', '3'])
+        args.config.close()
+        self.assertEqual(100, args.count)
+        self.assertEqual(3, args.seed)
+        self.assertEqual('user-', args.user_prefix)
+        self.assertIsNone(args.snapshot)
+        self.assertIsNone(args.tokens)
+        self.assertEqual(0, args.time_span)
+
+
+class GenerateChunkTest(unittest.TestCase):
+
+    def test_generate_rows(self):
+        """Rows are generated in COPY format for the given range."""
+        rows, tokens = generate_chunk(0, 10, 13, 'user-', CREATION_TIME)
+        lines = rows.splitlines()
+        self.assertEqual(3, len(lines))
+        users = [line.split('\t')[0] for line in lines]
+        self.assertEqual(['user-10', 'user-11', 'user-12'], users)
+        for line in lines:
+            user, username, password, creation_time = line.split('\t')
+            self.assertEqual(20, len(username))
+            self.assertEqual(64, len(password))
+            self.assertEqual('2018-01-01T00:00:00', creation_time)
+        self.assertIsNone(tokens)
+
+    def test_generate_tokens(self):
+        """Plaintext tokens match the hashed passwords."""
+        rows, tokens = generate_chunk(
+            0, 0, 2, 'user-', CREATION_TIME, with_tokens=True)
+        for row, token in zip(rows.splitlines(), tokens.splitlines()):
+            _, username, password, _ = row.split('\t')
+            token_username, token_password = token.split(':')
+            self.assertEqual(username, token_username)
+            self.assertEqual(password, hash_token256(token_password))
+
+    def test_generate_time_step(self):
+        """Creation times are increased by the time step for each user."""
+        rows, _ = generate_chunk(
+            0, 10, 12, 'user-', CREATION_TIME,
+            time_step=timedelta(seconds=1))
+        creation_times = [
+            line.split('\t')[3] for line in rows.splitlines()]
+        self.assertEqual(
+            ['2018-01-01T00:00:10', '2018-01-01T00:00:11'], creation_times)
+
+    def test_deterministic(self):
+        """The same seed generates the same credentials."""
+        self.assertEqual(
+            generate_chunk(42, 0, 5, 'user-', CREATION_TIME),
+            generate_chunk(42, 0, 5, 'user-', CREATION_TIME))
+        self.assertNotEqual(
+            generate_chunk(42, 0, 5, 'user-', CREATION_TIME),
+            generate_chunk(43, 0, 5, 'user-', CREATION_TIME))
+
+
+class GenerateCredentialsTest(unittest.TestCase):
+
+    def test_generate_count(self):
+        """The requested number of credentials is generated."""
+        chunks = generate_credentials(25, processes=1)
+        rows = ''.join(rows for rows, _ in chunks).splitlines()
+        self.assertEqual(25, len(rows))
+        self.assertEqual('user-24', rows[-1].split('\t')[0])
+
+    def test_generate_time_span(self):
+        """Creation times can be spread over a time span."""
+        chunks = generate_credentials(
+            4, creation_time=CREATION_TIME, time_span=timedelta(days=4))
+        rows = ''.join(rows for rows, _ in chunks).splitlines()
+        self.assertEqual(
+            ['2017-12-28T00:00:00', '2017-12-29T00:00:00',
+             '2017-12-30T00:00:00', '2017-12-31T00:00:00'],
+            [row.split('\t')[3] for row in rows])
+
+    def test_parallel_same_result(self):
+        """Results don't depend on the number of processes."""
+        serial = list(generate_credentials(5, seed=1, processes=1))
+        parallel = list(generate_credentials(5, seed=1, processes=2))
+        strip_time = [
+            [line.rsplit('\t', 1)[0] for line in rows.splitlines()]
+            for rows, _ in serial + parallel]
+        self.assertEqual(strip_time[:len(serial)], strip_time[len(serial):])
+
+
+class WriteSnapshotTest(unittest.TestCase):
+
+    def test_write_snapshot(self):
+        """Chunks are written to the snapshot file."""
+        snapshot = io.StringIO()
+        tokens = io.StringIO()
+        write_snapshot(
+            snapshot, [('row1\n', 'tok1\n'), ('row2\n', 'tok2\n')],
+            tokens_file=tokens)
+        self.assertEqual('row1\nrow2\n', snapshot.getvalue())
+        self.assertEqual('tok1\ntok2\n', tokens.getvalue())
+
+
+class CopyToDbTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        ensure_database()
+
+    def test_copy_to_db(self):
+        """Generated credentials are stored in the database."""
+        copy_to_db(TEST_DB_DSN, generate_credentials(10, processes=1))
+        with closing(psycopg2.connect(TEST_DB_DSN)) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT count(*) FROM credentials')
+                [count] = cursor.fetchone()
+        self.assertEqual(10, count)
+
+
+class MainTest(fixtures.TestWithFixtures):
+
+    def setUp(self):
+        super().setUp()
+        ensure_database()
+        self.tempdir = self.useFixture(fixtures.TempDir())
+        self.config_path = self.tempdir.join('config.yaml')
+        create_test_config(filename=self.config_path)
+
+    def test_main_snapshot(self):
+        """Credentials can be written to a snapshot file."""
+        snapshot_path = self.tempdir.join('snapshot')
+        tokens_path = self.tempdir.join('tokens')
+        main(raw_args=[
+            '--config', self.config_path, '--processes', '1',
+            '--snapshot', snapshot_path, '--tokens', tokens_path, '3'])
+        with open(snapshot_path) as fd:
+            self.assertEqual(3, len(fd.readlines()))
+        with open(tokens_path) as fd:
+            self.assertEqual(3, len(fd.readlines()))
+
+    def test_main_duplicated_user(self):
+        """If users already exist an error is printed."""
+        args = ['--config', self.config_path, '--processes', '1', '3']
+        main(raw_args=args)
+        with self.assertRaises(SystemExit) as cm:
+            main(raw_args=args)
+        self.assertIn('Failed seeding credentials', str(cm.exception))
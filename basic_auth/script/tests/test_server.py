@@ -8,10 +8,25 @@ import asynctest
 import yaml
 
 from ..server import (
+    USERNAME_FILTER_REFRESH_INTERVAL,
+    check_config,
     parse_args,
     create_app,
     main,
+    setup_data_migrations,
+    _http_kwargs,
 )
+from ...config import (
+    Config,
+    ConfigError,
+)
+from ...credential import hash_token256
+from ...db.migration import DataMigrationJob
+from ...db.schema import CREDENTIALS
+from ...logging import SampledAccessLogger
+from ...looplag import LoopLagMonitor
+from ...profiler import Profiler
+from ...db.testing import ensure_database
 from ...testing import create_test_config
 
 
@@ -31,6 +46,111 @@ class ParseArgsTest(fixtures.TestWithFixtures):
             config)
 
 
+class HTTPKwargsTest(fixtures.TestWithFixtures):
+
+    def test_defaults(self):
+        """Default HTTP options are returned."""
+        self.assertEqual(
+            {'backlog': 128, 'keepalive_timeout': 75,
+             'access_log_class': SampledAccessLogger},
+            _http_kwargs(create_test_config()))
+
+    def test_options(self):
+        """HTTP options can be set in config."""
+        config = create_test_config().asdict()
+        config['app']['http'] = {
+            'backlog': 1024, 'keepalive-timeout': 300, 'access-log': False}
+        self.assertEqual(
+            {'backlog': 1024, 'keepalive_timeout': 300,
+             'access_log_class': SampledAccessLogger, 'access_log': None},
+            _http_kwargs(Config(config)))
+
+
+class CheckConfigTest(fixtures.TestWithFixtures):
+
+    def test_valid(self):
+        """No error is raised for a valid config."""
+        config = create_test_config().asdict()
+        config['db']['data-migrations'] = {'jobs': []}
+        check_config(Config(config))
+
+    def test_unknown_data_migrations(self):
+        """Data migrations must be registered."""
+        config = create_test_config().asdict()
+        config['db']['data-migrations'] = {'jobs': ['foo', 'bar']}
+        with self.assertRaises(ConfigError) as cm:
+            check_config(Config(config))
+        self.assertEqual(
+            'Unknown data migrations in db.data-migrations.jobs: bar, foo',
+            str(cm.exception))
+
+    def test_sqlite_unsupported_options(self):
+        """Replicas and data migrations are not supported with SQLite."""
+        for option, value in (
+                ('replica-dsns', ['sqlite:////tmp/replica.db']),
+                ('data-migrations', {'jobs': []})):
+            config = create_test_config().asdict()
+            config['db'].update(
+                {'driver': 'sqlite', 'dsn': 'sqlite:////tmp/basic-auth.db',
+                 option: value})
+            with self.assertRaises(ConfigError) as cm:
+                check_config(Config(config))
+            self.assertEqual(
+                'db.{} is not supported with the sqlite driver'.format(
+                    option),
+                str(cm.exception))
+
+
+class FailingJob(DataMigrationJob):
+
+    name = 'failing'
+    table = CREDENTIALS
+    columns = ('password',)
+
+
+class BrokenEngine:
+
+    def acquire(self):
+        raise OSError('Connection refused')
+
+
+class FakeApplication(dict):
+
+    def __init__(self, loop):
+        super().__init__()
+        self.loop = loop
+        self.on_startup = []
+        self.on_cleanup = []
+
+
+class SetupDataMigrationsTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+
+    async def test_failure_logged(self):
+        """Failures of data migrations are logged."""
+        config = create_test_config().asdict()
+        config['db']['data-migrations'] = {'jobs': ['failing']}
+        app = FakeApplication(self.loop)
+        app['db'] = BrokenEngine()
+        with mock.patch.dict(
+                'basic_auth.script.server.JOBS', {'failing': FailingJob}):
+            setup_data_migrations(app, Config(config))
+        for hook in app.on_startup:
+            await hook(app)
+        [task] = app['data-migrations']
+        await task
+        self.assertIn(
+            'Failed running data migration failing', self.logger.output)
+        self.assertIn('Connection refused', self.logger.output)
+        for hook in app.on_cleanup:
+            await hook(app)
+
+
 class CreateAppTest(asynctest.TestCase, fixtures.TestWithFixtures):
 
     def setUp(self):
@@ -49,6 +169,139 @@ class CreateAppTest(asynctest.TestCase, fixtures.TestWithFixtures):
         self.assertIsNotNone(app['db'])
         await self._close_db(app)
 
+    async def test_create_app_username_filter(self):
+        """The username filter is loaded if enabled in config."""
+        ensure_database()
+        config = create_test_config().asdict()
+        config['app']['username-filter'] = {
+            'capacity': 1000, 'error-rate': 0.01, 'refresh-interval': 60}
+        app = await create_app(Config(config))
+        self.addCleanup(self._close_db, app)
+        username_filter = app['collection'].username_filter
+        self.assertEqual(1000, username_filter.capacity)
+        self.assertEqual(0.01, username_filter.error_rate)
+        [task] = app['periodic-tasks']
+        self.assertEqual(60, task.interval)
+
+    async def test_create_app_username_filter_default_refresh(self):
+        """The username filter is refreshed by default."""
+        ensure_database()
+        config = create_test_config().asdict()
+        config['app']['username-filter'] = {'capacity': 1000}
+        app = await create_app(Config(config))
+        self.addCleanup(self._close_db, app)
+        [task] = app['periodic-tasks']
+        self.assertEqual(USERNAME_FILTER_REFRESH_INTERVAL, task.interval)
+
+    async def test_create_app_username_filter_no_refresh(self):
+        """Refreshing the username filter can be disabled."""
+        ensure_database()
+        config = create_test_config().asdict()
+        config['app']['username-filter'] = {
+            'capacity': 1000, 'refresh-interval': 0}
+        app = await create_app(Config(config))
+        self.addCleanup(self._close_db, app)
+        self.assertEqual([], app['periodic-tasks'])
+
+    async def test_create_app_http(self):
+        """HTTP options can be set in config."""
+        config = create_test_config(use_db=False).asdict()
+        config['app']['http'] = {
+            'client-max-size': 4096,
+            'access-log': {'auth-check': 0.1, 'api': 0}}
+        app = await create_app(Config(config))
+        self.assertEqual(4096, app._client_max_size)
+        self.assertEqual(
+            0.1, app['subapps']['auth-check'].get_info()['app'][
+                'access-log-sample-rate'])
+        self.assertEqual(
+            0, app['subapps']['api'].get_info()['app'][
+                'access-log-sample-rate'])
+
+    async def test_create_app_auth_throttle(self):
+        """Authentication throttling can be enabled in config."""
+        config = create_test_config(use_db=False).asdict()
+        config['app']['auth-throttle'] = {
+            'status': 429, 'username': {'rate': 1, 'burst': 5}}
+        app = await create_app(Config(config))
+        throttles = set()
+        for name in ('api', 'auth-check', 'internal'):
+            subapp = app['subapps'][name].get_info()['app']
+            [middleware] = subapp.middlewares
+            self.assertEqual(429, middleware.throttle_status)
+            self.assertEqual(5, middleware.throttle.username_throttle.burst)
+            throttles.add(middleware.throttle)
+        # Limits are shared across applications.
+        self.assertEqual(1, len(throttles))
+
+    async def test_create_app_health(self):
+        """Health probes are added to the application."""
+        config = create_test_config()
+        app = await create_app(config)
+        self.addCleanup(self._close_db, app)
+        self.assertIs(app['db'], app['health'].engine)
+        resources = [
+            resource.get_info().get('path')
+            for resource in app.router.resources()]
+        self.assertIn('/health/live', resources)
+        self.assertIn('/health/ready', resources)
+
+    async def test_create_app_health_username_filter(self):
+        """The username filter is required for the service to be ready."""
+        ensure_database()
+        config = create_test_config().asdict()
+        config['app']['username-filter'] = {'capacity': 1000}
+        app = await create_app(Config(config))
+        self.addCleanup(self._close_db, app)
+        self.assertEqual(
+            {'connection-pool': True, 'username-filter': True},
+            app['health'].status()['components'])
+
+    async def test_create_app_warm_up(self):
+        """The connection pool is filled and primed at startup."""
+        logger = self.useFixture(fixtures.FakeLogger())
+        config = create_test_config().asdict()
+        config['db'].update({'pool-minsize': 3, 'pool-maxsize': 5})
+        app = await create_app(Config(config))
+        self.addCleanup(self._close_db, app)
+        self.assertEqual(3, app['db'].minsize)
+        self.assertEqual(5, app['db'].maxsize)
+        self.assertEqual(3, app['db'].freesize)
+        self.assertIn('warm-up: database connection ready', logger.output)
+        self.assertIn('warm-up: connection pool ready', logger.output)
+
+    async def test_create_app_close_db_last(self):
+        """The engine is closed after other cleanup hooks."""
+        config = create_test_config().asdict()
+        config['db']['data-migrations'] = {'jobs': []}
+        config['app']['loop-lag'] = {'interval': 1}
+        app = await create_app(Config(config))
+        self.addCleanup(self._close_db, app)
+        self.assertEqual('_close_db', app.on_cleanup[-1].__name__)
+
+    async def test_create_app_internal(self):
+        """Diagnostics objects are set in the internal application."""
+        config = create_test_config(use_db=False).asdict()
+        config['app']['loop-lag'] = {'interval': 1}
+        config['app']['profiler'] = {'enabled': True}
+        app = await create_app(Config(config))
+        internal_app = app['subapps']['internal'].get_info()['app']
+        self.assertIsNone(internal_app['query-stats'])
+        self.assertIsInstance(internal_app['profiler'], Profiler)
+        self.assertIsInstance(internal_app['loop-lag'], LoopLagMonitor)
+        self.assertIn(
+            'add_signal_handler',
+            [hook.__name__ for hook in app.on_startup])
+
+    async def test_create_app_profiler_disabled(self):
+        """The profiler is disabled by default."""
+        app = await create_app(create_test_config(use_db=False))
+        internal_app = app['subapps']['internal'].get_info()['app']
+        self.assertIsNone(internal_app['profiler'])
+        self.assertNotIn(
+            'add_signal_handler',
+            [hook.__name__ for hook in app.on_startup])
+
     @mock.patch('aiopg.sa.create_engine')
     async def test_create_app_no_db(self, mock_create_engine):
         """If the "no-db" config is specified, memory collection is used."""
@@ -57,6 +310,35 @@ class CreateAppTest(asynctest.TestCase, fixtures.TestWithFixtures):
         self.assertIsNone(app.get('db'))
         self.assertFalse(mock_create_engine.called)
 
+    async def test_create_app_no_db_snapshot(self):
+        """With "no-db", credentials can be loaded from a snapshot file."""
+        tempdir = self.useFixture(fixtures.TempDir())
+        snapshot = tempdir.join('snapshot')
+        with open(snapshot, 'w') as fd:
+            fd.write('foo\tbar\t{}\t2018-01-01T00:00:00\n'.format(
+                hash_token256('baz')))
+        config = create_test_config(use_db=False).asdict()
+        config['app']['no-db-snapshot'] = snapshot
+        app = await create_app(Config(config))
+        self.assertEqual(
+            {'user': 'foo', 'token': 'bar:{}'.format(hash_token256('baz'))},
+            await app['collection'].get('foo'))
+
+    async def test_create_app_no_db_snapshot_malformed(self):
+        """A malformed snapshot file causes a configuration error."""
+        tempdir = self.useFixture(fixtures.TempDir())
+        snapshot = tempdir.join('snapshot')
+        with open(snapshot, 'w') as fd:
+            fd.write('foo\tbar\tbaz\t2018-01-01T00:00:00\n')
+        config = create_test_config(use_db=False).asdict()
+        config['app']['no-db-snapshot'] = snapshot
+        with self.assertRaises(ConfigError) as cm:
+            await create_app(Config(config))
+        self.assertEqual(
+            "Failed loading {}: Invalid snapshot line 1: "
+            "Invalid password hash: 'baz'".format(snapshot),
+            str(cm.exception))
+
 
 class MainTest(asynctest.TestCase, fixtures.TestWithFixtures):
 
@@ -69,27 +351,34 @@ class MainTest(asynctest.TestCase, fixtures.TestWithFixtures):
         self.config_path = tmpdir.join('config.yaml')
         create_test_config(filename=self.config_path)
 
-    async def _close_db(self, run_app):
-        """Close the DB in the app that was passed to the run_app call."""
-        [[app], _] = run_app.call_args
+    async def _close_db(self, runner):
+        """Close the DB in the app that was passed to the runner."""
+        [[app, sockets], _] = runner.call_args
+        for sock in sockets:
+            sock.close()
         app['db'].terminate()
         await app['db'].wait_closed()
 
-    @asynctest.mock.patch('aiohttp.web.run_app')
+    @asynctest.mock.patch('basic_auth.script.server.ServerRunner')
     @asynctest.mock.patch('basic_auth.script.server.setup_logging')
     # TODO frankban: reenable.
-    async def disable_test_main_calls_web_run_app(self, _, mock_run_app):
+    async def disable_test_main_runs_server(self, _, mock_runner):
         """The script main runs the web application."""
-        self.addCleanup(self._close_db, mock_run_app)
+        self.addCleanup(self._close_db, mock_runner)
         main(raw_args=['--config', self.config_path])
-        mock_run_app.assert_called_with(mock.ANY, loop=mock.ANY, port=8080)
+        mock_runner.return_value.run.assert_called_with()
+        [[_, [sock]], kwargs] = mock_runner.call_args
+        self.assertEqual(60, kwargs['drain_timeout'])
+        self.assertEqual(60, kwargs['reload_timeout'])
+        self.assertEqual(8080, sock.getsockname()[1])
 
-    @asynctest.mock.patch('aiohttp.web.run_app')
+    @asynctest.mock.patch('basic_auth.script.server.ServerRunner')
     @asynctest.mock.patch('basic_auth.script.server.setup_logging')
     # TODO frankban: reenable.
-    async def disable_test_main_server_port(self, _, mock_run_app):
+    async def disable_test_main_server_port(self, _, mock_runner):
         """A different application port can be specified in config file."""
         create_test_config(filename=self.config_path, port=9090)
-        self.addCleanup(self._close_db, mock_run_app)
+        self.addCleanup(self._close_db, mock_runner)
         main(raw_args=['--config', self.config_path])
-        mock_run_app.assert_called_with(mock.ANY, loop=mock.ANY, port=9090)
+        [[_, [sock]], _] = mock_runner.call_args
+        self.assertEqual(9090, sock.getsockname()[1])
@@ -0,0 +1,76 @@
+"""Coalescing of concurrent identical calls."""
+
+import asyncio
+
+from . import timing
+
+
+class SingleFlight:
+    """Share the result of concurrent calls for the same key.
+
+    While a call for a key is in flight, further calls for the same key wait
+    for its result instead of starting a new one. The call runs in a
+    separate task, so that cancelling one of the callers doesn't affect the
+    others.
+
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self._calls = {}
+
+    def __len__(self):
+        """Return the number of calls in flight."""
+        return len(self._calls)
+
+    async def call(self, key, func, *args, **kwargs):
+        """Call the coroutine function, or wait for a call in flight."""
+        future = self._calls.get(key)
+        if future is None:
+            future = self._start(key, func(*args, **kwargs))
+        return await asyncio.shield(future, loop=self.loop)
+
+    async def call_many(self, keys, func, *args, **kwargs):
+        """Get results for multiple keys, with a single call for missing ones.
+
+        Keys with a call in flight wait for its result. The coroutine
+        function is called once with the list of other keys as first
+        argument, and must return a dict with results for them (missing keys
+        get None). While it runs, calls for those keys wait for it too.
+
+        Return a dict with results for all keys.
+
+        """
+        futures = {key: self._calls.get(key) for key in keys}
+        missing = [key for key, future in futures.items() if future is None]
+        if missing:
+            batch = asyncio.ensure_future(
+                func(missing, *args, **kwargs), loop=self.loop)
+            timing.share(batch, loop=self.loop)
+            for key in missing:
+                futures[key] = self._start(key, _batch_result(batch, key))
+        results = await asyncio.shield(
+            asyncio.gather(*futures.values(), loop=self.loop),
+            loop=self.loop)
+        return dict(zip(futures, results))
+
+    def _start(self, key, coro):
+        future = asyncio.ensure_future(coro, loop=self.loop)
+        # Phases of the call are timed for the request starting it.
+        timing.share(future, loop=self.loop)
+        self._calls[key] = future
+        future.add_done_callback(lambda future: self._call_done(key, future))
+        return future
+
+    def _call_done(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Mark the exception as retrieved, in case all callers have been
+            # cancelled.
+            future.exception()
+
+
+async def _batch_result(batch, key):
+    """Return the result for a key from a batch call."""
+    return (await batch).get(key)
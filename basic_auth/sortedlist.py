@@ -0,0 +1,124 @@
+"""A sorted list supporting fast insertion, removal and range queries."""
+
+from bisect import (
+    bisect_left,
+    bisect_right,
+)
+from itertools import chain
+
+
+class SortedList:
+    """A list of unique values kept in sorted order.
+
+    Values are split in blocks of at most 2 * load values, along with the
+    maximum value of each block. Values are located by bisecting the maxima
+    and then the block, so insertions and removals take O(log n + load),
+    and iterating over k values from a given one takes O(log n + k).
+
+    """
+
+    def __init__(self, values=(), load=1000):
+        self.load = load
+        self._blocks = []
+        self._maxes = []
+        values = sorted(set(values))
+        for index in range(0, len(values), load):
+            block = values[index:index + load]
+            self._blocks.append(block)
+            self._maxes.append(block[-1])
+        self._len = len(values)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._blocks)
+
+    def __contains__(self, value):
+        index = bisect_left(self._maxes, value)
+        if index == len(self._maxes):
+            return False
+        block = self._blocks[index]
+        position = bisect_left(block, value)
+        return block[position] == value
+
+    def add(self, value):
+        """Add a value, if not already present."""
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            self._len = 1
+            return
+        index = bisect_left(self._maxes, value)
+        if index == len(self._maxes):
+            # Past the end, append to the last block.
+            index -= 1
+            self._blocks[index].append(value)
+            self._maxes[index] = value
+        else:
+            block = self._blocks[index]
+            position = bisect_left(block, value)
+            if block[position] == value:
+                return
+            block.insert(position, value)
+        self._len += 1
+        self._split(index)
+
+    def remove(self, value):
+        """Remove a value, raise ValueError if not present."""
+        index = bisect_left(self._maxes, value)
+        if index == len(self._maxes):
+            raise ValueError('{!r} not in list'.format(value))
+        block = self._blocks[index]
+        position = bisect_left(block, value)
+        if block[position] != value:
+            raise ValueError('{!r} not in list'.format(value))
+        del block[position]
+        self._len -= 1
+        if block:
+            self._maxes[index] = block[-1]
+        else:
+            del self._blocks[index]
+            del self._maxes[index]
+
+    def discard(self, value):
+        """Remove a value, if present."""
+        try:
+            self.remove(value)
+        except ValueError:
+            pass
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        """Iterate over values between minimum and maximum, in order.
+
+        If minimum or maximum are None, the range is unbounded on that side.
+        The inclusive tuple tells whether each bound is included.
+
+        """
+        if minimum is None:
+            index, position = 0, 0
+        else:
+            bisect = bisect_left if inclusive[0] else bisect_right
+            index = bisect(self._maxes, minimum)
+            if index == len(self._maxes):
+                return
+            position = bisect(self._blocks[index], minimum)
+        for index in range(index, len(self._blocks)):
+            for value in self._blocks[index][position:]:
+                if maximum is not None and (
+                        value > maximum or
+                        (value == maximum and not inclusive[1])):
+                    return
+                yield value
+            position = 0
+
+    def _split(self, index):
+        """Split a block in two if it's grown too large."""
+        block = self._blocks[index]
+        if len(block) <= 2 * self.load:
+            return
+        half = block[self.load:]
+        del block[self.load:]
+        self._maxes[index] = block[-1]
+        self._blocks.insert(index + 1, half)
+        self._maxes.insert(index + 1, half[-1])
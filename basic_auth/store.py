@@ -0,0 +1,126 @@
+"""Compact in-memory storage of credentials."""
+
+import hashlib
+import hmac
+import re
+import sys
+
+from .sortedlist import SortedList
+
+
+_HEXDIGEST_RE = re.compile('[0-9a-fA-F]{64}$')
+
+
+class CredentialsRecord:
+    """Credentials for a user, with the raw SHA256 digest of the password."""
+
+    __slots__ = ('user', 'username', 'digest')
+
+    def __init__(self, user, username, digest):
+        self.user = user
+        self.username = username
+        self.digest = digest
+
+    @property
+    def token(self):
+        """The "username:hexdigest" token for the credentials."""
+        return '{}:{}'.format(self.username, self.digest.hex())
+
+
+class CredentialsStore:
+    """Store credentials in memory, indexed by user and by username.
+
+    Each user takes a single CredentialsRecord, referenced by both indexes.
+    Password hashes are kept as raw 32-byte digests rather than hex strings,
+    and users and usernames are interned, so that the same string is shared
+    when they're equal.
+
+    Usernames are also kept in a SortedList, so that records can be iterated
+    in username order, from any username, without sorting them.
+
+    Lookups return records, which must not be modified.
+
+    """
+
+    def __init__(self):
+        self._by_user = {}
+        self._by_username = {}
+        self._usernames = SortedList()
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def __contains__(self, user):
+        return user in self._by_user
+
+    def __iter__(self):
+        return iter(self._by_user.values())
+
+    def get(self, user):
+        """Return the record for a user, None if not found."""
+        return self._by_user.get(user)
+
+    def get_by_username(self, username):
+        """Return the record for a username, None if not found."""
+        return self._by_username.get(username)
+
+    def set(self, user, username, digest):
+        """Add or replace credentials for a user, return the record.
+
+        The digest is the raw SHA256 digest of the password.
+
+        """
+        self.remove(user)
+        record = CredentialsRecord(
+            sys.intern(user), sys.intern(username), digest)
+        self._by_user[record.user] = record
+        self._by_username[record.username] = record
+        self._usernames.add(record.username)
+        return record
+
+    def set_hexdigest(self, user, username, hexdigest):
+        """Add or replace credentials with a hex digest of the password.
+
+        ValueError is raised if the digest is not a SHA256 hex digest.
+
+        """
+        if not _HEXDIGEST_RE.match(hexdigest):
+            raise ValueError('Invalid password hash: {!r}'.format(hexdigest))
+        return self.set(user, username, bytes.fromhex(hexdigest))
+
+    def remove(self, user):
+        """Remove credentials for a user, return whether they existed."""
+        record = self._by_user.pop(user, None)
+        if record is None:
+            return False
+        del self._by_username[record.username]
+        self._usernames.remove(record.username)
+        return True
+
+    def by_username(self, start=None, stop=None, after=None):
+        """Iterate over records in username order.
+
+        If start and/or stop are specified, only records with usernames
+        between them (both included) are returned. If after is specified,
+        only records following that username are returned.
+
+        """
+        if after is not None and (start is None or after >= start):
+            start, inclusive = after, False
+        else:
+            inclusive = True
+        for username in self._usernames.irange(
+                start, stop, inclusive=(inclusive, True)):
+            yield self._by_username[username]
+
+    def match(self, username, password):
+        """Return whether the password matches the username's one."""
+        record = self._by_username.get(username)
+        if record is None:
+            return False
+        return hmac.compare_digest(record.digest, password_digest(password))
+
+
+def password_digest(password):
+    """Return the raw SHA256 digest of a password."""
+    return hashlib.sha256(password.encode('utf-8')).digest()
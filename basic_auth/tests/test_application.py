@@ -10,9 +10,12 @@ from ..middleware import BaseBasicAuthMiddlewareFactory
 from ..application import (
     BasicAuthCheckApplication,
     setup_api_application,
-    setup_auth_check_application
+    setup_auth_check_application,
+    setup_internal_application,
 )
 from ..collection import MemoryCredentialsCollection
+from ..db.stats import QueryStats
+from ..profiler import Profiler
 
 
 class AuthCheckMiddlewareFactory(BaseBasicAuthMiddlewareFactory):
@@ -86,6 +89,56 @@ class SetupAPIApplicationTest(APIApplicationTestCase):
         self.assertEqual(401, response.status)
 
 
+class BatchAuthCheckTest(APIApplicationTestCase):
+
+    CONTENT_TYPE = 'application/json;profile=basic-auth.api;version=1.0'
+
+    async def get_application(self):
+        self.collection = MemoryCredentialsCollection(loop=self.loop)
+        return setup_api_application(self.collection)
+
+    async def auth_check(self, tokens, auth=('user', 'pass')):
+        return await self.client_request(
+            method='POST', path='/auth-check', json=tokens,
+            content_type=self.CONTENT_TYPE, auth=auth)
+
+    @unittest_run_loop
+    async def test_batch_auth_check(self):
+        """Results are returned for each token."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        response = await self.auth_check(
+            ['foo:bar', 'foo:baz', 'invalid', 'other:bar', 'foo:bar'])
+        self.assertEqual(200, response.status)
+        self.assertEqual(
+            [True, False, False, False, True], await response.json())
+
+    @unittest_run_loop
+    async def test_batch_auth_check_requires_auth(self):
+        """The batch auth check requires API credentials."""
+        response = await self.auth_check(['foo:bar'], auth=None)
+        self.assertEqual(401, response.status)
+
+    @unittest_run_loop
+    async def test_batch_auth_check_invalid_payload(self):
+        """The payload must be a non-empty list of tokens."""
+        for payload in ([], {'foo': 'bar'}, [1, 2]):
+            response = await self.auth_check(payload)
+            self.assertEqual(400, response.status)
+            self.assertEqual(
+                {'code': 'Bad Request',
+                 'message': 'Payload must be a list of tokens'},
+                await response.json())
+
+    @unittest_run_loop
+    async def test_batch_auth_check_too_many(self):
+        """The number of tokens in a request is limited."""
+        response = await self.auth_check(['foo:bar'] * 1001)
+        self.assertEqual(400, response.status)
+        self.assertEqual(
+            {'code': 'Bad Request', 'message': 'At most 1000 tokens allowed'},
+            await response.json())
+
+
 class SetupAuthCheckApplicationTest(AioHTTPTestCase):
 
     async def get_application(self):
@@ -97,3 +150,58 @@ class SetupAuthCheckApplicationTest(AioHTTPTestCase):
         """An application for the Basic-Auth check is set up."""
         response = await self.client.request('GET', '/')
         self.assertEqual(401, response.status)
+
+
+class SetupInternalApplicationTest(AioHTTPTestCase):
+
+    async def get_application(self):
+        collection = MemoryCredentialsCollection(loop=self.loop)
+        return setup_internal_application(
+            collection, query_stats=QueryStats(),
+            profiler=Profiler(interval=0.001, loop=self.loop))
+
+    @unittest_run_loop
+    async def test_requires_auth(self):
+        """Internal endpoints require API credentials."""
+        response = await self.client.request('GET', '/query-stats')
+        self.assertEqual(401, response.status)
+
+    @unittest_run_loop
+    async def test_query_stats(self):
+        """Query statistics are returned."""
+        auth = basic_auth_header('user', 'pass')
+        response = await self.client.request(
+            'GET', '/query-stats', headers=auth)
+        self.assertEqual(200, response.status)
+        self.assertEqual({}, await response.json())
+
+    @unittest_run_loop
+    async def test_loop_lag_disabled(self):
+        """Without a loop lag monitor, a 404 error is returned."""
+        auth = basic_auth_header('user', 'pass')
+        response = await self.client.request('GET', '/loop-lag', headers=auth)
+        self.assertEqual(404, response.status)
+
+    @unittest_run_loop
+    async def test_profile(self):
+        """The server can be profiled."""
+        auth = basic_auth_header('user', 'pass')
+        response = await self.client.request(
+            'POST', '/profile?duration=0.01', headers=auth)
+        self.assertEqual(200, response.status)
+        self.assertEqual('text/plain', response.content_type)
+
+
+class SetupInternalApplicationNoProfilerTest(AioHTTPTestCase):
+
+    async def get_application(self):
+        collection = MemoryCredentialsCollection(loop=self.loop)
+        return setup_internal_application(collection)
+
+    @unittest_run_loop
+    async def test_profile_not_found(self):
+        """Without a profiler, the profile endpoint is not available."""
+        auth = basic_auth_header('user', 'pass')
+        response = await self.client.request(
+            'POST', '/profile?duration=0.01', headers=auth)
+        self.assertEqual(404, response.status)
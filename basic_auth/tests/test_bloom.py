@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+from ..bloom import BloomFilter
+
+
+class BloomFilterTest(TestCase):
+
+    def test_contains(self):
+        """Added items are contained in the filter."""
+        bloom = BloomFilter(100)
+        bloom.add('foo')
+        bloom.add('bar')
+        self.assertIn('foo', bloom)
+        self.assertIn('bar', bloom)
+
+    def test_not_contains(self):
+        """Items not added are not contained in the filter."""
+        bloom = BloomFilter(100)
+        bloom.add('foo')
+        self.assertNotIn('baz', bloom)
+
+    def test_len(self):
+        """The filter length is the number of added items."""
+        bloom = BloomFilter(100)
+        self.assertEqual(0, len(bloom))
+        bloom.add('foo')
+        bloom.add('bar')
+        self.assertEqual(2, len(bloom))
+
+    def test_size(self):
+        """The filter size depends on capacity and error rate."""
+        self.assertEqual(1798, BloomFilter(1000, error_rate=0.001).size)
+        self.assertEqual(1199, BloomFilter(1000, error_rate=0.01).size)
+        self.assertEqual(17972, BloomFilter(10000, error_rate=0.001).size)
+
+    def test_error_rate(self):
+        """The false positives rate is close to the requested one."""
+        bloom = BloomFilter(10000, error_rate=0.01)
+        for index in range(10000):
+            bloom.add('user-{}'.format(index))
+        false_positives = sum(
+            'other-{}'.format(index) in bloom for index in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_invalid_capacity(self):
+        """Capacity must be positive."""
+        with self.assertRaises(ValueError) as cm:
+            BloomFilter(0)
+        self.assertEqual(
+            'Capacity must be a positive number', str(cm.exception))
+
+    def test_invalid_error_rate(self):
+        """Error rate must be between 0 and 1."""
+        with self.assertRaises(ValueError) as cm:
+            BloomFilter(10, error_rate=1)
+        self.assertEqual(
+            'Error rate must be between 0 and 1', str(cm.exception))
@@ -0,0 +1,225 @@
+import asyncio
+
+import asynctest
+
+import fixtures
+
+from ..breaker import (
+    CircuitBreaker,
+    CircuitOpen,
+    DecisionStore,
+)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, loop=self.loop,
+            clock=self.clock)
+        self.calls = 0
+
+    async def succeed(self):
+        self.calls += 1
+        return 'result'
+
+    async def fail(self):
+        self.calls += 1
+        raise OSError('down')
+
+    async def trip(self, func=None, error=OSError):
+        for _ in range(2):
+            with self.assertRaises(error):
+                await self.breaker.call(func or self.fail)
+
+    async def test_call(self):
+        """While closed, calls go through."""
+        self.assertEqual('result', await self.breaker.call(self.succeed))
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    async def test_open_after_failures(self):
+        """After consecutive failures, calls are refused."""
+        await self.trip()
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.clock.now = 4
+        with self.assertRaises(CircuitOpen) as cm:
+            await self.breaker.call(self.succeed)
+        self.assertEqual(6, cm.exception.retry_after)
+        self.assertEqual(2, self.calls)
+        self.assertIn(
+            'circuit breaker open after 2 failures', self.logger.output)
+
+    async def test_success_resets_failures(self):
+        """Failures must be consecutive to open the breaker."""
+        with self.assertRaises(OSError):
+            await self.breaker.call(self.fail)
+        await self.breaker.call(self.succeed)
+        with self.assertRaises(OSError):
+            await self.breaker.call(self.fail)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    async def test_other_errors_ignored(self):
+        """Errors not listed as failures don't open the breaker."""
+        async def error():
+            raise ValueError('wrong')
+
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                await self.breaker.call(error)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    async def test_other_errors_reset_failures(self):
+        """Errors not listed as failures count as successes."""
+        async def error():
+            raise ValueError('wrong')
+
+        with self.assertRaises(OSError):
+            await self.breaker.call(self.fail)
+        with self.assertRaises(ValueError):
+            await self.breaker.call(error)
+        with self.assertRaises(OSError):
+            await self.breaker.call(self.fail)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    async def test_call_timeout(self):
+        """Calls taking too long count as failures."""
+        self.breaker.call_timeout = 0.01
+
+        async def slow():
+            await asyncio.sleep(1, loop=self.loop)
+
+        await self.trip(slow, asyncio.TimeoutError)
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+
+    async def test_half_open_probe_success(self):
+        """After the reset timeout, a successful probe closes the breaker."""
+        await self.trip()
+        self.clock.now = 10
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertEqual('result', await self.breaker.call(self.succeed))
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertIn('circuit breaker closed', self.logger.output)
+
+    async def test_half_open_probe_failure(self):
+        """A failed probe opens the breaker again."""
+        await self.trip()
+        self.clock.now = 10
+        with self.assertRaises(OSError):
+            await self.breaker.call(self.fail)
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        with self.assertRaises(CircuitOpen) as cm:
+            await self.breaker.call(self.succeed)
+        self.assertEqual(10, cm.exception.retry_after)
+
+    async def test_half_open_probe_other_error(self):
+        """A probe raising an unlisted error closes the breaker."""
+        async def error():
+            raise ValueError('wrong')
+
+        await self.trip()
+        self.clock.now = 10
+        with self.assertRaises(ValueError):
+            await self.breaker.call(error)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    async def test_half_open_single_probe(self):
+        """Only one call is let through while probing."""
+        await self.trip()
+        self.clock.now = 10
+        probe_started = asyncio.Event(loop=self.loop)
+        finish_probe = asyncio.Event(loop=self.loop)
+
+        async def probe():
+            probe_started.set()
+            await finish_probe.wait()
+            return 'probed'
+
+        task = asyncio.ensure_future(
+            self.breaker.call(probe), loop=self.loop)
+        await probe_started.wait()
+        with self.assertRaises(CircuitOpen):
+            await self.breaker.call(self.succeed)
+        finish_probe.set()
+        self.assertEqual('probed', await task)
+        self.assertEqual('result', await self.breaker.call(self.succeed))
+
+
+class DecisionStoreTest(asynctest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.store = DecisionStore(
+            max_entries=2, max_staleness=60, clock=self.clock)
+
+    def test_match(self):
+        """Recorded credentials match."""
+        self.store.add('user', 'pass')
+        self.assertTrue(self.store.match('user', 'pass'))
+
+    def test_match_wrong_password(self):
+        """A different password doesn't match."""
+        self.store.add('user', 'pass')
+        self.assertFalse(self.store.match('user', 'wrong'))
+
+    def test_match_unknown(self):
+        """Unknown usernames don't match."""
+        self.assertFalse(self.store.match('user', 'pass'))
+
+    def test_match_stale(self):
+        """Entries older than the maximum staleness don't match."""
+        self.store.add('user', 'pass')
+        self.clock.now = 61
+        self.assertFalse(self.store.match('user', 'pass'))
+        self.assertEqual(0, len(self.store))
+
+    def test_add_refreshes(self):
+        """Recording credentials again refreshes them."""
+        self.store.add('user', 'pass')
+        self.clock.now = 50
+        self.store.add('user', 'pass')
+        self.clock.now = 100
+        self.assertTrue(self.store.match('user', 'pass'))
+
+    def test_max_entries(self):
+        """Least recently recorded entries are evicted."""
+        self.store.add('user1', 'pass')
+        self.store.add('user2', 'pass')
+        self.store.add('user1', 'pass')
+        self.store.add('user3', 'pass')
+        self.assertEqual(2, len(self.store))
+        self.assertFalse(self.store.match('user2', 'pass'))
+        self.assertTrue(self.store.match('user1', 'pass'))
+        self.assertTrue(self.store.match('user3', 'pass'))
+
+    def test_evict(self):
+        """Evicted usernames don't match."""
+        self.store.add('user', 'pass')
+        self.store.evict('user')
+        self.assertFalse(self.store.match('user', 'pass'))
+        self.assertEqual(0, len(self.store))
+
+    def test_evict_unknown(self):
+        """Evicting an unknown username is a no-op."""
+        self.store.evict('user')
+        self.assertEqual(0, len(self.store))
+
+    def test_passwords_not_stored(self):
+        """Passwords are not stored in clear."""
+        self.store.add('user', 'pass')
+        digest, _ = self.store._entries['user']
+        self.assertNotIn(b'pass', digest)
@@ -1,17 +1,33 @@
+import asyncio
+from datetime import (
+    datetime,
+    timedelta,
+)
+import io
+
 import asynctest
 
+from aiopg.sa import create_engine
+
 from ..collection import (
     MemoryCredentialsCollection,
     DataBaseCredentialsCollection,
 )
 from ..credential import hash_token256
+from ..breaker import (
+    CircuitBreaker,
+    DecisionStore,
+)
 from ..api.error import (
     InvalidResourceDetails,
     ResourceAlreadyExists,
     ResourceNotFound,
 )
 from ..db import Model
+from ..db.replica import ReplicaSet
 from ..db.testing import DataBaseTest
+from ..testing import TEST_DB_DSN
+from ..usage import UsageRecorder
 
 
 class CredentialsCollectionTest:
@@ -31,6 +47,14 @@ class CredentialsCollectionTest:
         details = await self.collection.get('foo')
         self.assertIsNotNone(details['token'])
 
+    async def test_create_random_token_match(self):
+        """Generated credentials are returned, and match."""
+        user, details = await self.collection.create(
+            {'user': 'foo', 'token': None})
+        username, password = details['token'].split(':')
+        self.assertTrue(
+            await self.collection.credentials_match(username, password))
+
     async def test_create_user_exists(self):
         """If the user already exists, an error is raised."""
         await self.collection.create({'user': 'foo', 'token': None})
@@ -55,6 +79,19 @@ class CredentialsCollectionTest:
         )
         self.assertEqual(creds, expected_creds)
 
+    async def test_get_all_paginated(self):
+        """Credentials can be listed in pages, by username."""
+        await self.collection.create({'user': 'who', 'token': 'w:secret'})
+        await self.collection.create({'user': 'rose', 'token': 'r:secret'})
+        await self.collection.create({'user': 'amy', 'token': 'a:secret'})
+        creds = list(await self.collection.get_all(limit=2))
+        self.assertEqual(
+            [{'user': 'amy', 'username': 'a'},
+             {'user': 'rose', 'username': 'r'}],
+            creds)
+        creds = list(await self.collection.get_all(after='r', limit=2))
+        self.assertEqual([{'user': 'who', 'username': 'w'}], creds)
+
     async def test_get_all_empty(self):
         """Empty credentials are properly returned."""
         creds = list(await self.collection.get_all())
@@ -121,6 +158,19 @@ class CredentialsCollectionTest:
         self.assertFalse(await self.collection.credentials_match('foo', 'baz'))
         self.assertFalse(await self.collection.credentials_match('baz', 'bar'))
 
+    async def test_credentials_match_many(self):
+        """credentials_match_many checks multiple credentials at once."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        await self.collection.create({'user': 'baz', 'token': 'baz:bza'})
+        results = await self.collection.credentials_match_many(
+            [('foo', 'bar'), ('baz', 'wrong'), ('other', 'bar'),
+             ('baz', 'bza')])
+        self.assertEqual([True, False, False, True], results)
+
+    async def test_credentials_match_many_empty(self):
+        """credentials_match_many returns an empty list if no credentials."""
+        self.assertEqual([], await self.collection.credentials_match_many([]))
+
 
 class MemoryCredentialsCollectionTest(asynctest.TestCase,
                                       CredentialsCollectionTest):
@@ -141,6 +191,57 @@ class MemoryCredentialsCollectionTest(asynctest.TestCase,
         self.assertFalse(
             await self.collection.api_credentials_match('foo', 'bar'))
 
+    async def test_load_snapshot(self):
+        """Credentials can be loaded from a snapshot."""
+        snapshot = io.StringIO(
+            'foo\tbar\t{}\t2018-01-01T00:00:00\n'.format(
+                hash_token256('baz')))
+        self.collection.load_snapshot(snapshot)
+        self.assertEqual(
+            {'user': 'foo', 'token': 'bar:{}'.format(hash_token256('baz'))},
+            await self.collection.get('foo'))
+        self.assertTrue(await self.collection.credentials_match('bar', 'baz'))
+
+    def test_load_snapshot_invalid_hash(self):
+        """An error is raised for lines with an invalid password hash."""
+        snapshot = io.StringIO(
+            'foo\tbar\t{}\t2018-01-01T00:00:00\n'
+            'baz\tbza\tnot-a-hash\t2018-01-01T00:00:00\n'.format(
+                hash_token256('baz')))
+        with self.assertRaises(ValueError) as cm:
+            self.collection.load_snapshot(snapshot)
+        self.assertEqual(
+            "Invalid snapshot line 2: Invalid password hash: 'not-a-hash'",
+            str(cm.exception))
+
+    def test_load_snapshot_missing_fields(self):
+        """An error is raised for lines with missing fields."""
+        with self.assertRaises(ValueError) as cm:
+            self.collection.load_snapshot(io.StringIO('foo\tbar\n'))
+        self.assertEqual(
+            'Invalid snapshot line 1: Missing fields', str(cm.exception))
+
+    async def test_create_missing_user(self):
+        """If the user is missing, an error is raised."""
+        with self.assertRaises(InvalidResourceDetails):
+            await self.collection.create({'token': 'foo:bar'})
+
+    async def test_create_returns_hashed_token(self):
+        """Provided passwords are returned hashed."""
+        _, details = await self.collection.create(
+            {'user': 'foo', 'token': 'bar:baz'})
+        self.assertEqual(
+            {'user': 'foo', 'token': 'bar:{}'.format(hash_token256('baz'))},
+            details)
+
+    async def test_update_returns_hashed_token(self):
+        """Provided passwords are returned hashed on update."""
+        await self.collection.create({'user': 'foo', 'token': 'bar:baz'})
+        details = await self.collection.update('foo', {'token': 'bar:new'})
+        self.assertEqual(
+            {'user': 'foo', 'token': 'bar:{}'.format(hash_token256('new'))},
+            details)
+
 
 class DataBaseCredentialsCollectionTest(DataBaseTest,
                                         CredentialsCollectionTest):
@@ -148,7 +249,8 @@ class DataBaseCredentialsCollectionTest(DataBaseTest,
     async def setUp(self):
         await super().setUp()
         self.model = Model(self.conn)
-        self.collection = DataBaseCredentialsCollection(self.engine)
+        self.collection = DataBaseCredentialsCollection(
+            self.engine, loop=self.loop)
 
     async def test_rollback_on_error(self):
         """If an error happens in the call, the transaction is aborted."""
@@ -173,3 +275,262 @@ class DataBaseCredentialsCollectionTest(DataBaseTest,
         """api_credentials_match returns False if no match is found."""
         self.assertFalse(
             await self.collection.api_credentials_match('foo', 'bar'))
+
+    async def test_credentials_match_coalesced(self):
+        """Concurrent checks for the same username share a lookup."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        calls = []
+        get_credentials = self.collection._get_credentials_by_username
+
+        async def get_credentials_by_username(username):
+            calls.append(username)
+            return await get_credentials(username)
+
+        self.collection._get_credentials_by_username = (
+            get_credentials_by_username)
+        results = await asyncio.gather(
+            self.collection.credentials_match('foo', 'bar'),
+            self.collection.credentials_match('foo', 'baz'),
+            self.collection.credentials_match('foo', 'bar'),
+            loop=self.loop)
+        self.assertEqual([True, False, True], results)
+        self.assertEqual(['foo'], calls)
+
+    async def test_credentials_match_many_single_lookup(self):
+        """Batch checks look up all usernames at once."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        await self.collection.create({'user': 'baz', 'token': 'baz:bza'})
+        calls = []
+        get_credentials = self.collection._get_credentials_by_usernames
+
+        async def get_credentials_by_usernames(usernames):
+            calls.append(sorted(usernames))
+            return await get_credentials(usernames)
+
+        self.collection._get_credentials_by_usernames = (
+            get_credentials_by_usernames)
+        # The batch check starts first, so the single check shares its
+        # lookup.
+        batch = asyncio.ensure_future(
+            self.collection.credentials_match_many(
+                [('foo', 'bar'), ('baz', 'bza'), ('foo', 'wrong')]),
+            loop=self.loop)
+        await asyncio.sleep(0, loop=self.loop)
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        self.assertEqual([True, True, False], await batch)
+        self.assertEqual([['baz', 'foo']], calls)
+
+    async def test_credentials_match_many_username_filter(self):
+        """Unknown usernames in batch checks are not looked up."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        await self.collection.load_username_filter(100)
+        calls = []
+        get_credentials = self.collection._get_credentials_by_usernames
+
+        async def get_credentials_by_usernames(usernames):
+            calls.append(usernames)
+            return await get_credentials(usernames)
+
+        self.collection._get_credentials_by_usernames = (
+            get_credentials_by_usernames)
+        results = await self.collection.credentials_match_many(
+            [('foo', 'bar'), ('unknown', 'bar')])
+        self.assertEqual([True, False], results)
+        self.assertEqual([['foo']], calls)
+
+    async def test_load_username_filter(self):
+        """The filter of known usernames can be loaded from the database."""
+        self.collection.username_filter_batch_size = 2
+        for index in range(5):
+            await self.model.add_credentials(
+                'user{}'.format(index), 'username{}'.format(index), 'pass')
+        await self.txn.commit()
+        await self.collection.load_username_filter(100)
+        self.assertEqual(5, len(self.collection.username_filter))
+        self.assertIn('username0', self.collection.username_filter)
+        self.assertIn('username4', self.collection.username_filter)
+
+    async def test_credentials_match_username_filter(self):
+        """Unknown usernames are rejected without querying the database."""
+        await self.collection.load_username_filter(100)
+        self.collection._credentials_match = asynctest.CoroutineMock()
+        self.assertFalse(await self.collection.credentials_match('foo', 'bar'))
+        self.collection._credentials_match.assert_not_called()
+
+    async def test_credentials_match_records_usage(self):
+        """Successful checks are recorded, if tracking usage."""
+        self.collection.usage = UsageRecorder(self.engine)
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        await self.collection.credentials_match('foo', 'bar')
+        await self.collection.credentials_match('foo', 'wrong')
+        await self.collection.credentials_match_many(
+            [('foo', 'bar'), ('foo', 'wrong')])
+        self.assertEqual(2, self.collection.usage._pending['foo'][1])
+
+    async def test_get_all_idle_since(self):
+        """Credentials not used since a date can be listed."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        await self.collection.create({'user': 'baz', 'token': 'baz:bza'})
+        self.collection.usage = UsageRecorder(self.engine)
+        await self.collection.credentials_match('foo', 'bar')
+        await self.collection.usage.flush()
+        creds = tuple(await self.collection.get_all(
+            idle_since=datetime.utcnow() - timedelta(1)))
+        self.assertEqual(({'user': 'baz', 'username': 'baz'},), creds)
+
+    async def test_username_filter_updated(self):
+        """Created and updated usernames are added to the filter."""
+        await self.collection.load_username_filter(100)
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        await self.collection.update('foo', {'token': 'baz:bar'})
+        self.assertTrue(await self.collection.credentials_match('baz', 'bar'))
+
+
+class RecordingReplicaSet(ReplicaSet):
+    """A ReplicaSet recording selected engines."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selected = []
+
+    def engine(self):
+        engine = super().engine()
+        self.selected.append(engine)
+        return engine
+
+
+class DataBaseCredentialsCollectionReplicasTest(DataBaseTest):
+
+    async def setUp(self):
+        await super().setUp()
+        # The replica is a separate engine for the same database.
+        self.replica = await create_engine(dsn=TEST_DB_DSN, loop=self.loop)
+        self.replicas = RecordingReplicaSet(
+            self.engine, [self.replica], loop=self.loop)
+        self.collection = DataBaseCredentialsCollection(
+            self.engine, loop=self.loop, replicas=self.replicas)
+
+    async def tearDown(self):
+        self.replica.terminate()
+        await self.replica.wait_closed()
+        await super().tearDown()
+
+    async def test_reads_use_replica(self):
+        """Read-only operations are performed on replicas."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        self.assertEqual([], self.replicas.selected)
+        await self.collection.get('foo')
+        await self.collection.get_all()
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        await self.collection.api_credentials_match('foo', 'bar')
+        self.assertEqual([self.replica] * 4, self.replicas.selected)
+
+    async def test_read_your_writes(self):
+        """After a change, reads go to the primary for a while."""
+        self.replicas.read_your_writes = 60
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        self.assertEqual([self.engine], self.replicas.selected)
+
+
+class UnreachableEngine:
+    """An engine failing to connect to the database."""
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        raise OSError('Connection refused')
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class DataBaseCredentialsCollectionDegradedTest(DataBaseTest):
+
+    async def setUp(self):
+        await super().setUp()
+        self.breaker = CircuitBreaker(failure_threshold=1, loop=self.loop)
+        self.collection = DataBaseCredentialsCollection(
+            self.engine, loop=self.loop, breaker=self.breaker,
+            decisions=DecisionStore())
+
+    async def test_known_good_decisions(self):
+        """While the database is down, recent matches are used."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        self.collection.engine = UnreachableEngine()
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        self.assertFalse(
+            await self.collection.credentials_match('foo', 'wrong'))
+
+    async def test_unknown_rejected(self):
+        """While the database is down, unknown credentials are rejected."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        self.collection.engine = UnreachableEngine()
+        self.assertFalse(
+            await self.collection.credentials_match('foo', 'bar'))
+
+    async def test_delete_forgets_decisions(self):
+        """Recent matches for deleted credentials are not used."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        await self.collection.delete('foo')
+        self.collection.engine = UnreachableEngine()
+        self.assertFalse(
+            await self.collection.credentials_match('foo', 'bar'))
+
+    async def test_update_forgets_decisions(self):
+        """Recent matches for updated credentials are not used."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        await self.collection.create({'user': 'baz', 'token': 'baz:bza'})
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        self.assertTrue(await self.collection.credentials_match('baz', 'bza'))
+        await self.collection.update('foo', {'token': 'new:pass'})
+        await self.collection.update('baz', {'token': 'baz:other'})
+        self.collection.engine = UnreachableEngine()
+        self.assertFalse(
+            await self.collection.credentials_match('foo', 'bar'))
+        self.assertFalse(
+            await self.collection.credentials_match('baz', 'bza'))
+
+    async def test_not_found_resets_failures(self):
+        """Errors other than unavailability don't open the breaker."""
+        self.breaker.failure_threshold = 2
+        engine = self.collection.engine
+        self.collection.engine = UnreachableEngine()
+        await self.collection.credentials_match('foo', 'bar')
+        self.collection.engine = engine
+        with self.assertRaises(ResourceNotFound):
+            await self.collection.get('foo')
+        self.collection.engine = UnreachableEngine()
+        await self.collection.credentials_match('foo', 'bar')
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    async def test_credentials_match_many(self):
+        """Batch checks use recent matches while the database is down."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        await self.collection.create({'user': 'baz', 'token': 'baz:bza'})
+        self.assertEqual(
+            [True], await self.collection.credentials_match_many(
+                [('foo', 'bar')]))
+        self.collection.engine = UnreachableEngine()
+        self.assertEqual(
+            [True, False, False],
+            await self.collection.credentials_match_many(
+                [('foo', 'bar'), ('foo', 'wrong'), ('baz', 'bza')]))
+
+    async def test_recovery(self):
+        """Once the database is back, checks use it again."""
+        await self.collection.create({'user': 'foo', 'token': 'foo:bar'})
+        engine = self.collection.engine
+        self.collection.engine = UnreachableEngine()
+        self.assertFalse(
+            await self.collection.credentials_match('foo', 'bar'))
+        self.collection.engine = engine
+        self.breaker.reset_timeout = 0
+        self.assertTrue(await self.collection.credentials_match('foo', 'bar'))
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
@@ -1,8 +1,11 @@
+import random
 from unittest import TestCase
 
 from ..credential import (
+    TOKEN_CHARS,
     BasicAuthCredentials,
     generate_random_token,
+    generate_random_tokens,
     hash_token1,
     hash_token256,
     match_token1,
@@ -29,6 +32,27 @@ class BasicAuthCredentialsTest(TestCase):
         self.assertNotEqual(
             BasicAuthCredentials.generate(), BasicAuthCredentials.generate())
 
+    def test_generate_many(self):
+        """A list of random BasicAuthCredentials can be generated."""
+        credentials = BasicAuthCredentials.generate_many(10)
+        self.assertEqual(10, len(credentials))
+        self.assertEqual(10, len(set(credentials)))
+        for creds in credentials:
+            self.assertIsInstance(creds, BasicAuthCredentials)
+            self.assertEqual(20, len(creds.username))
+            self.assertEqual(20, len(creds.password))
+
+    def test_generate_many_deterministic(self):
+        """A custom random bytes source can be used."""
+        rng1, rng2 = random.Random(1), random.Random(1)
+        self.assertEqual(
+            BasicAuthCredentials.generate_many(
+                5, randbytes=lambda size: bytes(
+                    rng1.getrandbits(8) for _ in range(size))),
+            BasicAuthCredentials.generate_many(
+                5, randbytes=lambda size: bytes(
+                    rng2.getrandbits(8) for _ in range(size))))
+
     def test_str(self):
         """BasicAuthCredentials can be printed as a token string."""
         creds = BasicAuthCredentials('foo', 'bar')
@@ -52,6 +76,38 @@ class GenerateRandomTokenTest(TestCase):
         self.assertEqual(10, len(generate_random_token(length=10)))
         self.assertEqual(30, len(generate_random_token(length=30)))
 
+    def test_chars(self):
+        """Tokens are made of letters and digits."""
+        token = generate_random_token(length=1000)
+        self.assertLessEqual(set(token), set(TOKEN_CHARS))
+
+    def test_discarded_bytes(self):
+        """Bytes that would bias the result are discarded."""
+        data = [bytes([255, 248, 0, 61]), bytes([62, 250, 1])]
+        token = generate_random_token(
+            length=4, randbytes=lambda size: data.pop(0))
+        self.assertEqual('a9ab', token)
+
+
+class GenerateRandomTokensTest(TestCase):
+
+    def test_generate(self):
+        """A list of random tokens can be generated."""
+        tokens = generate_random_tokens(100)
+        self.assertEqual(100, len(tokens))
+        self.assertEqual(100, len(set(tokens)))
+        for token in tokens:
+            self.assertEqual(20, len(token))
+
+    def test_length(self):
+        """Tokens are generated with the specified length."""
+        for token in generate_random_tokens(10, length=5):
+            self.assertEqual(5, len(token))
+
+    def test_empty(self):
+        """No token is generated if count is zero."""
+        self.assertEqual([], generate_random_tokens(0))
+
 
 class HashTokenTest(TestCase):
 
@@ -1,5 +1,20 @@
+import json
+
 from ..testing import HandlerTestCase
-from ..handler import root
+from aiohttp import web
+
+from ..db.stats import QueryStats
+from ..handler import (
+    live,
+    loop_lag,
+    profile,
+    query_stats,
+    ready,
+    root,
+)
+from ..health import HealthMonitor
+from ..looplag import LoopLagMonitor
+from ..profiler import Profiler
 
 
 class RootTest(HandlerTestCase):
@@ -9,3 +24,115 @@ class RootTest(HandlerTestCase):
         response = await root(self.get_request())
         self.assertEqual(
             'HTTP basic-authorization backend and API service.', response.text)
+
+
+class LiveTest(HandlerTestCase):
+
+    async def test_live(self):
+        """The liveness probe always succeeds."""
+        response = await live(self.get_request())
+        self.assertEqual(200, response.status)
+        self.assertEqual({'status': 'ok'}, json.loads(response.text))
+
+
+class ReadyTest(HandlerTestCase):
+
+    def create_app(self):
+        app = super().create_app()
+        app['health'] = HealthMonitor(loop=self.loop)
+        return app
+
+    async def test_ready(self):
+        """The readiness probe succeeds if the service is ready."""
+        response = await ready(self.get_request())
+        self.assertEqual(200, response.status)
+        self.assertEqual(
+            {'ready': True, 'components': {}}, json.loads(response.text))
+
+    async def test_not_ready(self):
+        """The readiness probe fails if the service is not ready."""
+        self.app['health'].require('cache')
+        response = await ready(self.get_request())
+        self.assertEqual(503, response.status)
+        self.assertEqual(
+            {'ready': False, 'components': {'cache': False}},
+            json.loads(response.text))
+
+
+class QueryStatsTest(HandlerTestCase):
+
+    async def test_query_stats(self):
+        """Query statistics are returned by shape."""
+        stats = QueryStats()
+        stats.record('get_credentials', 'SELECT 1', 0.002, 1)
+        self.app['query-stats'] = stats
+        response = await query_stats(self.get_request())
+        self.assertEqual(200, response.status)
+        self.assertEqual(
+            {'get_credentials': {
+                'count': 1, 'total': 2.0, 'mean': 2.0, 'p99': 2.0,
+                'rows': 1, 'slow': 0}},
+            json.loads(response.text))
+
+    async def test_query_stats_disabled(self):
+        """If query statistics are disabled, a 404 error is returned."""
+        with self.assertRaises(web.HTTPNotFound):
+            await query_stats(self.get_request())
+
+
+class LoopLagTest(HandlerTestCase):
+
+    async def test_loop_lag(self):
+        """Event loop lag statistics are returned."""
+        monitor = LoopLagMonitor(loop=self.loop)
+        monitor.histogram.record(0.002)
+        self.app['loop-lag'] = monitor
+        response = await loop_lag(self.get_request())
+        self.assertEqual(200, response.status)
+        self.assertEqual(
+            {'count': 1, 'mean': 2.0, 'max': 2.0,
+             'buckets': {
+                 '1': 0, '5': 1, '10': 0, '50': 0, '100': 0, '500': 0,
+                 '1000': 0, '+Inf': 0},
+             'blocked': []},
+            json.loads(response.text))
+
+    async def test_loop_lag_disabled(self):
+        """If the loop lag monitor is disabled, a 404 error is returned."""
+        with self.assertRaises(web.HTTPNotFound):
+            await loop_lag(self.get_request())
+
+
+class ProfileTest(HandlerTestCase):
+
+    def create_app(self):
+        app = super().create_app()
+        app['profiler'] = Profiler(interval=0.001, duration=0.01)
+        return app
+
+    async def test_profile(self):
+        """Collapsed stacks are returned."""
+        response = await profile(
+            self.get_request(path='/profile?duration=0.01', method='POST'))
+        self.assertEqual(200, response.status)
+        self.assertEqual('text/plain', response.content_type)
+
+    async def test_profile_invalid_duration(self):
+        """If the duration is invalid, a 400 error is returned."""
+        for duration in ('foo', '0', '1000'):
+            request = self.get_request(
+                path='/profile?duration=' + duration, method='POST')
+            with self.assertRaises(web.HTTPBadRequest):
+                await profile(request)
+
+    async def test_profile_disabled(self):
+        """If the profiler is not set, a 404 error is returned."""
+        self.app['profiler'] = None
+        with self.assertRaises(web.HTTPNotFound):
+            await profile(self.get_request(path='/profile', method='POST'))
+
+    async def test_profile_busy(self):
+        """If a profile is already running, a 409 error is returned."""
+        self.app['profiler']._running = True
+        with self.assertRaises(web.HTTPConflict):
+            await profile(self.get_request(path='/profile', method='POST'))
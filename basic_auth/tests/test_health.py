@@ -0,0 +1,142 @@
+import asyncio
+
+import asynctest
+
+import fixtures
+
+from ..health import HealthMonitor
+
+
+class FakeConnection:
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def __aenter__(self):
+        if self.engine.error:
+            raise self.engine.error
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def execute(self, query):
+        self.engine.queries.append(query)
+
+
+class FakeEngine:
+
+    minsize = 2
+    maxsize = 10
+    size = 2
+    freesize = 2
+
+    def __init__(self):
+        self.error = None
+        self.queries = []
+
+    def acquire(self):
+        return FakeConnection(self)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class HealthMonitorTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.engine = FakeEngine()
+        self.clock = FakeClock()
+        self.monitor = HealthMonitor(
+            engine=self.engine, interval=5, loop=self.loop, clock=self.clock)
+
+    async def test_not_ready_before_check(self):
+        """The service is not ready until the database has been checked."""
+        self.assertFalse(self.monitor.ready)
+        await self.monitor.check_db()
+        self.assertEqual(['SELECT 1'], self.engine.queries)
+        self.assertTrue(self.monitor.ready)
+
+    async def test_db_error(self):
+        """The service is not ready if the database check fails."""
+        self.engine.error = ConnectionError('no db')
+        await self.monitor.check_db()
+        self.assertFalse(self.monitor.ready)
+        self.assertIn('database health check failed', self.logger.output)
+        self.assertIn('no db', self.monitor.status()['db']['error'])
+
+    async def test_db_recovery(self):
+        """The service is ready again once the database check succeeds."""
+        self.engine.error = ConnectionError('no db')
+        await self.monitor.check_db()
+        self.engine.error = None
+        await self.monitor.check_db()
+        self.assertTrue(self.monitor.ready)
+
+    async def test_db_timeout(self):
+        """The database check fails if it doesn't complete in time."""
+
+        async def ping():
+            await asyncio.sleep(1, loop=self.loop)
+
+        monitor = HealthMonitor(
+            engine=self.engine, timeout=0.01, loop=self.loop)
+        monitor._ping = ping
+        await monitor.check_db()
+        self.assertFalse(monitor.ready)
+
+    async def test_db_check_stale(self):
+        """The service is not ready if database checks are stale."""
+        await self.monitor.check_db()
+        self.clock.now = 16
+        self.assertFalse(self.monitor.ready)
+
+    async def test_pool_not_filled(self):
+        """The service is not ready if the pool lacks connections."""
+        await self.monitor.check_db()
+        self.engine.size = 1
+        self.assertFalse(self.monitor.ready)
+
+    async def test_components_warm(self):
+        """The service is ready once all required components are warm."""
+        await self.monitor.check_db()
+        self.monitor.require('cache')
+        self.assertFalse(self.monitor.ready)
+        self.monitor.mark_warm('cache')
+        self.assertTrue(self.monitor.ready)
+
+    def test_no_engine(self):
+        """Without database, only components are checked."""
+        monitor = HealthMonitor(loop=self.loop)
+        self.assertTrue(monitor.ready)
+        self.assertEqual(
+            {'ready': True, 'components': {}}, monitor.status())
+
+    async def test_status(self):
+        """The status includes details about the health."""
+        await self.monitor.check_db()
+        self.clock.now = 1
+        self.monitor.require('cache')
+        self.assertEqual(
+            {'ready': False,
+             'components': {'cache': False},
+             'db': {'ok': True, 'error': None, 'last-ping-age': 1},
+             'pool': {'ok': True, 'size': 2, 'free': 2, 'min': 2, 'max': 10}},
+            self.monitor.status())
+
+    async def test_start_stop(self):
+        """Starting the monitor checks the database right away."""
+        await self.monitor.start()
+        self.addCleanup(self.monitor.stop)
+        self.assertTrue(self.monitor.ready)
+        self.assertTrue(self.monitor._task.running)
@@ -0,0 +1,149 @@
+import os
+import socket
+import stat
+import unittest
+
+import fixtures
+
+from ..config import Config
+from ..listeners import (
+    ListenError,
+    create_sockets,
+    socket_from_fd,
+    systemd_sockets,
+    tcp_sockets,
+    unix_socket,
+)
+
+
+class TCPSocketsTest(unittest.TestCase):
+
+    def test_tcp_sockets(self):
+        """Sockets are bound to the host and port."""
+        [sock] = tcp_sockets('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        self.assertEqual(socket.AF_INET, sock.family)
+        host, port = sock.getsockname()
+        self.assertEqual('127.0.0.1', host)
+        self.assertNotEqual(0, port)
+
+
+class UnixSocketTest(fixtures.TestWithFixtures):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.useFixture(fixtures.TempDir()).join('socket')
+
+    def test_unix_socket(self):
+        """A socket is bound to the path."""
+        sock = unix_socket(self.path)
+        self.addCleanup(sock.close)
+        self.assertEqual(socket.AF_UNIX, sock.family)
+        self.assertEqual(self.path, sock.getsockname())
+
+    def test_unix_socket_mode(self):
+        """Permissions of the socket file can be set."""
+        sock = unix_socket(self.path, mode=0o660)
+        self.addCleanup(sock.close)
+        self.assertEqual(0o660, stat.S_IMODE(os.stat(self.path).st_mode))
+
+    def test_unix_socket_stale(self):
+        """A stale socket file is replaced."""
+        unix_socket(self.path).close()
+        sock = unix_socket(self.path)
+        self.addCleanup(sock.close)
+        self.assertEqual(self.path, sock.getsockname())
+
+
+class SystemdSocketsTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        [self.sock] = tcp_sockets('127.0.0.1', 0)
+        self.addCleanup(self.sock.close)
+
+    def test_systemd_sockets(self):
+        """Sockets passed by systemd are returned."""
+        fd = os.dup(self.sock.fileno())
+        environ = {'LISTEN_PID': str(os.getpid()), 'LISTEN_FDS': '1'}
+        [sock] = systemd_sockets(environ=environ, start=fd)
+        self.addCleanup(sock.close)
+        self.assertEqual(fd, sock.fileno())
+        self.assertEqual(self.sock.getsockname(), sock.getsockname())
+        self.assertEqual({}, environ)
+
+    def test_systemd_sockets_other_pid(self):
+        """Sockets passed to another process are ignored."""
+        environ = {'LISTEN_PID': '1', 'LISTEN_FDS': '1'}
+        self.assertEqual([], systemd_sockets(environ=environ))
+
+    def test_systemd_sockets_none(self):
+        """If no sockets are passed, an empty list is returned."""
+        self.assertEqual([], systemd_sockets(environ={}))
+
+
+class SocketFromFdTest(fixtures.TestWithFixtures):
+
+    def test_socket_from_fd_inet(self):
+        """The address family of TCP sockets is detected."""
+        [sock] = tcp_sockets('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        new_sock = socket_from_fd(os.dup(sock.fileno()))
+        self.addCleanup(new_sock.close)
+        self.assertEqual(socket.AF_INET, new_sock.family)
+
+    def test_socket_from_fd_unix(self):
+        """The address family of Unix sockets is detected."""
+        path = self.useFixture(fixtures.TempDir()).join('socket')
+        sock = unix_socket(path)
+        self.addCleanup(sock.close)
+        new_sock = socket_from_fd(os.dup(sock.fileno()))
+        self.addCleanup(new_sock.close)
+        self.assertEqual(socket.AF_UNIX, new_sock.family)
+        self.assertEqual(path, new_sock.getsockname())
+
+
+class CreateSocketsTest(fixtures.TestWithFixtures):
+
+    def create_sockets(self, app_config, environ=None):
+        sockets = create_sockets(
+            Config({'app': app_config}), environ=environ or {})
+        for sock in sockets:
+            self.addCleanup(sock.close)
+        return sockets
+
+    def test_default(self):
+        """By default, a TCP socket on port 8080 is created."""
+        [sock] = self.create_sockets({})
+        self.assertEqual(('0.0.0.0', 8080), sock.getsockname())
+
+    def test_hosts(self):
+        """Sockets can be created for multiple hosts."""
+        sockets = self.create_sockets(
+            {'host': ['127.0.0.1', '127.0.0.2'], 'port': 9090})
+        self.assertEqual(
+            [('127.0.0.1', 9090), ('127.0.0.2', 9090)],
+            [sock.getsockname() for sock in sockets])
+
+    def test_unix_socket(self):
+        """If only a Unix socket is configured, no TCP socket is created."""
+        path = self.useFixture(fixtures.TempDir()).join('socket')
+        [sock] = self.create_sockets(
+            {'unix-socket': path, 'unix-socket-mode': '600'})
+        self.assertEqual(path, sock.getsockname())
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(path).st_mode))
+
+    def test_unix_socket_and_port(self):
+        """Unix and TCP sockets can be used together."""
+        path = self.useFixture(fixtures.TempDir()).join('socket')
+        sockets = self.create_sockets(
+            {'unix-socket': [path], 'host': '127.0.0.1', 'port': 9090})
+        self.assertEqual(
+            [path, ('127.0.0.1', 9090)],
+            [sock.getsockname() for sock in sockets])
+
+    def test_systemd_socket_missing(self):
+        """An error is raised if systemd sockets are required but missing."""
+        with self.assertRaises(ListenError) as cm:
+            self.create_sockets({'systemd-socket': True})
+        self.assertEqual('No sockets passed by systemd', str(cm.exception))
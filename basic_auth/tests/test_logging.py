@@ -1,9 +1,20 @@
 import io
 import logging
 
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
 import fixtures
 
-from ..logging import setup_logging
+from ..timing import (
+    REQUEST_TIMINGS,
+    Timings,
+)
+from ..logging import (
+    ACCESS_LOG_SAMPLE_RATE,
+    SampledAccessLogger,
+    setup_logging,
+)
 
 
 class SetupLoggingTest(fixtures.TestWithFixtures):
@@ -19,3 +30,66 @@ class SetupLoggingTest(fixtures.TestWithFixtures):
         logging.info('Some info')
         logged_content = log_stream.getvalue()
         self.assertIn('root - INFO - Some info', logged_content)
+
+
+class SampledAccessLoggerTest(fixtures.TestWithFixtures):
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.access_logger = SampledAccessLogger(
+            logging.getLogger(), '%r %s')
+        self.access_logger.random = lambda: 0.5
+        self.app = web.Application()
+        self.subapp = web.Application()
+
+    def log(self, status=200, timings=None):
+        request = make_mocked_request('GET', '/sub', app=self.app)
+        request.match_info.add_app(self.subapp)
+        if timings is not None:
+            request[REQUEST_TIMINGS] = timings
+        self.access_logger.log(request, web.Response(status=status), 0.1)
+
+    def test_log_all_by_default(self):
+        """Without sample rate, all requests are logged."""
+        self.log()
+        self.assertIn('GET /sub HTTP/1.1 200', self.logger.output)
+
+    def test_sampled(self):
+        """Requests are logged based on the sample rate."""
+        self.subapp[ACCESS_LOG_SAMPLE_RATE] = 0.6
+        self.log()
+        self.assertIn('GET /sub HTTP/1.1 200', self.logger.output)
+
+    def test_sampled_out(self):
+        """Requests are not logged if sampled out."""
+        self.subapp[ACCESS_LOG_SAMPLE_RATE] = 0.4
+        self.log()
+        self.assertEqual('', self.logger.output)
+
+    def test_disabled(self):
+        """Logging is disabled with a zero sample rate."""
+        self.subapp[ACCESS_LOG_SAMPLE_RATE] = 0
+        self.log()
+        self.assertEqual('', self.logger.output)
+
+    def test_parent_app_rate(self):
+        """The sample rate can be set on a parent application."""
+        self.app[ACCESS_LOG_SAMPLE_RATE] = 0
+        self.log()
+        self.assertEqual('', self.logger.output)
+
+    def test_server_errors_always_logged(self):
+        """Server errors are logged regardless of the sample rate."""
+        self.subapp[ACCESS_LOG_SAMPLE_RATE] = 0
+        self.log(status=500)
+        self.assertIn('GET /sub HTTP/1.1 500', self.logger.output)
+
+    def test_timings(self):
+        """Request timings are logged."""
+        timings = Timings()
+        timings.add('auth', 0.002)
+        self.log(timings=timings)
+        self.assertIn(
+            'GET /sub HTTP/1.1 200 timings="auth;dur=2.0"',
+            self.logger.output)
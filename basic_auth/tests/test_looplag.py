@@ -0,0 +1,104 @@
+import asyncio
+import time
+from unittest import TestCase
+
+import asynctest
+
+import fixtures
+
+from ..looplag import (
+    LagHistogram,
+    LoopLagMonitor,
+)
+
+
+def block(seconds):
+    time.sleep(seconds)
+
+
+class LagHistogramTest(TestCase):
+
+    def test_record(self):
+        """Delays are counted in buckets by upper bound."""
+        histogram = LagHistogram(buckets=(1, 10))
+        histogram.record(0.0005)
+        histogram.record(0.001)
+        histogram.record(0.005)
+        histogram.record(0.5)
+        self.assertEqual([2, 1, 1], histogram.counts)
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(0.5, histogram.max)
+
+    def test_summary(self):
+        """The summary reports times in milliseconds."""
+        histogram = LagHistogram(buckets=(1, 10))
+        histogram.record(0.001)
+        histogram.record(0.003)
+        self.assertEqual(
+            {'count': 2, 'mean': 2.0, 'max': 3.0,
+             'buckets': {'1': 1, '10': 1, '+Inf': 0}},
+            histogram.summary())
+
+    def test_summary_empty(self):
+        """The summary for an empty histogram has zero times."""
+        summary = LagHistogram().summary()
+        self.assertEqual(0, summary['count'])
+        self.assertEqual(0, summary['mean'])
+        self.assertEqual(0, summary['max'])
+
+
+class LoopLagMonitorTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.monitor = LoopLagMonitor(
+            interval=0.01, threshold=0.05, loop=self.loop)
+
+    async def tearDown(self):
+        await self.monitor.stop()
+        super().tearDown()
+
+    async def test_probe(self):
+        """Scheduling delays are recorded while the monitor runs."""
+        self.monitor.start()
+        await asyncio.sleep(0.05, loop=self.loop)
+        self.assertGreater(self.monitor.histogram.count, 0)
+        self.assertEqual([], list(self.monitor.blocked))
+
+    async def test_blocking_call(self):
+        """The stack of calls blocking the loop is captured."""
+        self.monitor.start()
+        await asyncio.sleep(0.02, loop=self.loop)
+        self.loop.call_soon(block, 0.2)
+        await asyncio.sleep(0.05, loop=self.loop)
+        [entry] = self.monitor.blocked
+        self.assertIn('in block', entry['stack'][-1])
+        self.assertGreaterEqual(entry['lag'], 50)
+        self.assertIn(
+            'event loop blocked for more than 0.05s in:', self.logger.output)
+        self.assertIn('event loop lagged', self.logger.output)
+        self.assertGreater(self.monitor.histogram.max, 0.05)
+
+    async def test_max_blocked(self):
+        """Only the last blocking calls are kept."""
+        self.monitor = LoopLagMonitor(
+            interval=0.01, threshold=0.05, max_blocked=1, loop=self.loop)
+        self.monitor.start()
+        for _ in range(2):
+            await asyncio.sleep(0.02, loop=self.loop)
+            self.loop.call_soon(block, 0.1)
+            await asyncio.sleep(0.02, loop=self.loop)
+        self.assertEqual(1, len(self.monitor.blocked))
+
+    async def test_summary(self):
+        """The summary includes the histogram and blocking calls."""
+        summary = self.monitor.summary()
+        self.assertEqual(0, summary['count'])
+        self.assertEqual([], summary['blocked'])
+
+    async def test_stop_not_started(self):
+        """Stopping a monitor that isn't running is a no-op."""
+        await self.monitor.stop()
@@ -2,17 +2,22 @@ from aiohttp import web
 
 import asynctest
 
+from ..breaker import CircuitOpen
 from ..testing import HandlerTestCase
 from ..middleware import (
     BaseBasicAuthMiddlewareFactory,
     BasicAuthMiddlewareFactory,
 )
+from ..throttle import (
+    AuthThrottle,
+    Throttle,
+)
 
 
 class SampleBasicAuthMiddlewareFactory(BaseBasicAuthMiddlewareFactory):
 
-    def __init__(self, realm):
-        super().__init__(realm)
+    def __init__(self, realm, **kwargs):
+        super().__init__(realm, **kwargs)
         self.calls = []
 
     async def is_valid_auth(self, user, password):
@@ -87,6 +92,94 @@ class BaseBasicAuthMiddlewareFactoryTest(HandlerTestCase):
         self.assertEqual([('user', 'pass')], self.middleware.calls)
 
 
+class ThrottledBasicAuthMiddlewareFactoryTest(HandlerTestCase):
+
+    def setUp(self):
+        self.throttle = AuthThrottle(username_throttle=Throttle(1, 2))
+        self.middleware = SampleBasicAuthMiddlewareFactory(
+            'realm', throttle=self.throttle)
+        super().setUp()
+
+    def create_app(self):
+        return web.Application(middlewares=[self.middleware])
+
+    async def handler(self, request):
+        return web.HTTPOk()
+
+    async def test_failed_attempts_throttled(self):
+        """Once too many attempts fail, credentials are not checked."""
+        middleware_handler = await self.middleware(self.app, self.handler)
+        for _ in range(3):
+            response = await middleware_handler(
+                self.get_request(auth=('user', 'wrong')))
+            self.assertEqual(401, response.status)
+        # only the first two attempts are checked
+        self.assertEqual(
+            [('user', 'wrong'), ('user', 'wrong')], self.middleware.calls)
+        self.assertEqual('1', response.headers['Retry-After'])
+        self.assertEqual(
+            'Basic realm="realm"', response.headers['Www-Authenticate'])
+
+    async def test_valid_attempts_not_throttled(self):
+        """Successful attempts don't consume tokens."""
+        middleware_handler = await self.middleware(self.app, self.handler)
+        for _ in range(3):
+            response = await middleware_handler(
+                self.get_request(auth=('user', 'pass')))
+            self.assertEqual(200, response.status)
+        self.assertEqual(3, len(self.middleware.calls))
+
+    async def test_client_header(self):
+        """Clients can be identified by a header set by a proxy."""
+        self.throttle.username_throttle = None
+        self.throttle.client_throttle = Throttle(1, 2)
+        self.throttle.client_header = 'X-Real-IP'
+        middleware_handler = await self.middleware(self.app, self.handler)
+        for user in ('user1', 'user2', 'user3'):
+            response = await middleware_handler(
+                self.get_request(
+                    auth=(user, 'wrong'), headers={'X-Real-IP': '1.2.3.4'}))
+        self.assertEqual(2, len(self.middleware.calls))
+        response = await middleware_handler(
+            self.get_request(
+                auth=('user', 'pass'), headers={'X-Real-IP': '5.6.7.8'}))
+        self.assertEqual(200, response.status)
+
+    async def test_throttle_status(self):
+        """The status for throttled requests can be changed."""
+        self.middleware.throttle_status = 429
+        middleware_handler = await self.middleware(self.app, self.handler)
+        for _ in range(3):
+            response = await middleware_handler(
+                self.get_request(auth=('user', 'wrong')))
+        self.assertEqual(429, response.status)
+        self.assertEqual('1', response.headers['Retry-After'])
+
+
+class UnavailableBasicAuthMiddlewareFactoryTest(HandlerTestCase):
+
+    def setUp(self):
+        async def checker(user, password):
+            raise CircuitOpen(4.5)
+
+        self.middleware = BasicAuthMiddlewareFactory('realm', checker)
+        super().setUp()
+
+    def create_app(self):
+        return web.Application(middlewares=[self.middleware])
+
+    async def handler(self, request):
+        return web.HTTPOk()
+
+    async def test_circuit_open(self):
+        """If the circuit breaker is open, a 503 error is returned."""
+        middleware_handler = await self.middleware(self.app, self.handler)
+        response = await middleware_handler(
+            self.get_request(auth=('user', 'pass')))
+        self.assertEqual(503, response.status)
+        self.assertEqual('5', response.headers['Retry-After'])
+
+
 class BasicAuthMiddlewareFactoryTest(asynctest.TestCase):
 
     def setUp(self):
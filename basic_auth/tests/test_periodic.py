@@ -0,0 +1,59 @@
+import asyncio
+
+import asynctest
+
+import fixtures
+
+from ..periodic import PeriodicTask
+
+
+class PeriodicTaskTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.calls = 0
+
+    async def func(self):
+        self.calls += 1
+
+    async def test_periodic_calls(self):
+        """The function is called periodically."""
+        task = PeriodicTask(self.func, 0.01, loop=self.loop)
+        task.start()
+        self.assertTrue(task.running)
+        await asyncio.sleep(0.05, loop=self.loop)
+        await task.stop()
+        self.assertFalse(task.running)
+        self.assertGreater(self.calls, 1)
+
+    async def test_start_twice(self):
+        """Starting a running task is a no-op."""
+        task = PeriodicTask(self.func, 0.01, loop=self.loop)
+        task.start()
+        running_task = task._task
+        task.start()
+        self.assertIs(running_task, task._task)
+        await task.stop()
+
+    async def test_stop_not_started(self):
+        """Stopping a task that is not started is a no-op."""
+        task = PeriodicTask(self.func, 0.01, loop=self.loop)
+        await task.stop()
+        self.assertFalse(task.running)
+
+    async def test_errors_logged(self):
+        """Errors from the function are logged, and calls continue."""
+
+        async def func():
+            self.calls += 1
+            raise Exception('boom')
+
+        task = PeriodicTask(func, 0.01, loop=self.loop)
+        task.start()
+        await asyncio.sleep(0.05, loop=self.loop)
+        await task.stop()
+        self.assertGreater(self.calls, 1)
+        self.assertIn('boom', self.logger.output)
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from unittest import TestCase
+
+import asynctest
+
+import fixtures
+
+from ..profiler import (
+    collapse_stack,
+    Profiler,
+    ProfilerBusy,
+    StackSampler,
+)
+
+
+def outer(callback):
+    return inner(callback)
+
+
+def inner(callback):
+    return callback()
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class CollapseStackTest(TestCase):
+
+    def test_collapse_stack(self):
+        """Frames are listed from the outermost, with module and function."""
+        stack = outer(lambda: collapse_stack(sys._getframe()))
+        self.assertTrue(
+            stack.endswith(
+                '{name}:test_collapse_stack;{name}:outer;{name}:inner;'
+                '{name}:<lambda>'.format(name=__name__)),
+            stack)
+
+
+class StackSamplerTest(TestCase):
+
+    def test_sample(self):
+        """Samples of the same stack are aggregated."""
+        sampler = StackSampler(threading.get_ident())
+        outer(sampler.sample)
+        outer(sampler.sample)
+        self.assertEqual(2, sampler.samples)
+        [line] = sampler.collapsed().splitlines()
+        stack, count = line.rsplit(' ', 1)
+        self.assertTrue(stack.endswith(':inner;{}:sample'.format(
+            StackSampler.__module__)))
+        self.assertEqual('2', count)
+
+    def test_sample_unknown_thread(self):
+        """Nothing is sampled if the thread doesn't exist."""
+        sampler = StackSampler(-1)
+        sampler.sample()
+        self.assertEqual(0, sampler.samples)
+        self.assertEqual('', sampler.collapsed())
+
+    def test_collapsed_most_common_first(self):
+        """Stacks are returned from the most sampled."""
+        sampler = StackSampler(threading.get_ident())
+        sampler.sample()
+        outer(sampler.sample)
+        outer(sampler.sample)
+        first, second = sampler.collapsed().splitlines()
+        self.assertTrue(first.endswith(' 2'))
+        self.assertTrue(second.endswith(' 1'))
+
+    def test_start_stop(self):
+        """Sampling runs in a separate thread until stopped."""
+        sampler = StackSampler(threading.get_ident(), interval=0.001)
+        sampled = threading.Event()
+        original_sample = sampler.sample
+
+        def sample():
+            original_sample()
+            sampled.set()
+
+        sampler.sample = sample
+        sampler.start()
+        self.assertTrue(sampled.wait(5))
+        sampler.stop()
+        self.assertGreater(sampler.samples, 0)
+        self.assertIn('test_start_stop', sampler.collapsed())
+
+
+class ProfilerTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.output_dir = self.useFixture(fixtures.TempDir()).path
+        self.profiler = Profiler(
+            interval=0.001, duration=0.05, output_dir=self.output_dir,
+            loop=self.loop)
+
+    async def test_profile(self):
+        """Stacks of the event loop thread are returned."""
+        self.loop.call_soon(busy, 0.02)
+        stacks = await self.profiler.profile(0.05)
+        self.assertIn('{}:busy'.format(__name__), stacks)
+        self.assertFalse(self.profiler.running)
+        self.assertIn('profile completed', self.logger.output)
+
+    async def test_profile_busy(self):
+        """Only one profile can run at a time."""
+        task = self.loop.create_task(self.profiler.profile(0.05))
+        await asyncio.sleep(0, loop=self.loop)
+        self.assertTrue(self.profiler.running)
+        with self.assertRaises(ProfilerBusy):
+            await self.profiler.profile(0.05)
+        await task
+
+    async def test_profile_to_file(self):
+        """Stacks are written to a file in the output directory."""
+        self.loop.call_soon(busy, 0.02)
+        path = await self.profiler.profile_to_file()
+        self.assertEqual(self.output_dir, os.path.dirname(path))
+        self.assertTrue(path.endswith('.collapsed'))
+        with open(path) as fd:
+            self.assertIn('{}:busy'.format(__name__), fd.read())
+        self.assertIn(
+            'profile written to {}'.format(path), self.logger.output)
+
+    async def test_profile_requested(self):
+        """Profiling can be triggered from a signal handler."""
+        self.profiler.profile_requested()
+        self.assertIn('profiling for 0.05s', self.logger.output)
+        self.assertEqual([], os.listdir(self.output_dir))
+        self.profiler.profile_requested()
+        self.assertIn('profile already running', self.logger.output)
+        await self.profiler._task
+        self.assertFalse(self.profiler.running)
+        self.assertEqual(1, len(os.listdir(self.output_dir)))
+
+    async def test_profile_requested_failure(self):
+        """Failures of profiles triggered by signal are logged."""
+        self.profiler.output_dir = os.path.join(self.output_dir, 'missing')
+        self.profiler.profile_requested()
+        await self.profiler._task
+        self.assertIn('profile failed', self.logger.output)
@@ -0,0 +1,150 @@
+import os
+import re
+import socket
+import sys
+
+from aiohttp import (
+    ClientSession,
+    web,
+)
+
+import asynctest
+
+import fixtures
+
+from ..listeners import (
+    LISTEN_FDS_ENV,
+    tcp_sockets,
+)
+from ..runner import (
+    READY_FD_ENV,
+    ServerRunner,
+    notify_ready,
+)
+
+
+# Script for a process started on reload, which reports the inherited
+# sockets and whether it's ready.
+CHILD_SCRIPT = '''
+import os, sys
+output = os.environ.get('{listen_env}')
+with open(sys.argv[1], 'w') as fd:
+    fd.write(output)
+if sys.argv[2] == 'ready':
+    os.write(int(os.environ['{ready_env}']), b'1')
+'''.format(listen_env=LISTEN_FDS_ENV, ready_env=READY_FD_ENV)
+
+
+class NotifyReadyTest(fixtures.TestWithFixtures):
+
+    def test_notify_parent(self):
+        """The parent process is notified through the ready descriptor."""
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        environ = {READY_FD_ENV: str(write_fd)}
+        notify_ready(environ=environ)
+        self.assertEqual(b'1', os.read(read_fd, 1))
+        # The descriptor is closed.
+        self.assertEqual(b'', os.read(read_fd, 1))
+        self.assertEqual({}, environ)
+
+    def test_notify_systemd(self):
+        """Systemd is notified if NOTIFY_SOCKET is set."""
+        path = self.useFixture(fixtures.TempDir()).join('notify')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.addCleanup(sock.close)
+        sock.bind(path)
+        notify_ready(environ={'NOTIFY_SOCKET': path})
+        self.assertEqual(
+            'READY=1\nMAINPID={}'.format(os.getpid()).encode(),
+            sock.recv(1024))
+
+    def test_notify_nothing(self):
+        """Without parent or systemd, nothing is done."""
+        notify_ready(environ={})
+
+
+class ServerRunnerTest(asynctest.TestCase, fixtures.TestWithFixtures):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.logger = self.useFixture(fixtures.FakeLogger())
+        self.tempdir = self.useFixture(fixtures.TempDir())
+        [self.sock] = tcp_sockets('127.0.0.1', 0)
+        self.addCleanup(self.sock.close)
+        self.app = web.Application()
+        self.app.router.add_get('/', self.handler)
+
+    async def handler(self, request):
+        return web.Response(text='hello')
+
+    def child_command(self, output, status):
+        return [sys.executable, '-c', CHILD_SCRIPT, output, status]
+
+    def assert_child_reaped(self):
+        """Assert that the process started on reload has been waited for."""
+        [pid] = re.findall(r'started process (\d+)', self.logger.output)
+        with self.assertRaises(ChildProcessError):
+            os.waitpid(int(pid), os.WNOHANG)
+
+    async def test_start_stop(self):
+        """The application is served on sockets until the runner stops."""
+        runner = ServerRunner(self.app, [self.sock], loop=self.loop)
+        await runner.start()
+        host, port = self.sock.getsockname()
+        url = 'http://{}:{}/'.format(host, port)
+        async with ClientSession(loop=self.loop) as session:
+            async with session.get(url) as response:
+                self.assertEqual('hello', await response.text())
+        await runner.stop()
+        await self.app.cleanup()
+        self.assertIn(
+            'listening on {}:{}'.format(host, port), self.logger.output)
+
+    async def test_reload(self):
+        """On reload, the runner stops once the new process is ready."""
+        output = self.tempdir.join('output')
+        runner = ServerRunner(
+            self.app, [self.sock], loop=self.loop,
+            command=self.child_command(output, 'ready'))
+        await runner.reload()
+        self.assertTrue(runner._stopping.is_set())
+        with open(output) as fd:
+            self.assertEqual(str(self.sock.fileno()), fd.read())
+        self.assertIn('shutting down', self.logger.output)
+
+    async def test_reload_failed(self):
+        """If the new process fails, the runner keeps running."""
+        output = self.tempdir.join('output')
+        runner = ServerRunner(
+            self.app, [self.sock], loop=self.loop,
+            command=self.child_command(output, 'fail'))
+        await runner.reload()
+        self.assertFalse(runner._stopping.is_set())
+        self.assertIn('failed to start', self.logger.output)
+        self.assert_child_reaped()
+
+    async def test_reload_timeout(self):
+        """The new process is terminated if it's not ready in time."""
+        runner = ServerRunner(
+            self.app, [self.sock], loop=self.loop, reload_timeout=0.1,
+            command=[sys.executable, '-c', 'import time; time.sleep(10)'])
+        await runner.reload()
+        self.assertFalse(runner._stopping.is_set())
+        self.assertIn('failed to start', self.logger.output)
+        self.assert_child_reaped()
+
+    async def test_reload_timeout_kill(self):
+        """The new process is killed if it ignores termination."""
+        runner = ServerRunner(
+            self.app, [self.sock], loop=self.loop, reload_timeout=0.1,
+            command=[
+                sys.executable, '-c',
+                'import signal, time; '
+                'signal.signal(signal.SIGTERM, signal.SIG_IGN); '
+                'time.sleep(10)'])
+        await runner.reload()
+        self.assertIn('failed to start', self.logger.output)
+        self.assert_child_reaped()
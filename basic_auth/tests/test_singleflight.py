@@ -0,0 +1,139 @@
+import asyncio
+
+import asynctest
+
+from ..singleflight import SingleFlight
+
+
+class SingleFlightTest(asynctest.TestCase):
+
+    forbid_get_event_loop = True
+
+    def setUp(self):
+        super().setUp()
+        self.single_flight = SingleFlight(loop=self.loop)
+        self.calls = []
+        self.event = asyncio.Event(loop=self.loop)
+
+    async def func(self, value):
+        self.calls.append(value)
+        await self.event.wait()
+        return value * 2
+
+    async def test_call(self):
+        """The function result is returned."""
+        self.event.set()
+        self.assertEqual(4, await self.single_flight.call('key', self.func, 2))
+        self.assertEqual([2], self.calls)
+        self.assertEqual(0, len(self.single_flight))
+
+    async def test_concurrent_calls_coalesced(self):
+        """Concurrent calls for the same key share a single call."""
+        futures = [
+            asyncio.ensure_future(
+                self.single_flight.call('key', self.func, 2), loop=self.loop)
+            for _ in range(3)]
+        await asyncio.sleep(0, loop=self.loop)
+        self.assertEqual(1, len(self.single_flight))
+        self.event.set()
+        self.assertEqual(
+            [4, 4, 4], await asyncio.gather(*futures, loop=self.loop))
+        self.assertEqual([2], self.calls)
+
+    async def test_different_keys(self):
+        """Calls for different keys are not coalesced."""
+        self.event.set()
+        results = await asyncio.gather(
+            self.single_flight.call('key1', self.func, 1),
+            self.single_flight.call('key2', self.func, 2),
+            loop=self.loop)
+        self.assertEqual([2, 4], results)
+        self.assertEqual([1, 2], sorted(self.calls))
+
+    async def test_sequential_calls(self):
+        """Calls after one has completed are not coalesced."""
+        self.event.set()
+        await self.single_flight.call('key', self.func, 1)
+        await self.single_flight.call('key', self.func, 1)
+        self.assertEqual([1, 1], self.calls)
+
+    async def test_error(self):
+        """Errors are raised to all callers."""
+
+        async def func():
+            await self.event.wait()
+            raise ValueError('boom')
+
+        futures = [
+            asyncio.ensure_future(
+                self.single_flight.call('key', func), loop=self.loop)
+            for _ in range(2)]
+        await asyncio.sleep(0, loop=self.loop)
+        self.event.set()
+        for future in futures:
+            with self.assertRaises(ValueError):
+                await future
+
+    async def test_caller_cancelled(self):
+        """Cancelling a caller doesn't affect the others."""
+        future1 = asyncio.ensure_future(
+            self.single_flight.call('key', self.func, 2), loop=self.loop)
+        future2 = asyncio.ensure_future(
+            self.single_flight.call('key', self.func, 2), loop=self.loop)
+        await asyncio.sleep(0, loop=self.loop)
+        future1.cancel()
+        self.event.set()
+        self.assertEqual(4, await future2)
+        self.assertTrue(future1.cancelled())
+
+    async def batch_func(self, keys):
+        self.calls.append(sorted(keys))
+        await self.event.wait()
+        return {key: key * 2 for key in keys if key != 'missing'}
+
+    async def test_call_many(self):
+        """Results for multiple keys are returned from a single call."""
+        self.event.set()
+        results = await self.single_flight.call_many(
+            ['a', 'b', 'missing', 'a'], self.batch_func)
+        self.assertEqual({'a': 'aa', 'b': 'bb', 'missing': None}, results)
+        self.assertEqual([['a', 'b', 'missing']], self.calls)
+        self.assertEqual(0, len(self.single_flight))
+
+    async def test_call_many_in_flight(self):
+        """Keys with calls in flight are not included in the batch call."""
+        future = asyncio.ensure_future(
+            self.single_flight.call('a', self.func, 'x'), loop=self.loop)
+        await asyncio.sleep(0, loop=self.loop)
+        batch_future = asyncio.ensure_future(
+            self.single_flight.call_many(['a', 'b'], self.batch_func),
+            loop=self.loop)
+        await asyncio.sleep(0, loop=self.loop)
+        self.event.set()
+        self.assertEqual({'a': 'xx', 'b': 'bb'}, await batch_future)
+        self.assertEqual('xx', await future)
+        self.assertEqual(['x', ['b']], self.calls)
+
+    async def test_call_during_call_many(self):
+        """Calls for keys in a batch call in flight wait for it."""
+        batch_future = asyncio.ensure_future(
+            self.single_flight.call_many(['a', 'b'], self.batch_func),
+            loop=self.loop)
+        await asyncio.sleep(0, loop=self.loop)
+        future = asyncio.ensure_future(
+            self.single_flight.call('b', self.func, 'x'), loop=self.loop)
+        await asyncio.sleep(0, loop=self.loop)
+        self.event.set()
+        self.assertEqual('bb', await future)
+        self.assertEqual({'a': 'aa', 'b': 'bb'}, await batch_future)
+        self.assertEqual([['a', 'b']], self.calls)
+
+    async def test_call_many_error(self):
+        """Errors from the batch call are raised."""
+
+        async def func(keys):
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            await self.single_flight.call_many(['a', 'b'], func)
+        self.assertEqual(0, len(self.single_flight))
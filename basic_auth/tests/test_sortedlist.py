@@ -0,0 +1,108 @@
+import random
+from unittest import TestCase
+
+from ..sortedlist import SortedList
+
+
+class SortedListTest(TestCase):
+
+    def test_initial_values(self):
+        """Initial values are sorted and deduplicated."""
+        values = SortedList([3, 1, 2, 3], load=2)
+        self.assertEqual([1, 2, 3], list(values))
+        self.assertEqual(3, len(values))
+
+    def test_add(self):
+        """Values are kept sorted as they're added."""
+        values = SortedList(load=2)
+        for value in [5, 1, 4, 2, 3, 0, 6]:
+            values.add(value)
+        self.assertEqual([0, 1, 2, 3, 4, 5, 6], list(values))
+        self.assertEqual(7, len(values))
+
+    def test_add_existing(self):
+        """Adding an existing value is a no-op."""
+        values = SortedList([1, 2])
+        values.add(1)
+        self.assertEqual([1, 2], list(values))
+        self.assertEqual(2, len(values))
+
+    def test_split_blocks(self):
+        """Blocks are split when they grow past twice the load."""
+        values = SortedList(load=2)
+        for value in range(10):
+            values.add(value)
+        self.assertTrue(all(len(block) <= 4 for block in values._blocks))
+        self.assertEqual(
+            [block[-1] for block in values._blocks], values._maxes)
+
+    def test_contains(self):
+        """Values can be checked for presence."""
+        values = SortedList([1, 3], load=1)
+        self.assertIn(1, values)
+        self.assertIn(3, values)
+        self.assertNotIn(2, values)
+        self.assertNotIn(4, values)
+        self.assertNotIn(1, SortedList())
+
+    def test_remove(self):
+        """Values can be removed."""
+        values = SortedList(range(6), load=2)
+        values.remove(0)
+        values.remove(1)
+        values.remove(4)
+        self.assertEqual([2, 3, 5], list(values))
+        self.assertEqual(3, len(values))
+        self.assertEqual(
+            [block[-1] for block in values._blocks], values._maxes)
+
+    def test_remove_not_found(self):
+        """Removing a missing value raises an error."""
+        values = SortedList([1, 3])
+        with self.assertRaises(ValueError):
+            values.remove(2)
+        with self.assertRaises(ValueError):
+            values.remove(4)
+
+    def test_discard(self):
+        """Discarding a missing value is a no-op."""
+        values = SortedList([1, 3])
+        values.discard(2)
+        values.discard(3)
+        self.assertEqual([1], list(values))
+
+    def test_irange(self):
+        """Values can be iterated in a range."""
+        values = SortedList(range(10), load=2)
+        self.assertEqual(list(range(10)), list(values.irange()))
+        self.assertEqual([3, 4, 5], list(values.irange(3, 5)))
+        self.assertEqual([7, 8, 9], list(values.irange(7)))
+        self.assertEqual([0, 1], list(values.irange(maximum=1)))
+        self.assertEqual(
+            [4], list(values.irange(3, 5, inclusive=(False, False))))
+        self.assertEqual([], list(values.irange(10)))
+        self.assertEqual([], list(values.irange(9, inclusive=(False, True))))
+
+    def test_irange_missing_bounds(self):
+        """Bounds don't need to be in the list."""
+        values = SortedList([10, 20, 30, 40], load=1)
+        self.assertEqual([20, 30], list(values.irange(15, 35)))
+
+    def test_random_operations(self):
+        """The list matches a sorted set after random changes."""
+        rand = random.Random(1)
+        values = SortedList(load=4)
+        expected = set()
+        for _ in range(2000):
+            value = rand.randrange(200)
+            if rand.random() < 0.6:
+                values.add(value)
+                expected.add(value)
+            else:
+                values.discard(value)
+                expected.discard(value)
+        self.assertEqual(sorted(expected), list(values))
+        self.assertEqual(len(expected), len(values))
+        self.assertEqual(
+            [value for value in sorted(expected) if 50 < value <= 150],
+            list(values.irange(50, 150, inclusive=(False, True))))
@@ -0,0 +1,126 @@
+from unittest import TestCase
+
+from ..credential import hash_token256
+from ..store import (
+    CredentialsStore,
+    password_digest,
+)
+
+
+class PasswordDigestTest(TestCase):
+
+    def test_password_digest(self):
+        """The raw SHA256 digest of the password is returned."""
+        digest = password_digest('secret')
+        self.assertEqual(32, len(digest))
+        self.assertEqual(hash_token256('secret'), digest.hex())
+
+
+class CredentialsStoreTest(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = CredentialsStore()
+
+    def test_set(self):
+        """Credentials can be added for a user."""
+        record = self.store.set('foo', 'bar', password_digest('baz'))
+        self.assertEqual('foo', record.user)
+        self.assertEqual('bar', record.username)
+        self.assertEqual(password_digest('baz'), record.digest)
+        self.assertIs(record, self.store.get('foo'))
+        self.assertIs(record, self.store.get_by_username('bar'))
+        self.assertIn('foo', self.store)
+        self.assertEqual(1, len(self.store))
+
+    def test_set_replace(self):
+        """Credentials for a user are replaced."""
+        self.store.set('foo', 'bar', password_digest('baz'))
+        record = self.store.set('foo', 'new', password_digest('baz'))
+        self.assertIs(record, self.store.get('foo'))
+        self.assertIsNone(self.store.get_by_username('bar'))
+        self.assertIs(record, self.store.get_by_username('new'))
+        self.assertEqual(1, len(self.store))
+
+    def test_set_interned(self):
+        """Users and usernames are interned."""
+        user = ''.join(['f', 'oo'])
+        record = self.store.set(user, ''.join(['fo', 'o']), b'')
+        self.assertIs(record.user, record.username)
+
+    def test_set_hexdigest(self):
+        """Credentials can be added with an hex digest of the password."""
+        record = self.store.set_hexdigest('foo', 'bar', hash_token256('baz'))
+        self.assertEqual(password_digest('baz'), record.digest)
+
+    def test_set_hexdigest_invalid(self):
+        """Invalid hex digests are rejected."""
+        for hexdigest in ('baz', 'g' * 64, hash_token256('baz')[:-2]):
+            with self.assertRaises(ValueError):
+                self.store.set_hexdigest('foo', 'bar', hexdigest)
+        self.assertNotIn('foo', self.store)
+
+    def test_get_not_found(self):
+        """None is returned for unknown users and usernames."""
+        self.assertIsNone(self.store.get('foo'))
+        self.assertIsNone(self.store.get_by_username('foo'))
+        self.assertNotIn('foo', self.store)
+
+    def test_iter(self):
+        """Iterating the store returns records."""
+        self.store.set('foo', 'bar', b'')
+        self.store.set('baz', 'bza', b'')
+        self.assertEqual(
+            ['baz', 'foo'], sorted(record.user for record in self.store))
+
+    def test_remove(self):
+        """Credentials can be removed."""
+        self.store.set('foo', 'bar', b'')
+        self.assertTrue(self.store.remove('foo'))
+        self.assertIsNone(self.store.get('foo'))
+        self.assertIsNone(self.store.get_by_username('bar'))
+        self.assertEqual(0, len(self.store))
+
+    def test_remove_not_found(self):
+        """Removing unknown users returns False."""
+        self.assertFalse(self.store.remove('foo'))
+
+    def test_by_username(self):
+        """Records can be iterated in username order."""
+        self.store.set('user1', 'c', b'')
+        self.store.set('user2', 'a', b'')
+        self.store.set('user3', 'b', b'')
+        self.store.set('user4', 'd', b'')
+
+        def usernames(**kwargs):
+            return [
+                record.username
+                for record in self.store.by_username(**kwargs)]
+
+        self.assertEqual(['a', 'b', 'c', 'd'], usernames())
+        self.assertEqual(['c', 'd'], usernames(after='b'))
+        self.assertEqual(['b', 'c'], usernames(start='b', stop='c'))
+        self.assertEqual(['c'], usernames(start='b', stop='c', after='b'))
+        self.assertEqual(['b', 'c'], usernames(start='b', stop='c', after='a'))
+
+    def test_by_username_after_changes(self):
+        """The username order is kept as credentials change."""
+        self.store.set('user1', 'c', b'')
+        self.store.set('user2', 'a', b'')
+        self.store.set('user1', 'b', b'')
+        self.store.remove('user2')
+        self.assertEqual(
+            ['b'], [record.username for record in self.store.by_username()])
+
+    def test_match(self):
+        """Passwords are matched by username."""
+        self.store.set('foo', 'bar', password_digest('baz'))
+        self.assertTrue(self.store.match('bar', 'baz'))
+        self.assertFalse(self.store.match('bar', 'wrong'))
+        self.assertFalse(self.store.match('foo', 'baz'))
+
+    def test_token(self):
+        """Records return the token with the hex digest of the password."""
+        record = self.store.set('foo', 'bar', password_digest('baz'))
+        self.assertEqual(
+            'bar:{}'.format(hash_token256('baz')), record.token)
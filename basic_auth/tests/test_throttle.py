@@ -0,0 +1,196 @@
+from collections import namedtuple
+from unittest import TestCase
+
+from ..throttle import (
+    AuthThrottle,
+    Throttle,
+    Throttled,
+    auth_throttle_from_config,
+)
+
+
+FakeRequest = namedtuple('FakeRequest', ['remote', 'headers'])
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.time = 1000.0
+
+    def __call__(self):
+        return self.time
+
+
+class ThrottleTest(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+
+    def test_allowed_unknown_key(self):
+        """Unknown keys are allowed."""
+        throttle = Throttle(1, 3, clock=self.clock)
+        self.assertTrue(throttle.allowed('foo'))
+
+    def test_burst(self):
+        """Keys are allowed up to the burst size."""
+        throttle = Throttle(1, 3, clock=self.clock)
+        for _ in range(3):
+            self.assertTrue(throttle.allowed('foo'))
+            throttle.consume('foo')
+        self.assertFalse(throttle.allowed('foo'))
+        # other keys are not affected
+        self.assertTrue(throttle.allowed('bar'))
+
+    def test_refill(self):
+        """Tokens are refilled at the specified rate."""
+        throttle = Throttle(2, 2, clock=self.clock)
+        throttle.consume('foo')
+        throttle.consume('foo')
+        self.assertFalse(throttle.allowed('foo'))
+        self.clock.time += 0.5
+        self.assertTrue(throttle.allowed('foo'))
+
+    def test_retry_after(self):
+        """retry_after returns the time until a token is available."""
+        throttle = Throttle(2, 1, clock=self.clock)
+        self.assertEqual(0, throttle.retry_after('foo'))
+        throttle.consume('foo')
+        self.assertEqual(0.5, throttle.retry_after('foo'))
+
+    def test_expire(self):
+        """Buckets are dropped once they would be full again."""
+        throttle = Throttle(1, 5, clock=self.clock)
+        throttle.consume('foo')
+        throttle.consume('bar')
+        self.assertEqual(2, len(throttle))
+        self.clock.time += 0.5
+        throttle.consume('bar')
+        self.clock.time += 2
+        self.assertTrue(throttle.allowed('baz'))
+        self.assertEqual(0, len(throttle))
+
+    def test_expire_rescheduled(self):
+        """Buckets used again are not expired."""
+        throttle = Throttle(1, 5, clock=self.clock)
+        throttle.consume('foo')
+        throttle.consume('foo')
+        self.clock.time += 1.5
+        throttle.allowed('bar')
+        self.assertEqual(1, len(throttle))
+        self.clock.time += 1
+        throttle.allowed('bar')
+        self.assertEqual(0, len(throttle))
+
+    def test_max_entries(self):
+        """The number of buckets is bounded."""
+        throttle = Throttle(1, 5, max_entries=10, clock=self.clock)
+        for index in range(20):
+            throttle.consume('key{}'.format(index))
+        self.assertEqual(10, len(throttle))
+        # the latest key is kept
+        self.assertIn('key19', throttle._buckets)
+
+    def test_invalid(self):
+        """Rate and burst must be positive."""
+        with self.assertRaises(ValueError):
+            Throttle(0, 5)
+        with self.assertRaises(ValueError):
+            Throttle(1, 0)
+
+
+class AuthThrottleTest(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.throttle = AuthThrottle(
+            username_throttle=Throttle(1, 2, clock=self.clock),
+            client_throttle=Throttle(1, 3, clock=self.clock))
+
+    def test_check_allowed(self):
+        """No error is raised if attempts are allowed."""
+        self.throttle.check('user', '1.2.3.4')
+
+    def test_check_username_throttled(self):
+        """Attempts are throttled by username."""
+        self.throttle.failed('user', '1.2.3.4')
+        self.throttle.failed('user', '5.6.7.8')
+        with self.assertRaises(Throttled) as cm:
+            self.throttle.check('user', '9.9.9.9')
+        self.assertEqual(1, cm.exception.retry_after)
+        self.assertEqual(
+            'Too many failed attempts, retry after 1s', str(cm.exception))
+        self.throttle.check('other', '1.2.3.4')
+
+    def test_check_client_throttled(self):
+        """Attempts are throttled by client."""
+        for user in ('user1', 'user2', 'user3'):
+            self.throttle.failed(user, '1.2.3.4')
+        with self.assertRaises(Throttled):
+            self.throttle.check('other', '1.2.3.4')
+        self.throttle.check('other', '5.6.7.8')
+
+    def test_no_client(self):
+        """If the client address is unknown, only the username is checked."""
+        self.throttle.failed('user', None)
+        self.throttle.failed('user', None)
+        self.assertEqual(0, len(self.throttle.client_throttle))
+        with self.assertRaises(Throttled):
+            self.throttle.check('user', None)
+
+    def test_client(self):
+        """The client is the peer address by default."""
+        request = FakeRequest('1.2.3.4', {'X-Real-IP': '5.6.7.8'})
+        self.assertEqual('1.2.3.4', self.throttle.client(request))
+
+    def test_client_header(self):
+        """The client address can be taken from a header."""
+        self.throttle.client_header = 'X-Real-IP'
+        request = FakeRequest('1.2.3.4', {'X-Real-IP': '5.6.7.8'})
+        self.assertEqual('5.6.7.8', self.throttle.client(request))
+
+    def test_client_header_list(self):
+        """For a list of addresses, the one added by the proxy is used."""
+        self.throttle.client_header = 'X-Forwarded-For'
+        request = FakeRequest(
+            '1.2.3.4', {'X-Forwarded-For': '9.9.9.9, 5.6.7.8'})
+        self.assertEqual('5.6.7.8', self.throttle.client(request))
+
+    def test_client_header_missing(self):
+        """Without the header, the client is unknown."""
+        self.throttle.client_header = 'X-Real-IP'
+        self.assertIsNone(self.throttle.client(FakeRequest('1.2.3.4', {})))
+
+
+class AuthThrottleFromConfigTest(TestCase):
+
+    def test_no_config(self):
+        """If no config is passed, None is returned."""
+        self.assertIsNone(auth_throttle_from_config(None))
+
+    def test_config(self):
+        """An AuthThrottle is returned from the config."""
+        throttle = auth_throttle_from_config(
+            {'username': {'rate': 1, 'burst': 5, 'max-entries': 100},
+             'client': {'rate': 10, 'burst': 50}})
+        self.assertEqual(1, throttle.username_throttle.rate)
+        self.assertEqual(5, throttle.username_throttle.burst)
+        self.assertEqual(100, throttle.username_throttle.max_entries)
+        self.assertEqual(10, throttle.client_throttle.rate)
+        self.assertEqual(50, throttle.client_throttle.burst)
+        self.assertEqual(100000, throttle.client_throttle.max_entries)
+        self.assertIsNone(throttle.client_header)
+
+    def test_config_client_header(self):
+        """The header with client addresses can be set."""
+        throttle = auth_throttle_from_config(
+            {'client': {'rate': 10, 'burst': 50},
+             'client-header': 'X-Real-IP'})
+        self.assertEqual('X-Real-IP', throttle.client_header)
+
+    def test_config_partial(self):
+        """Throttling can be enabled only by username or client."""
+        throttle = auth_throttle_from_config(
+            {'username': {'rate': 1, 'burst': 5}})
+        self.assertIsNone(throttle.client_throttle)
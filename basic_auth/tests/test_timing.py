@@ -0,0 +1,130 @@
+import asyncio
+
+from aiohttp import web
+
+import asynctest
+
+from ..testing import HandlerTestCase
+from .. import timing
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TimingsTest(asynctest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.timings = timing.Timings(clock=self.clock)
+
+    def test_add(self):
+        """Durations for the same phase are summed."""
+        self.timings.add('foo', 0.001)
+        self.timings.add('bar', 0.0025)
+        self.timings.add('foo', 0.002)
+        self.assertEqual(
+            {'foo': 3.0, 'bar': 2.5}, dict(self.timings.as_dict()))
+
+    def test_measure(self):
+        """Time spent in a block is measured."""
+        with self.timings.measure('foo'):
+            self.clock.now = 0.5
+        self.assertEqual({'foo': 500.0}, dict(self.timings.as_dict()))
+
+    def test_header(self):
+        """The Server-Timing header lists phases in order."""
+        self.timings.add('foo', 0.0015)
+        self.timings.add('bar', 0.01)
+        self.assertEqual('foo;dur=1.5, bar;dur=10.0', self.timings.header())
+
+    def test_stopwatch(self):
+        """Stopwatch laps are recorded as phases."""
+        stopwatch = timing.Stopwatch(self.timings)
+        self.clock.now = 1
+        stopwatch.lap('foo')
+        self.clock.now = 3
+        stopwatch.lap()
+        self.clock.now = 6
+        stopwatch.lap('bar')
+        self.assertEqual(
+            {'foo': 1000, 'bar': 3000}, dict(self.timings.as_dict()))
+
+    def test_stopwatch_no_timings(self):
+        """Without timings, laps are ignored."""
+        timing.Stopwatch(None).lap('foo')
+
+
+class TaskTimingsTest(asynctest.TestCase):
+
+    async def test_timed(self):
+        """Phases are recorded for the current task."""
+        timings = timing.start(loop=self.loop)
+        self.addCleanup(timing.finish, loop=self.loop)
+        with timing.timed('foo', loop=self.loop):
+            pass
+        self.assertIn('foo', timings.as_dict())
+        self.assertIs(timings, timing.current(loop=self.loop))
+
+    async def test_timed_not_started(self):
+        """If the task is not timed, nothing is recorded."""
+        with timing.timed('foo', loop=self.loop):
+            pass
+        self.assertIsNone(timing.current(loop=self.loop))
+
+    async def test_finish(self):
+        """Once finished, the task is not timed anymore."""
+        timing.start(loop=self.loop)
+        timing.finish(loop=self.loop)
+        self.assertIsNone(timing.current(loop=self.loop))
+
+    async def test_share(self):
+        """Phases of a shared task are recorded for the current one."""
+        timings = timing.start(loop=self.loop)
+        self.addCleanup(timing.finish, loop=self.loop)
+
+        async def func():
+            with timing.timed('foo', loop=self.loop):
+                await asyncio.sleep(0, loop=self.loop)
+
+        task = asyncio.ensure_future(func(), loop=self.loop)
+        timing.share(task, loop=self.loop)
+        await task
+        self.assertIn('foo', timings.as_dict())
+
+
+class ServerTimingMiddlewareTest(HandlerTestCase):
+
+    async def test_header(self):
+        """The Server-Timing header is set on responses."""
+
+        async def handler(request):
+            with timing.timed('foo', loop=self.loop):
+                pass
+            self.assertIn(timing.REQUEST_TIMINGS, request)
+            return web.HTTPOk()
+
+        middleware_handler = await timing.server_timing_middleware(
+            self.app, handler)
+        response = await middleware_handler(self.get_request())
+        header = response.headers['Server-Timing']
+        self.assertRegex(header, r'^foo;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertIsNone(timing.current(loop=self.loop))
+
+    async def test_header_error(self):
+        """The Server-Timing header is set on raised HTTP errors."""
+
+        async def handler(request):
+            raise web.HTTPNotFound()
+
+        middleware_handler = await timing.server_timing_middleware(
+            self.app, handler)
+        with self.assertRaises(web.HTTPNotFound) as cm:
+            await middleware_handler(self.get_request())
+        self.assertIn('total;dur=', cm.exception.headers['Server-Timing'])
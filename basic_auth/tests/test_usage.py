@@ -0,0 +1,107 @@
+from datetime import datetime
+
+import asynctest
+
+from ..db import Model
+from ..db.schema import CREDENTIALS
+from ..db.testing import DataBaseTest
+from ..usage import UsageRecorder
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = datetime(2018, 1, 1)
+
+    def __call__(self):
+        return self.now
+
+
+class UnreachableEngine:
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        raise OSError('Connection refused')
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class UsageRecorderTest(asynctest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.recorder = UsageRecorder(
+            UnreachableEngine(), max_pending=2, clock=self.clock)
+
+    def test_record(self):
+        """Uses are aggregated by username."""
+        self.recorder.record('foo')
+        self.clock.now = datetime(2018, 1, 2)
+        self.recorder.record('foo')
+        self.recorder.record('bar')
+        self.assertEqual(
+            {'foo': [datetime(2018, 1, 2), 2],
+             'bar': [datetime(2018, 1, 2), 1]},
+            self.recorder._pending)
+
+    def test_record_max_pending(self):
+        """Once too many usernames are pending, new ones are dropped."""
+        self.recorder.record('foo')
+        self.recorder.record('bar')
+        self.recorder.record('baz')
+        self.recorder.record('foo')
+        self.assertEqual(2, len(self.recorder))
+        self.assertNotIn('baz', self.recorder._pending)
+        self.assertEqual(2, self.recorder._pending['foo'][1])
+
+    async def test_flush_failed(self):
+        """If writing fails, usage is kept for the next flush."""
+        self.recorder.record('foo')
+        with self.assertRaises(OSError):
+            await self.recorder.flush()
+        self.recorder.record('foo')
+        self.assertEqual(
+            {'foo': [datetime(2018, 1, 1), 2]}, self.recorder._pending)
+
+
+class UsageRecorderFlushTest(DataBaseTest):
+
+    async def setUp(self):
+        await super().setUp()
+        model = Model(self.conn)
+        await model.add_credentials('user1', 'username1', 'pass')
+        await model.add_credentials('user2', 'username2', 'pass')
+        await self.txn.commit()
+        self.clock = FakeClock()
+        self.recorder = UsageRecorder(
+            self.engine, batch_size=1, clock=self.clock)
+
+    async def get_usage(self):
+        result = await self.conn.execute(
+            CREDENTIALS.select().order_by(CREDENTIALS.c.user))
+        return [
+            (row['user'], row['last_used'], row['use_count'])
+            for row in await result.fetchall()]
+
+    async def test_flush(self):
+        """Pending usage is written to the database, in batches."""
+        self.recorder.record('username1')
+        self.recorder.record('username1')
+        self.recorder.record('username2')
+        await self.recorder.flush()
+        self.assertEqual(0, len(self.recorder))
+        self.assertEqual(
+            [('user1', datetime(2018, 1, 1), 2),
+             ('user2', datetime(2018, 1, 1), 1)],
+            await self.get_usage())
+
+    async def test_flush_nothing_pending(self):
+        """If there is no pending usage, nothing is written."""
+        await self.recorder.flush()
+        self.assertEqual(
+            [('user1', None, 0), ('user2', None, 0)],
+            await self.get_usage())
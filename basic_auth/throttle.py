@@ -0,0 +1,211 @@
+"""Throttling of failed authentication attempts."""
+
+import math
+import time
+
+
+class _Bucket:
+    """A token bucket for a key."""
+
+    __slots__ = ('tokens', 'updated', 'expire_tick')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+        self.expire_tick = None
+
+
+class Throttle:
+    """Token-bucket rate limiting for arbitrary keys.
+
+    Each key gets a bucket holding up to `burst` tokens, refilled at `rate`
+    tokens per second. Buckets that have been idle long enough to be full
+    again are equivalent to missing ones, so they're dropped through a timing
+    wheel. The number of tracked keys is bounded by `max_entries`: when the
+    table is full, buckets closest to expiration are evicted first.
+
+    """
+
+    def __init__(self, rate, burst, max_entries=100000, wheel_slots=60,
+                 clock=time.monotonic):
+        if rate <= 0 or burst < 1:
+            raise ValueError('Rate and burst must be positive numbers')
+        self.rate = rate
+        self.burst = burst
+        self.max_entries = max_entries
+        self._clock = clock
+        self._buckets = {}
+        # A full refill takes burst / rate seconds, split across slots.
+        self._tick_duration = burst / rate / wheel_slots
+        self._wheel = [set() for _ in range(wheel_slots + 1)]
+        self._tick = self._current_tick()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allowed(self, key):
+        """Return whether there are tokens left for the key."""
+        self._expire()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return True
+        return self._refill(bucket) >= 1
+
+    def retry_after(self, key):
+        """Return seconds until a token is available for the key."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0
+        return max(0, (1 - self._refill(bucket)) / self.rate)
+
+    def consume(self, key):
+        """Consume a token for the key."""
+        self._expire()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_entries:
+                self._evict()
+            bucket = _Bucket(self.burst, self._clock())
+            self._buckets[key] = bucket
+        bucket.tokens = max(0, self._refill(bucket) - 1)
+        self._schedule(key, bucket)
+
+    def _refill(self, bucket):
+        now = self._clock()
+        bucket.tokens = min(
+            self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        return bucket.tokens
+
+    def _schedule(self, key, bucket):
+        """Schedule expiration of the bucket for when it's full again."""
+        full_in = (self.burst - bucket.tokens) / self.rate
+        tick = self._tick + math.ceil(full_in / self._tick_duration) + 1
+        bucket.expire_tick = tick
+        self._wheel[tick % len(self._wheel)].add(key)
+
+    def _current_tick(self):
+        return int(self._clock() / self._tick_duration)
+
+    def _expire(self):
+        """Drop buckets scheduled to expire up to the current tick."""
+        current = self._current_tick()
+        # Past a full revolution all slots are expired.
+        start = max(self._tick + 1, current - len(self._wheel) + 1)
+        for tick in range(start, current + 1):
+            self._expire_slot(tick)
+        self._tick = current
+
+    def _expire_slot(self, tick):
+        """Drop buckets in the wheel slot for tick."""
+        index = tick % len(self._wheel)
+        keep = set()
+        for key in self._wheel[index]:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            if bucket.expire_tick <= tick:
+                del self._buckets[key]
+            elif bucket.expire_tick % len(self._wheel) == index:
+                # Rescheduled for a later revolution of the wheel.
+                keep.add(key)
+        self._wheel[index] = keep
+
+    def _evict(self):
+        """Evict a bucket among the ones closest to expiration."""
+        for offset in range(1, len(self._wheel) + 1):
+            index = (self._tick + offset) % len(self._wheel)
+            slot = self._wheel[index]
+            for key in list(slot):
+                slot.discard(key)
+                bucket = self._buckets.get(key)
+                if (bucket is not None and
+                        bucket.expire_tick % len(self._wheel) == index):
+                    del self._buckets[key]
+                    return
+
+
+class Throttled(Exception):
+    """Authentication attempts are being throttled."""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            'Too many failed attempts, retry after {:.0f}s'.format(
+                math.ceil(retry_after)))
+        self.retry_after = retry_after
+
+
+class AuthThrottle:
+    """Throttle failed authentication attempts by username and client.
+
+    Each failed attempt consumes a token from both the username and the
+    client address buckets. Once either bucket is empty, further attempts
+    for that username or from that client are refused until tokens are
+    refilled, without checking credentials.
+
+    Behind a proxy, all requests come from the proxy address. If
+    client_header is set, the client address is taken from that header,
+    which must be set by the proxy.
+
+    """
+
+    def __init__(self, username_throttle=None, client_throttle=None,
+                 client_header=None):
+        self.username_throttle = username_throttle
+        self.client_throttle = client_throttle
+        self.client_header = client_header
+
+    def client(self, request):
+        """Return the client address for a request, None if unknown.
+
+        With client_header, if the header has a list of addresses (as
+        X-Forwarded-For), the last one, added by the proxy, is used.
+
+        """
+        if self.client_header is None:
+            return request.remote
+        value = request.headers.get(self.client_header, '')
+        return value.split(',')[-1].strip() or None
+
+    def check(self, username, client):
+        """Raise Throttled if attempts for username or client are refused."""
+        for throttle, key in self._throttles(username, client):
+            if not throttle.allowed(key):
+                raise Throttled(throttle.retry_after(key))
+
+    def failed(self, username, client):
+        """Record a failed authentication attempt."""
+        for throttle, key in self._throttles(username, client):
+            throttle.consume(key)
+
+    def _throttles(self, username, client):
+        throttles = (
+            (self.username_throttle, username),
+            (self.client_throttle, client))
+        return [
+            (throttle, key) for throttle, key in throttles
+            if throttle is not None and key is not None]
+
+
+def auth_throttle_from_config(config):
+    """Return an AuthThrottle from a config dict, None if not configured.
+
+    The dict can have "username" and "client" keys, each with "rate" and
+    "burst" values and an optional "max-entries", and a "client-header"
+    key with the name of the header with client addresses.
+
+    """
+    if not config:
+        return None
+
+    def make_throttle(conf):
+        if not conf:
+            return None
+        return Throttle(
+            conf['rate'], conf['burst'],
+            max_entries=conf.get('max-entries', 100000))
+
+    return AuthThrottle(
+        username_throttle=make_throttle(config.get('username')),
+        client_throttle=make_throttle(config.get('client')),
+        client_header=config.get('client-header'))
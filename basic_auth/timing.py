@@ -0,0 +1,160 @@
+"""Per-request timing of processing phases.
+
+When enabled, each request gets a Timings instance tracking time spent in
+instrumented phases (such as acquiring a database connection, running
+queries or hashing passwords), reported in the Server-Timing response header
+and in the access log.
+
+Timings are tracked by asyncio task, so that instrumented code doesn't need
+access to the request. Instrumentation is a no-op when no request is being
+timed.
+
+"""
+
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
+import time
+import weakref
+
+from aiohttp import web
+
+
+# Request key for the Timings of a request.
+REQUEST_TIMINGS = 'timings'
+
+# Timings by task.
+_TASK_TIMINGS = weakref.WeakKeyDictionary()
+
+# asyncio.current_task() replaces Task.current_task() from Python 3.7.
+_current_task = getattr(
+    asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+class Timings:
+    """Total time spent in named phases, in order of first occurrence."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._durations = OrderedDict()
+
+    def add(self, name, duration):
+        """Add time spent in a phase."""
+        self._durations[name] = self._durations.get(name, 0) + duration
+
+    @contextmanager
+    def measure(self, name):
+        """Context manager measuring time spent in a phase."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, self.clock() - start)
+
+    def as_dict(self):
+        """Return a dict with durations of phases in milliseconds."""
+        return OrderedDict(
+            (name, round(duration * 1000, 3))
+            for name, duration in self._durations.items())
+
+    def header(self):
+        """Return the value for the Server-Timing header."""
+        return ', '.join(
+            '{};dur={}'.format(name, duration)
+            for name, duration in self.as_dict().items())
+
+
+class Stopwatch:
+    """Record time between successive points in the code as phases."""
+
+    def __init__(self, timings):
+        self.timings = timings
+        if timings is not None:
+            self._last = timings.clock()
+
+    def lap(self, name=None):
+        """Record time since the last lap as a phase, unless name is None."""
+        if self.timings is None:
+            return
+        now = self.timings.clock()
+        if name is not None:
+            self.timings.add(name, now - self._last)
+        self._last = now
+
+
+def start(loop=None, clock=time.perf_counter):
+    """Start timing phases for the current task, return the Timings."""
+    timings = Timings(clock=clock)
+    task = _get_task(loop)
+    if task is not None:
+        _TASK_TIMINGS[task] = timings
+    return timings
+
+
+def finish(loop=None):
+    """Stop timing phases for the current task."""
+    task = _get_task(loop)
+    if task is not None:
+        _TASK_TIMINGS.pop(task, None)
+
+
+def current(loop=None):
+    """Return Timings for the current task, None if it's not timed."""
+    if not _TASK_TIMINGS:
+        # Avoid looking up the task when no request is timed.
+        return None
+    task = _get_task(loop)
+    if task is None:
+        return None
+    return _TASK_TIMINGS.get(task)
+
+
+def share(task, loop=None):
+    """Record phases of a task in the Timings for the current task."""
+    timings = current(loop=loop)
+    if timings is not None:
+        _TASK_TIMINGS[task] = timings
+
+
+@contextmanager
+def timed(name, loop=None):
+    """Context manager measuring a phase for the current task, if timed."""
+    timings = current(loop=loop)
+    if timings is None:
+        yield
+    else:
+        with timings.measure(name):
+            yield
+
+
+def stopwatch(loop=None):
+    """Return a Stopwatch for the current task."""
+    return Stopwatch(current(loop=loop))
+
+
+async def server_timing_middleware(app, handler):
+    """Middleware timing requests, setting the Server-Timing header."""
+
+    async def middleware_handler(request):
+        timings = start(loop=app.loop)
+        request[REQUEST_TIMINGS] = timings
+        try:
+            with timings.measure('total'):
+                response = await handler(request)
+        except web.HTTPException as error:
+            error.headers['Server-Timing'] = timings.header()
+            raise
+        finally:
+            finish(loop=app.loop)
+        response.headers['Server-Timing'] = timings.header()
+        return response
+
+    return middleware_handler
+
+
+def _get_task(loop):
+    try:
+        return _current_task(loop=loop)
+    except RuntimeError:
+        # No running loop.
+        return None
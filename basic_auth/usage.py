@@ -0,0 +1,79 @@
+"""Write-behind recording of credentials usage."""
+
+from datetime import datetime
+import logging
+
+from .db import Model
+
+
+class UsageRecorder:
+    """Aggregate credentials usage in memory, flushing it in batches.
+
+    Each use of credentials only updates an in-memory entry for the username,
+    with the last use time and the number of uses. Entries are written to the
+    database by flush(), up to batch_size usernames per query. If writing
+    fails, entries are kept for the next flush.
+
+    At most max_pending usernames are tracked between flushes: uses of other
+    usernames are dropped until the next flush.
+
+    """
+
+    def __init__(self, engine, batch_size=1000, max_pending=100000,
+                 clock=datetime.utcnow):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._clock = clock
+        self._pending = {}
+        self._dropped = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, username):
+        """Record a use of credentials for a username."""
+        entry = self._pending.get(username)
+        if entry is None:
+            if len(self._pending) >= self.max_pending:
+                self._dropped += 1
+                return
+            self._pending[username] = [self._clock(), 1]
+        else:
+            entry[0] = self._clock()
+            entry[1] += 1
+
+    async def flush(self):
+        """Write pending usage to the database."""
+        pending, self._pending = self._pending, {}
+        if self._dropped:
+            logging.getLogger().warning(
+                'credentials usage dropped for {} uses'.format(
+                    self._dropped))
+            self._dropped = 0
+        # Rows are sorted so that concurrent flushes lock them in the same
+        # order.
+        usernames = sorted(pending)
+        for index in range(0, len(usernames), self.batch_size):
+            batch = usernames[index:index + self.batch_size]
+            usage = [
+                {'username': username, 'last_used': pending[username][0],
+                 'use_count': pending[username][1]}
+                for username in batch]
+            try:
+                async with self.engine.acquire() as conn:
+                    await Model(conn).record_credentials_usage(usage)
+            except Exception:
+                self._restore(usernames[index:], pending)
+                raise
+
+    def _restore(self, usernames, pending):
+        """Merge entries that couldn't be written back into pending ones."""
+        for username in usernames:
+            last_used, count = pending[username]
+            entry = self._pending.get(username)
+            if entry is None:
+                self._pending[username] = [last_used, count]
+            else:
+                entry[0] = max(entry[0], last_used)
+                entry[1] += count
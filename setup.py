@@ -11,7 +11,7 @@ from basic_auth import (
 
 install_requires = [
     'aiohttp==2.3.10',
-    'alembic',
+    'alembic>=1.2',
     'aiopg',
     'colander',
     'prettytable',
@@ -37,11 +37,15 @@ config = {
     'package_data': {'basic_auth': ['alembic/*', 'alembic/versions/*']},
     'entry_points': {'console_scripts': [
         'basic-auth = basic_auth.script.server:main',
-        'manage-credentials = basic_auth.script.manage_credentials:main']},
+        'manage-credentials = basic_auth.script.manage_credentials:main',
+        'seed-credentials = basic_auth.script.seed_credentials:main']},
     'test_suite': 'basic_auth',
     'install_requires': install_requires,
     'tests_require': tests_require,
-    'extras_require': {'testing': tests_require}
+    'extras_require': {
+        # asyncpg requires Python 3.6 or later.
+        'asyncpg': ['asyncpg>=0.25'],
+        'testing': tests_require}
 }
 
 setup(**config)